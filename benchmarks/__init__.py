@@ -0,0 +1,5 @@
+"""
+This module contains the performance benchmarks.
+
+They are plain scripts, run with `python -m benchmarks.<name>`, and are not collected by pytest.
+"""
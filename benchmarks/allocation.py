@@ -0,0 +1,250 @@
+"""
+Scaling of the domain allocation algorithm.
+
+Builds synthetic batches and order lines at sizes from 10 to 10^6, and measures the mean time of a call, over as many
+calls as fit in a time budget, and the peak memory of a single call of:
+
+* allocate: service_layer.allocation_service.allocate among N batches of a SKU, the line only fitting in the last
+  one. The batches are shuffled once, so later calls only check their order; sorting shuffled ones is measured by
+  sort.
+* can_allocate and available_quantity: Batch.can_allocate and Batch.available_quantity on a batch holding N lines.
+* sort: sorting N shuffled batches by ETA.
+* validate_sku_scan, validate_sku_set and validate_sku_bloom: checking an unknown SKU against N SKUs, by scanning the
+  batches as allocations used to, and with the SKU catalog as a set or as a Bloom filter.
+
+Results are written as JSON together with the commit they were measured on, so runs can be compared across commits.
+
+Usage:
+    python -m benchmarks.allocation [--max-size N] [--only NAME] [--budget SECONDS] [--output FILE] [--baseline FILE]
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+from allocation.domain.models import Batch, OrderLine
+from allocation.service_layer.allocation_service import allocate
+from allocation.service_layer.sku_catalog import SkuCatalog
+
+SIZES = tuple(10**exponent for exponent in range(1, 7))
+
+# Builds the fixture of a size, and returns the operation measured on it.
+Setup = Callable[[int], Callable[[], object]]
+
+
+def shuffled_batches(size: int) -> list[Batch]:
+    """
+    Builds batches of a single SKU, a tenth of them warehouse stock, all of them full but the latest shipment.
+    """
+    batches = [
+        Batch(f"batch-{i}", "GENERIC-SOFA", 1, None if i % 10 == 0 else datetime.date.min + datetime.timedelta(i))
+        for i in range(size - 1)
+    ]
+    batches.append(Batch("last-batch", "GENERIC-SOFA", 10**9, datetime.date.min + datetime.timedelta(size)))
+
+    for batch in batches[:-1]:
+        batch.allocate(OrderLine(f"filler-{batch.reference}", "GENERIC-SOFA", 1))
+
+    random.Random(size).shuffle(batches)
+    return batches
+
+
+def setup_allocate(size: int) -> Callable[[], object]:
+    batches = shuffled_batches(size)
+    lines = (OrderLine(f"order-{i}", "GENERIC-SOFA", 1) for i in range(10**9))
+    return lambda: allocate(next(lines), batches)
+
+
+def setup_sort(size: int) -> Callable[[], object]:
+    batches = shuffled_batches(size)
+    return lambda: sorted(batches)
+
+
+def batch_with_lines(size: int) -> Batch:
+    """
+    Builds a batch holding as many allocated lines as the size.
+    """
+    batch = Batch("batch", "GENERIC-SOFA", 2 * size)
+
+    for i in range(size):
+        batch.allocate(OrderLine(f"order-{i}", "GENERIC-SOFA", 1))
+
+    return batch
+
+
+def setup_can_allocate(size: int) -> Callable[[], object]:
+    batch, line = batch_with_lines(size), OrderLine("new-order", "GENERIC-SOFA", 1)
+    return lambda: batch.can_allocate(line)
+
+
+def setup_available_quantity(size: int) -> Callable[[], object]:
+    batch = batch_with_lines(size)
+    return lambda: batch.available_quantity
+
+
+class _SkuSource:
+    """
+    Stands in for a unit of work whose batches have as many SKUs as the size.
+    """
+
+    def __init__(self, size: int):
+        self.batches = self
+        self.skus = [f"SKU-{i}" for i in range(size)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def find_distinct(self, attribute: str) -> list:
+        return self.skus
+
+
+def setup_validate_sku_scan(size: int) -> Callable[[], object]:
+    batches = [Batch(f"batch-{i}", f"SKU-{i}", 1) for i in range(size)]
+    return lambda: any(batch.sku == "UNKNOWN-SKU" for batch in batches)
+
+
+def catalog_lookup(size: int, bloom: bool) -> Callable[[], object]:
+    source = _SkuSource(size)
+    catalog = SkuCatalog(lambda: source, bloom=bloom)
+    catalog.refresh()
+    return lambda: catalog.might_contain("UNKNOWN-SKU")
+
+
+BENCHMARKS: dict[str, Setup] = {
+    "allocate": setup_allocate,
+    "can_allocate": setup_can_allocate,
+    "available_quantity": setup_available_quantity,
+    "sort": setup_sort,
+    "validate_sku_scan": setup_validate_sku_scan,
+    "validate_sku_set": lambda size: catalog_lookup(size, bloom=False),
+    "validate_sku_bloom": lambda size: catalog_lookup(size, bloom=True),
+}
+
+
+def time_calls(operation: Callable[[], object], budget: float) -> tuple[int, float]:
+    """
+    Times the operation, doubling the number of calls until they take the budget, like timeit's autorange.
+
+    Returns:
+        tuple[int, float]: The number of calls timed and the mean seconds per call.
+    """
+    calls = 1
+
+    while True:
+        start = time.perf_counter()
+
+        for _ in range(calls):
+            operation()
+
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= budget:
+            return calls, elapsed / calls
+
+        calls *= 2
+
+
+def measure(setup: Setup, size: int, budget: float) -> dict:
+    """
+    Builds the fixture of a size, then times the operation and traces the peak memory of a single call.
+
+    Returns:
+        dict: The size, the number of calls timed, the mean seconds per call, the peak bytes allocated by a call and
+            the bytes held by the fixture.
+    """
+    tracemalloc.start()
+    operation = setup(size)
+    fixture_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    calls, seconds = time_calls(operation, budget)
+
+    return {
+        "size": size,
+        "calls": calls,
+        "seconds": seconds,
+        "peak_bytes": peak - baseline,
+        "fixture_bytes": fixture_bytes,
+    }
+
+
+def commit() -> str:
+    """
+    Returns the commit being measured, "unknown" outside a git checkout.
+    """
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return result.stdout.strip()
+
+
+def compare(results: list[dict], baseline: dict):
+    """
+    Prints the ratio of every result to the same measurement of a baseline run.
+    """
+    before = {(result["benchmark"], result["size"]): result["seconds"] for result in baseline["results"]}
+    print(f"\ncompared with {baseline['commit']}:")
+
+    for result in results:
+        previous = before.get((result["benchmark"], result["size"]))
+
+        if previous:
+            print(f"{result['benchmark']:>20} {result['size']:>8}: {result['seconds'] / previous:6.2f}x")
+
+
+def main():
+    """
+    Runs the benchmarks, prints and writes the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-size", type=int, default=SIZES[-1], help="largest number of batches, lines or SKUs")
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), action="append", help="benchmarks to run, all by default")
+    parser.add_argument("--budget", type=float, default=0.2, help="seconds spent timing each measurement at least")
+    parser.add_argument("--output", type=Path, help="JSON file to write the results to")
+    parser.add_argument("--baseline", type=Path, help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+
+    results = []
+
+    for name in args.only or BENCHMARKS:
+        for size in (size for size in SIZES if size <= args.max_size):
+            result = {"benchmark": name} | measure(BENCHMARKS[name], size, args.budget)
+            results.append(result)
+            print(
+                f"{name:>20} {size:>8}: {result['seconds'] * 1e6:14.2f} us/call "
+                f"{result['peak_bytes']:>12} B peak {result['fixture_bytes']:>12} B fixture"
+            )
+
+    run = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "results": results,
+    }
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(run, indent=2))
+
+    if args.baseline is not None:
+        compare(results, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Load test of the HTTP API, from the entrypoints down to the ORM.
+
+Drives the ASGI application of allocation.main in process through httpx's ASGI transport, against a SQLite database
+in a temporary file. A number of concurrent clients send a weighted mix of requests:
+
+* add_batch: adds a batch of a known SKU.
+* allocate: allocates a new order line of a known SKU.
+* invalid_sku: allocates an order line of an unknown SKU, rejected with 400.
+* out_of_stock: allocates an order line larger than the only batch of its SKU, rejected with 400.
+
+Throughput and the p50, p95 and p99 latencies are reported for every kind of request, together with the requests
+which did not get the expected status. The application is configured as usual by the FASTAPI_ environment variables,
+e.g. FASTAPI_ASYNC_ENDPOINTS=true or FASTAPI_ALLOCATION_WORKERS=4, except for its database.
+
+Usage:
+    python -m benchmarks.load [--requests N] [--concurrency N] [--mix KIND=WEIGHT,...] [--output FILE]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+
+DEFAULT_MIX = "add_batch=1,allocate=8,invalid_sku=1,out_of_stock=1"
+
+SCARCE_SKU = "SCARCE-SKU"
+
+
+@dataclass
+class Endpoint:
+    """
+    The latencies of one kind of request, and how many got an unexpected status.
+    """
+
+    latencies: list[float] = field(default_factory=list)
+    failures: int = 0
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    """
+    Parses the weights of the kinds of requests, e.g. "allocate=8,invalid_sku=1".
+    """
+    weights = {kind: int(weight) for kind, weight in (item.split("=") for item in mix.split(","))}
+    unknown = set(weights) - set(REQUESTS)
+
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown requests: {', '.join(sorted(unknown))}")
+
+    return weights
+
+
+def percentile(latencies: list[float], rank: float) -> float:
+    """
+    Returns the nearest-rank percentile of some latencies.
+    """
+    ordered = sorted(latencies)
+    return ordered[max(0, math.ceil(rank / 100 * len(ordered)) - 1)]
+
+
+class LoadTest:
+    """
+    Sends requests to the application, and records their latency.
+
+    Args:
+        client: An httpx client of the application.
+        skus: The number of SKUs allocated.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, skus: int):
+        self.client = client
+        self.skus = [f"LOAD-SKU-{i}" for i in range(skus)]
+        self.endpoints: dict[str, Endpoint] = {kind: Endpoint() for kind in REQUESTS}
+        self._ids = iter(range(10**12))
+
+    async def seed(self):
+        """
+        Adds a large batch of every SKU, and a single item of the scarce one.
+        """
+        for sku in self.skus:
+            await self.add_batch(sku, 10**9)
+
+        await self.add_batch(SCARCE_SKU, 1)
+
+    async def add_batch(self, sku: str, qty: int) -> httpx.Response:
+        return await self.client.post(
+            "/api/v1/batches", json={"ref": f"load-batch-{next(self._ids)}", "sku": sku, "qty": qty, "eta": None}
+        )
+
+    async def allocate(self, sku: str, qty: int) -> httpx.Response:
+        return await self.client.post(
+            "/api/v1/allocations", json={"orderId": f"load-order-{next(self._ids)}", "sku": sku, "qty": qty}
+        )
+
+    async def send(self, kind: str, rng: random.Random):
+        """
+        Sends a request of some kind, recording its latency, and whether it got the expected status.
+        """
+        status, send = REQUESTS[kind]
+        start = time.perf_counter()
+        response = await send(self, rng)
+        self.endpoints[kind].latencies.append(time.perf_counter() - start)
+
+        if response.status_code != status:
+            self.endpoints[kind].failures += 1
+
+    async def run(self, kinds: list[str], concurrency: int, seed: int) -> float:
+        """
+        Sends the requests with concurrent clients.
+
+        Returns:
+            float: The seconds it took.
+        """
+        pending = iter(kinds)
+
+        async def client(rng: random.Random):
+            for kind in pending:
+                await self.send(kind, rng)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(random.Random(seed + i)) for i in range(concurrency)))
+        return time.perf_counter() - start
+
+    def report(self, seconds: float) -> dict:
+        """
+        Summarizes the throughput and latencies of every kind of request, and of all of them.
+        """
+        endpoints = {kind: endpoint for kind, endpoint in self.endpoints.items() if endpoint.latencies}
+        overall = Endpoint(
+            [latency for endpoint in endpoints.values() for latency in endpoint.latencies],
+            sum(endpoint.failures for endpoint in endpoints.values()),
+        )
+
+        return {
+            kind: {
+                "requests": len(endpoint.latencies),
+                "failures": endpoint.failures,
+                "throughput": len(endpoint.latencies) / seconds,
+                "p50": percentile(endpoint.latencies, 50),
+                "p95": percentile(endpoint.latencies, 95),
+                "p99": percentile(endpoint.latencies, 99),
+            }
+            for kind, endpoint in (endpoints | {"all": overall}).items()
+        }
+
+
+REQUESTS = {
+    "add_batch": (201, lambda test, rng: test.add_batch(rng.choice(test.skus), 1000)),
+    "allocate": (201, lambda test, rng: test.allocate(rng.choice(test.skus), 1)),
+    "invalid_sku": (400, lambda test, rng: test.allocate(f"UNKNOWN-SKU-{rng.random()}", 1)),
+    "out_of_stock": (400, lambda test, rng: test.allocate(SCARCE_SKU, 2)),
+}
+
+
+async def load_test(args: argparse.Namespace) -> dict:
+    """
+    Starts the application, seeds it, sends the requests and stops it.
+    """
+    # Imported once the database is configured, as the settings are read on import.
+    from allocation.main import app  # pylint: disable=import-outside-toplevel
+
+    logging.getLogger("allocation_service").setLevel(args.log_level)
+    rng = random.Random(args.seed)
+    kinds = rng.choices(list(args.mix), weights=list(args.mix.values()), k=args.requests)
+
+    await app.router.startup()
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+            test = LoadTest(client, args.skus)
+            await test.seed()
+            seconds = await test.run(kinds, args.concurrency, args.seed)
+    finally:
+        await app.router.shutdown()
+
+    return {"seconds": seconds, "concurrency": args.concurrency, "endpoints": test.report(seconds)}
+
+
+def main():
+    """
+    Runs the load test against a temporary database, prints and writes the report.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="number of requests sent")
+    parser.add_argument("--concurrency", type=int, default=16, help="number of concurrent clients")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help=f"request weights, {DEFAULT_MIX} by default")
+    parser.add_argument("--skus", type=int, default=100, help="number of SKUs allocated")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the request mix")
+    parser.add_argument("--log-level", default="CRITICAL", help="level of the request logs, silenced by default")
+    parser.add_argument("--output", type=Path, help="JSON file to write the report to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = Path(directory) / "load.db"
+        os.environ["FASTAPI_DATABASE_URL"] = f"sqlite:///{database}"
+        os.environ["FASTAPI_ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{database}"
+        report = asyncio.run(load_test(args))
+
+    print(f"{report['seconds']:.2f} s with {report['concurrency']} clients")
+
+    for kind, endpoint in report["endpoints"].items():
+        print(
+            f"{kind:>14}: {endpoint['requests']:>7} requests {endpoint['failures']:>5} failures "
+            f"{endpoint['throughput']:9.1f} req/s   p50 {endpoint['p50'] * 1e3:7.2f} ms   "
+            f"p95 {endpoint['p95'] * 1e3:7.2f} ms   p99 {endpoint['p99'] * 1e3:7.2f} ms"
+        )
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Per-request overhead of configuring the ORM mappers.
+
+Compares starting and clearing the classical mappers around every request, as the session dependencies used to do,
+with configuring them once per process. Each simulated request opens a session, loads the batches of a SKU and
+closes the session.
+
+Usage:
+    python -m benchmarks.mappers [--requests N]
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import clear_mappers, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from allocation.adapters.orm import ensure_mappers, metadata, start_mappers
+from allocation.domain.models import Batch
+
+
+def handle_request(session_factory):
+    """
+    Simulates the database work of an allocation request.
+    """
+    session = session_factory()
+    try:
+        session.query(Batch).filter_by(sku="GENERIC-SOFA").all()
+    finally:
+        session.close()
+
+
+def per_request_mappers(session_factory, requests: int) -> float:
+    """
+    Times requests which start and clear the mappers themselves.
+
+    Returns:
+        float: The mean time per request, in seconds.
+    """
+    start = time.perf_counter()
+    for _ in range(requests):
+        start_mappers()
+        handle_request(session_factory)
+        clear_mappers()
+    return (time.perf_counter() - start) / requests
+
+
+def per_process_mappers(session_factory, requests: int) -> float:
+    """
+    Times requests sharing mappers configured once.
+
+    Returns:
+        float: The mean time per request, in seconds.
+    """
+    ensure_mappers()
+    start = time.perf_counter()
+    for _ in range(requests):
+        handle_request(session_factory)
+    elapsed = time.perf_counter() - start
+    clear_mappers()
+    return elapsed / requests
+
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="number of simulated requests")
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+
+    before = per_request_mappers(session_factory, args.requests)
+    after = per_process_mappers(session_factory, args.requests)
+
+    print(f"mappers per request: {before * 1e6:10.1f} us/request")
+    print(f"mappers per process: {after * 1e6:10.1f} us/request")
+    print(f"speedup:             {before / after:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Cost of planning allocations with the vectorized planner, compared with allocating line by line.
+
+Builds N order lines and batches of 1000 SKUs, 20 batches per SKU, with a tenth of the lines of a single SKU, and
+measures the mean time of:
+
+* plan: service_layer.planner.plan_allocations over every line.
+* line_by_line: service_layer.allocation_service.allocate for every line in order, on fresh copies of the batches, up to
+  --max-line-by-line lines as it is much slower.
+
+Needs numpy, see the planner extra.
+
+Usage:
+    python -m benchmarks.planner [--max-size N] [--max-line-by-line N] [--budget SECONDS] [--output FILE]
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+from pathlib import Path
+from typing import Callable
+
+from allocation.domain.models import Batch, OrderLine
+from allocation.service_layer.allocation_service import allocate
+from allocation.service_layer.planner import plan_allocations
+from benchmarks.allocation import commit, time_calls
+
+SIZES = tuple(10**exponent for exponent in range(2, 7))
+
+SKUS = [f"SKU-{i}" for i in range(1000)]
+
+
+def scenario(size: int) -> tuple[list[OrderLine], list[Batch]]:
+    """
+    Builds order lines of 1 to 20 units, and batches holding about as many units as the lines ask for.
+    """
+    rng = random.Random(size)
+    hot_sku = SKUS[0]
+    lines = [
+        OrderLine(f"order-{i}", hot_sku if i % 10 == 0 else rng.choice(SKUS), rng.randint(1, 20)) for i in range(size)
+    ]
+    per_batch = max(size * 10 // (len(SKUS) * 20), 1)
+    batches = [
+        Batch(
+            f"batch-{i}",
+            SKUS[i % len(SKUS)],
+            rng.randint(1, 2 * per_batch),
+            None if i % 10 == 0 else datetime.date.min + datetime.timedelta(rng.randint(0, 365)),
+        )
+        for i in range(len(SKUS) * 20)
+    ]
+    return lines, batches
+
+
+def setup_plan(lines: list[OrderLine], batches: list[Batch]) -> Callable[[], object]:
+    skus, quantities = [line.sku for line in lines], [line.qty for line in lines]
+    return lambda: plan_allocations(skus, quantities, batches)
+
+
+def setup_line_by_line(lines: list[OrderLine], batches: list[Batch]) -> Callable[[], object]:
+    def allocate_all():
+        batches_by_sku: dict[str, list[Batch]] = {}
+
+        for batch in batches:
+            fresh = Batch(batch.reference, batch.sku, batch.available_quantity, batch.eta)
+            batches_by_sku.setdefault(batch.sku, []).append(fresh)
+
+        return [allocate(line, batches_by_sku.get(line.sku, [])) for line in lines]
+
+    return allocate_all
+
+
+def main():
+    """
+    Runs the benchmarks, prints and writes the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-size", type=int, default=SIZES[-1], help="largest number of order lines")
+    parser.add_argument("--max-line-by-line", type=int, default=10**5, help="largest size allocated line by line")
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds spent timing each measurement at least")
+    parser.add_argument("--output", type=Path, help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    results = []
+
+    for size in (size for size in SIZES if size <= args.max_size):
+        lines, batches = scenario(size)
+        benchmarks = {"plan": setup_plan}
+
+        if size <= args.max_line_by_line:
+            benchmarks["line_by_line"] = setup_line_by_line
+
+        for name, setup in benchmarks.items():
+            calls, seconds = time_calls(setup(lines, batches), args.budget)
+            results.append({"benchmark": name, "size": size, "calls": calls, "seconds": seconds})
+            print(f"{name:>12} {size:>8}: {seconds * 1000:12.3f} ms/call ({calls} calls)")
+
+    run = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "results": results,
+    }
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(run, indent=2))
+
+
+if __name__ == "__main__":
+    main()
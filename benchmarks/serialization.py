@@ -0,0 +1,175 @@
+"""
+Cost of serializing the responses of the HTTP API.
+
+Measures the mean time spent turning an endpoint's result into a response body. The results are built as the
+services return them, for:
+
+* allocate: the reference of the batch allocated, BatchReference.
+* allocate_many: N outcomes of POST /allocations/bulk, AllocationResult.
+* cancel_orders: N allocations removed by POST /orders/cancellations, Allocation.
+
+Every payload is serialized in three ways, each time rendered by JSONResponse and by ORJSONResponse, see the
+JSON_RESPONSE setting:
+
+* plain: as FastAPI does without a response model, encoding the result with jsonable_encoder.
+* model: as FastAPI does with a response model, validating the result against it before encoding it.
+* serialize: as the list endpoints do, mapping the result to the model aliases without validating it, see
+  CamelCaseModel.serialize.
+
+Usage:
+    python -m benchmarks.serialization [--max-size N] [--budget SECONDS] [--output FILE]
+"""
+import argparse
+import datetime
+import json
+import platform
+from pathlib import Path
+from typing import Any, Callable, Coroutine
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from allocation.domain import models, schemas
+from allocation.domain.schemas import CamelCaseModel
+from allocation.service_layer.allocation_service import AllocationResult
+from benchmarks.allocation import commit, time_calls
+
+SIZES = (10, 100, 1000, 10000)
+
+RESPONSE_CLASSES = {"json": JSONResponse, "orjson": ORJSONResponse}
+
+MODES = ("plain", "model", "serialize")
+
+
+def allocate_payload(size: int) -> tuple[Any, Any]:
+    return schemas.BatchReference(reference="batch-001"), schemas.BatchReference
+
+
+def allocate_many_payload(size: int) -> tuple[Any, Any]:
+    # One line in ten out of stock.
+    results = [
+        AllocationResult(f"order-{i}", "GENERIC-SOFA", 1, error="OutOfStock")
+        if i % 10 == 0
+        else AllocationResult(f"order-{i}", "GENERIC-SOFA", 1, reference=f"batch-{i % 7}")
+        for i in range(size)
+    ]
+    return results, list[schemas.AllocationResult]
+
+
+def cancel_orders_payload(size: int) -> tuple[Any, Any]:
+    removed = [models.Allocation(f"order-{i}", "GENERIC-SOFA", 1, f"batch-{i % 7}") for i in range(size)]
+    return removed, list[schemas.Allocation]
+
+
+# Builds the result of an endpoint, and its response model.
+PAYLOADS: dict[str, Callable[[int], tuple[Any, Any]]] = {
+    "allocate": allocate_payload,
+    "allocate_many": allocate_many_payload,
+    "cancel_orders": cancel_orders_payload,
+}
+
+
+def run_to_completion(coroutine: Coroutine) -> Any:
+    """
+    Runs a coroutine which never suspends, without an event loop, as serialize_response does when validating on the
+    event loop.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+
+    raise RuntimeError("The coroutine suspended")
+
+
+def serializer(content: Any, model: Any, mode: str, response_class: type[JSONResponse]) -> Callable[[], bytes]:
+    """
+    Builds the serialization of a result in one of the modes.
+    """
+    if mode == "serialize":
+        # The model of the items of list payloads.
+        item_model: type[CamelCaseModel] = getattr(model, "__args__", (model,))[0]
+
+        if isinstance(content, list):
+            return lambda: response_class([item_model.serialize(item) for item in content]).body
+
+        return lambda: response_class(item_model.serialize(content)).body
+
+    field = create_response_field(name="benchmark_response", type_=model) if mode == "model" else None
+
+    def serialize() -> bytes:
+        encoded = run_to_completion(serialize_response(field=field, response_content=content))
+        return response_class(encoded).body
+
+    return serialize
+
+
+def measure(name: str, size: int, budget: float) -> list[dict]:
+    """
+    Times the serialization of a payload in every mode, by every response class.
+
+    Returns:
+        list[dict]: The mean seconds per response and the body size of every combination.
+    """
+    content, model = PAYLOADS[name](size)
+    results = []
+
+    for mode in MODES:
+        for encoder, response_class in RESPONSE_CLASSES.items():
+            serialize = serializer(content, model, mode, response_class)
+            calls, seconds = time_calls(serialize, budget)
+            results.append(
+                {
+                    "payload": name,
+                    "size": size,
+                    "mode": mode,
+                    "encoder": encoder,
+                    "calls": calls,
+                    "seconds": seconds,
+                    "body_bytes": len(serialize()),
+                }
+            )
+
+    return results
+
+
+def main():
+    """
+    Runs the benchmarks, prints and writes the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-size", type=int, default=SIZES[-1], help="largest number of items in list payloads")
+    parser.add_argument("--budget", type=float, default=0.2, help="seconds spent timing each measurement at least")
+    parser.add_argument("--output", type=Path, help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    results = []
+
+    for name in PAYLOADS:
+        # The allocate payload is a single object.
+        sizes = (1,) if name == "allocate" else (size for size in SIZES if size <= args.max_size)
+
+        for size in sizes:
+            for result in measure(name, size, args.budget):
+                results.append(result)
+                print(
+                    f"{name:>14} {size:>6} {result['mode']:>9} {result['encoder']:>6}: "
+                    f"{result['seconds'] * 1e6:12.2f} us/response {result['body_bytes']:>9} B"
+                )
+
+    run = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "results": results,
+    }
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(run, indent=2))
+
+
+if __name__ == "__main__":
+    main()
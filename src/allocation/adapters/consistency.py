@@ -0,0 +1,63 @@
+"""
+This module contains consistency checks between denormalized columns and the tables they summarize.
+
+The allocated quantity of a batch is maintained incrementally by the domain model, and persisted in the
+batches table. These checks recompute it from the allocations table, so a drift can be detected and repaired.
+"""
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from allocation.adapters.orm import allocations, batches, order_lines
+
+
+def _actual_allocated_quantity():
+    """
+    Builds a correlated subquery summing the quantities of the lines allocated to a batch.
+    """
+    return (
+        select(func.coalesce(func.sum(order_lines.c.qty), 0))
+        .select_from(allocations.join(order_lines, order_lines.c.id == allocations.c.orderline_id))
+        .where(allocations.c.batch_id == batches.c.id)
+        .scalar_subquery()
+    )
+
+
+def find_inconsistent_batches(session: Session) -> list[tuple[str, int, int]]:
+    """
+    Finds the batches whose stored allocated quantity differs from their allocations.
+
+    Args:
+        session: The SQLAlchemy session.
+
+    Returns:
+        list[tuple[str, int, int]]: The reference, stored and actual allocated quantity of each inconsistent batch.
+    """
+    actual = _actual_allocated_quantity()
+    query = select(batches.c.reference, batches.c._allocated_quantity, actual).where(
+        batches.c._allocated_quantity != actual
+    )
+
+    return [tuple(row) for row in session.execute(query)]
+
+
+def rebuild_allocated_quantities(session: Session | Connection) -> int:
+    """
+    Recomputes the stored allocated quantity of the inconsistent batches from the allocations table.
+
+    The changes are not committed, so it can take part of a larger transaction.
+
+    Args:
+        session: The SQLAlchemy session, or a connection.
+
+    Returns:
+        int: The number of batches fixed.
+    """
+    actual = _actual_allocated_quantity()
+    statement = (
+        update(batches)
+        .where(batches.c._allocated_quantity != actual)
+        .values({batches.c._allocated_quantity: actual})
+    )
+
+    return session.execute(statement).rowcount
@@ -1,23 +1,159 @@
 """
 This module contains the Database and SQLAlchemy session configuration.
+
+Engines are built from the Application settings: URL, pool sizing and, on SQLite, the pragmas applied to every new
+connection. The statements they execute are counted while tracked, see query_stats. The ORM mappers are not started
+here: they are configured once per process, see orm.ensure_mappers. A process forked after the engines are built
+must reset them before connecting, see reset_after_fork.
 """
+import asyncio
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import clear_mappers, sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 
-from allocation.adapters.orm import start_mappers
+from allocation.adapters.query_stats import instrument
+from allocation.app.config.settings import Application, settings
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+def sqlite_pragmas(app_settings: Application) -> dict[str, str | int]:
+    """
+    Lists the pragmas applied to every new SQLite connection.
 
-SessionLocal = sessionmaker(bind=engine)
+    Args:
+        app_settings: The application settings.
+
+    Returns:
+        dict[str, str | int]: The value of each pragma.
+    """
+    return {
+        "journal_mode": app_settings.SQLITE_JOURNAL_MODE,
+        "synchronous": app_settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": app_settings.SQLITE_BUSY_TIMEOUT,
+        "cache_size": app_settings.SQLITE_CACHE_SIZE,
+        **app_settings.SQLITE_PRAGMAS,
+    }
+
+
+def _engine_arguments(url: str, app_settings: Application, queue_pool) -> dict:
+    parsed = make_url(url)
+    arguments: dict = {"query_cache_size": app_settings.DB_STATEMENT_CACHE_SIZE}
+
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # Every connection to an in-memory database is a new database, so there can only be one.
+        return arguments | {"poolclass": StaticPool}
+
+    if parsed.get_backend_name() == "sqlite":
+        # SQLite file databases are not pooled by default.
+        arguments["poolclass"] = queue_pool
+
+    return arguments | {
+        "pool_size": app_settings.DB_POOL_SIZE,
+        "max_overflow": app_settings.DB_MAX_OVERFLOW,
+        "pool_recycle": app_settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": app_settings.DB_POOL_PRE_PING,
+    }
+
+
+def _apply_pragmas(engine: Engine, pragmas: dict[str, str | int]):
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
 
 
-def get_session_factory():
+def create_db_engine(app_settings: Application = settings) -> Engine:
     """
-    Returns a session factory for the database.
+    Builds the database engine.
+
+    Args:
+        app_settings: The application settings.
+
+    Returns:
+        Engine: A SQLAlchemy engine.
+    """
+    url = app_settings.DATABASE_URL
+    arguments = _engine_arguments(url, app_settings, QueuePool)
+
+    if make_url(url).get_backend_name() != "sqlite":
+        db_engine = create_engine(url, **arguments)
+    else:
+        db_engine = create_engine(url, connect_args={"check_same_thread": False}, **arguments)
+        _apply_pragmas(db_engine, sqlite_pragmas(app_settings))
+
+    instrument(db_engine)
+    return db_engine
+
+
+def create_async_db_engine(app_settings: Application = settings) -> AsyncEngine:
+    """
+    Builds the asyncio database engine.
+
+    Args:
+        app_settings: The application settings.
+
+    Returns:
+        AsyncEngine: A SQLAlchemy asyncio engine.
     """
-    start_mappers()
-    yield SessionLocal
-    clear_mappers()
+    url = app_settings.ASYNC_DATABASE_URL
+    db_engine = create_async_engine(url, **_engine_arguments(url, app_settings, AsyncAdaptedQueuePool))
+
+    if make_url(url).get_backend_name() == "sqlite":
+        _apply_pragmas(db_engine.sync_engine, sqlite_pragmas(app_settings))
+
+    instrument(db_engine.sync_engine)
+    return db_engine
+
+
+def warm_up(db_engine: Engine, connections: int):
+    """
+    Opens pool connections ahead of the first requests.
+
+    Args:
+        db_engine: The engine whose pool is warmed up.
+        connections: How many connections to open.
+    """
+    opened = [db_engine.connect() for _ in range(connections)]
+
+    for connection in opened:
+        connection.close()
+
+
+async def warm_up_async(db_engine: AsyncEngine, connections: int):
+    """
+    Opens asyncio pool connections ahead of the first requests.
+
+    Args:
+        db_engine: The asyncio engine whose pool is warmed up.
+        connections: How many connections to open.
+    """
+    opened = await asyncio.gather(*(db_engine.connect().start() for _ in range(connections)))
+
+    for connection in opened:
+        await connection.close()
+
+
+def reset_after_fork():
+    """
+    Replaces the connection pools inherited from the parent process, in a forked child process.
+
+    The connections of the parent are left open for it, rather than closed, as the child shares their sockets.
+    """
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+
+engine = create_db_engine()
+
+SessionLocal = sessionmaker(bind=engine)
+
+async_engine = create_async_db_engine()
+
+# Loaded entities are not expired on commit, as refreshing them would need an implicit (blocking) query.
+AsyncSessionLocal = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
@@ -0,0 +1,116 @@
+"""
+This module persists the outcome of idempotent requests, so they can be replayed across restarts and processes.
+"""
+import abc
+import datetime
+from typing import Sequence
+
+from sqlalchemy import delete, select
+from sqlalchemy.engine import Engine
+
+from allocation.adapters.orm import idempotency_keys
+from allocation.adapters.repository import UPSERT_DIALECTS
+
+
+class AbstractIdempotencyStore(abc.ABC):
+    """
+    Abstract base class for idempotency key stores.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str, newer_than: datetime.datetime) -> tuple[str, str] | None:
+        """
+        Finds the outcome stored for a key.
+
+        Args:
+            key (str): The idempotency key.
+            newer_than (datetime.datetime): Outcomes stored before are considered expired.
+
+        Returns:
+            tuple[str, str] | None: The fingerprint of the request and its outcome, None if there is none.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def put(self, key: str, fingerprint: str, reference: str) -> None:
+        """
+        Stores the outcome of a request, keeping the first one stored for the key.
+
+        Args:
+            key (str): The idempotency key.
+            fingerprint (str): Identifies the request, to detect keys reused for another one.
+            reference (str): The outcome of the request.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, keys: Sequence[str]) -> None:
+        """
+        Deletes the outcomes of some keys, so their requests run again.
+
+        Args:
+            keys (Sequence[str]): The idempotency keys.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def purge(self, older_than: datetime.datetime) -> int:
+        """
+        Deletes the expired outcomes.
+
+        Args:
+            older_than (datetime.datetime): Outcomes stored before are deleted.
+
+        Returns:
+            int: The number of outcomes deleted.
+        """
+        raise NotImplementedError
+
+
+class SqlAlchemyIdempotencyStore(AbstractIdempotencyStore):
+    """
+    Stores idempotency keys in the idempotency_keys table, outside of any unit of work.
+
+    Args:
+        engine: The SQLAlchemy engine.
+
+    Raises:
+        NotImplementedError: If keys cannot be stored on the database of the engine, so it fails on startup rather
+            than on the first retried request.
+    """
+
+    def __init__(self, engine: Engine):
+        if engine.dialect.name not in UPSERT_DIALECTS:
+            raise NotImplementedError(
+                f"Idempotency keys cannot be stored on {engine.dialect.name}, "
+                f"supported databases are {', '.join(UPSERT_DIALECTS)}"
+            )
+
+        self.engine = engine
+        self._insert = UPSERT_DIALECTS[engine.dialect.name]
+
+    def get(self, key: str, newer_than: datetime.datetime) -> tuple[str, str] | None:
+        statement = select(idempotency_keys.c.fingerprint, idempotency_keys.c.reference).where(
+            idempotency_keys.c.key == key, idempotency_keys.c.created_at >= newer_than
+        )
+
+        with self.engine.connect() as connection:
+            row = connection.execute(statement).first()
+
+        return tuple(row) if row is not None else None
+
+    def put(self, key: str, fingerprint: str, reference: str) -> None:
+        row = {"key": key, "fingerprint": fingerprint, "reference": reference, "created_at": datetime.datetime.utcnow()}
+        statement = self._insert(idempotency_keys).values(row).on_conflict_do_nothing()
+
+        with self.engine.begin() as connection:
+            connection.execute(statement)
+
+    def delete(self, keys: Sequence[str]) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(delete(idempotency_keys).where(idempotency_keys.c.key.in_(list(keys))))
+
+    def purge(self, older_than: datetime.datetime) -> int:
+        with self.engine.begin() as connection:
+            statement = delete(idempotency_keys).where(idempotency_keys.c.created_at < older_than)
+            return connection.execute(statement).rowcount
@@ -0,0 +1,307 @@
+"""Metrics
+
+In-process metric primitives, safe to update from the event loop and from threads alike, and their rendering in the
+Prometheus text exposition format.
+
+Metrics are registered with a Registry, usually the process-wide REGISTRY, once at import time. Updating one costs a
+lock and, for labelled ones, a dictionary lookup, so they can be used on the hot path. State which is already kept
+elsewhere, e.g. the counters of the SKU catalog, is read through collectors when the metrics are rendered instead.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Generic, Iterable, Sequence, TypeVar
+
+# Upper bounds, in seconds, fitting request and transaction latencies.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Upper bounds fitting the number of items handled together.
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    """
+    Counts observations in buckets of fixed upper bounds, and keeps their sum.
+
+    Args:
+        name: The metric name.
+        description: What is observed.
+        buckets: The increasing upper bounds of the buckets. Larger observations are only counted in the total.
+    """
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """
+        Records an observation.
+
+        Args:
+            value: The observed value.
+        """
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+
+    def time(self) -> "Timer":
+        """
+        Times a block of code, observing its duration in seconds once it exits, even on errors.
+
+        Returns:
+            Timer: A context manager.
+        """
+        return Timer(self)
+
+    def snapshot(self) -> dict:
+        """
+        Returns the cumulative count of every bucket, the total count and the sum of the observations.
+        """
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+
+        cumulative, buckets = 0, []
+
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            buckets.append({"le": bound, "count": cumulative})
+
+        return {"buckets": buckets, "count": sum(counts), "sum": total}
+
+    def render(self, name: str, labels: str) -> Iterable[str]:
+        """
+        Renders the buckets, sum and count of the histogram in the Prometheus text format.
+
+        Args:
+            name: The metric name.
+            labels: The rendered labels of the histogram, empty if it has none.
+
+        Returns:
+            Iterable[str]: The sample lines.
+        """
+        snapshot = self.snapshot()
+        separator = "," if labels else ""
+
+        for bucket in snapshot["buckets"]:
+            yield f'{name}_bucket{{{labels}{separator}le="{_number(bucket["le"])}"}} {bucket["count"]}'
+
+        yield f'{name}_bucket{{{labels}{separator}le="+Inf"}} {snapshot["count"]}'
+        yield f"{name}_sum{_braces(labels)} {_number(snapshot['sum'])}"
+        yield f"{name}_count{_braces(labels)} {snapshot['count']}"
+
+
+class Timer:
+    """
+    Observes the seconds spent in a with block, see Histogram.time.
+    """
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Counter:
+    """
+    Counts events.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        """
+        Counts events.
+
+        Args:
+            amount: How many events.
+        """
+        with self._lock:
+            self.value += amount
+
+    def render(self, name: str, labels: str) -> Iterable[str]:
+        """
+        Renders the counter in the Prometheus text format, see Histogram.render.
+        """
+        yield f"{name}{_braces(labels)} {_number(self.value)}"
+
+
+class Gauge(Counter):
+    """
+    Measures a value which goes up and down.
+    """
+
+    def dec(self, amount: float = 1):
+        """
+        Decreases the value.
+
+        Args:
+            amount: By how much.
+        """
+        self.inc(-amount)
+
+    def set(self, value: float):
+        """
+        Replaces the value.
+
+        Args:
+            value: The new value.
+        """
+        with self._lock:
+            self.value = value
+
+
+M = TypeVar("M", Counter, Gauge, Histogram)
+
+TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+
+class Family(Generic[M]):
+    """
+    A metric partitioned by labels, with one child metric per combination of label values.
+
+    Args:
+        name: The metric name.
+        description: What is measured.
+        child: Builds the metric of a combination of label values.
+        labels: The label names, none for a single metric.
+    """
+
+    def __init__(self, name: str, description: str, child: Callable[[], M], labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.type = TYPES[type(child())]
+        self.label_names = tuple(labels)
+        self._child = child
+        self._children: dict[tuple, M] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> M:
+        """
+        Returns the metric of some label values, created on first use.
+
+        Args:
+            *values: The label values, in the order of the label names.
+
+        Returns:
+            M: The child metric.
+        """
+        metric = self._children.get(values)
+
+        if metric is None:
+            with self._lock:
+                metric = self._children.setdefault(values, self._child())
+
+        return metric
+
+    def render(self) -> Iterable[str]:
+        """
+        Renders the help, type and samples of every child in the Prometheus text format.
+
+        Returns:
+            Iterable[str]: The lines.
+        """
+        yield f"# HELP {self.name} {_escape(self.description, quotes=False)}"
+        yield f"# TYPE {self.name} {self.type}"
+
+        for values, metric in sorted(self._children.copy().items()):
+            labels = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(self.label_names, values))
+            yield from metric.render(self.name, labels)
+
+
+class Registry:
+    """
+    The metrics of a process, rendered together.
+    """
+
+    def __init__(self):
+        self._families: dict[str, Family] = {}
+        self._collectors: list[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Family[Counter]:
+        """
+        Registers a counter, see Family.
+        """
+        return self._register(Family(name, description, Counter, labels))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> Family[Gauge]:
+        """
+        Registers a gauge, see Family.
+        """
+        return self._register(Family(name, description, Gauge, labels))
+
+    def histogram(
+        self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Family[Histogram]:
+        """
+        Registers a histogram, see Family.
+        """
+        return self._register(Family(name, description, lambda: Histogram(name, description, buckets), labels))
+
+    def collector(self, collect: Callable[[], Iterable[Family]]) -> Callable[[], Iterable[Family]]:
+        """
+        Registers a function building metrics when they are rendered, usually from state kept elsewhere.
+
+        Args:
+            collect: Returns the metrics to render.
+
+        Returns:
+            The function, so it can be used as a decorator.
+        """
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format, version 0.0.4.
+
+        Returns:
+            str: The exposition.
+        """
+        families = list(self._families.values())
+
+        for collect in self._collectors:
+            families.extend(collect())
+
+        return "".join(f"{line}\n" for family in families for line in family.render())
+
+    def _register(self, family: Family) -> Family:
+        if family.name in self._families:
+            raise ValueError(f"Metric already registered: {family.name}")
+
+        self._families[family.name] = family
+        return family
+
+
+# Process-wide registry, rendered by the /metrics endpoint.
+REGISTRY = Registry()
+
+
+def _braces(labels: str) -> str:
+    return f"{{{labels}}}" if labels else ""
+
+
+def _escape(text: str, quotes: bool = True) -> str:
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quotes else text
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
@@ -0,0 +1,294 @@
+"""Schema Migrations
+
+This module upgrades existing databases in place to the schema described in the ORM module.
+
+Every applied migration is recorded in the schema_version table. A fresh database is created straight from the ORM
+metadata and stamped with the latest version, while an existing one only runs the migrations it is missing.
+
+Usage:
+    python -m allocation.adapters.migrations [upgrade|check|current]
+"""
+import argparse
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, literal, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from allocation.adapters import orm
+from allocation.adapters.consistency import rebuild_allocated_quantities
+
+log = logging.getLogger(__name__)
+
+version_metadata = MetaData()
+
+# Whether the schema was upgraded before this process was forked, e.g. by the gunicorn arbiter.
+_upgraded_before_fork = False
+
+schema_version = Table(
+    "schema_version",
+    version_metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False, default=datetime.datetime.utcnow),
+)
+
+
+class SchemaVersionMismatch(Exception):
+    """
+    Raised when the database schema is not at the version expected by the application.
+    """
+
+    def __init__(self, current: int, expected: int):
+        self.current = current
+        self.expected = expected
+        self.message = f"Database schema is at version {current}, expected {expected}. Run the migrations."
+        super().__init__(self.message)
+
+
+class DuplicateBatchReferences(Exception):
+    """
+    Raised when batch references cannot be made unique, as some batches share theirs.
+    """
+
+    def __init__(self, references: list[str]):
+        self.references = references
+        listed = ", ".join(references[:20]) + (f" and {len(references) - 20} more" if len(references) > 20 else "")
+        self.message = f"Batch references are not unique, merge or rename the batches of: {listed}"
+        super().__init__(self.message)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    Represents a schema change.
+
+    Attributes:
+        version (int): The version the schema is at once the migration is applied.
+        description (str): What the migration does.
+        upgrade (Callable[[Connection], None]): Applies the change within the given transaction.
+    """
+
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def _add_allocated_quantity(connection: Connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("batches")}
+
+    if "_allocated_quantity" not in columns:
+        connection.execute(text("ALTER TABLE batches ADD COLUMN _allocated_quantity INTEGER NOT NULL DEFAULT 0"))
+
+    rebuild_allocated_quantities(connection)
+
+
+def _create_indexes(*names: str) -> Callable[[Connection], None]:
+    indexes = {index.name: index for table in orm.metadata.tables.values() for index in table.indexes}
+
+    def upgrade(connection: Connection):
+        for name in names:
+            indexes[name].create(connection, checkfirst=True)
+
+    return upgrade
+
+
+def duplicate_references(connection: Connection) -> list[str]:
+    """
+    Finds the batch references shared by several batches.
+
+    Args:
+        connection: A connection to the database.
+
+    Returns:
+        list[str]: The duplicated references, sorted.
+    """
+    reference = orm.batches.c.reference
+    query = select(reference).group_by(reference).having(func.count() > 1).order_by(reference)
+    return list(connection.execute(query).scalars())
+
+
+def _index_batches(connection: Connection):
+    duplicates = duplicate_references(connection)
+
+    if duplicates:
+        log.error("Found %d duplicated batch references: %s", len(duplicates), duplicates)
+        raise DuplicateBatchReferences(duplicates)
+
+    _create_indexes(
+        "uq_batches_reference",
+        "ix_batches_sku",
+        "ix_order_lines_order_id_sku",
+        "ix_allocations_batch_id_orderline_id",
+    )(connection)
+
+
+def _create_products(connection: Connection):
+    orm.products.create(connection, checkfirst=True)
+    connection.execute(
+        orm.products.insert().from_select(
+            ["sku", "version_number"],
+            select(orm.batches.c.sku, literal(0)).distinct().where(orm.batches.c.sku.is_not(None)),
+        )
+    )
+
+
+def _create_idempotency_keys(connection: Connection):
+    orm.idempotency_keys.create(connection, checkfirst=True)
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "Add the allocated quantity column to batches", _add_allocated_quantity),
+    Migration(2, "Index batch SKUs and references, order lines and allocations", _index_batches),
+    Migration(3, "Add versioned products, one per batch SKU", _create_products),
+    Migration(4, "Add the idempotency keys of allocations", _create_idempotency_keys),
+    Migration(5, "Index allocations by order line", _create_indexes("ix_allocations_orderline_id")),
+)
+
+HEAD = MIGRATIONS[-1].version
+
+
+def current_version(connection: Connection) -> int:
+    """
+    Obtains the version of the database schema.
+
+    Args:
+        connection: A connection to the database.
+
+    Returns:
+        int: The latest applied version, 0 for an unversioned database.
+    """
+    if not inspect(connection).has_table(schema_version.name):
+        return 0
+
+    return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def _stamp(connection: Connection, migration: Migration):
+    connection.execute(schema_version.insert().values(version=migration.version, description=migration.description))
+
+
+def upgrade(engine: Engine) -> list[Migration]:
+    """
+    Brings the database schema up to date, each migration running in its own transaction.
+
+    Args:
+        engine: The SQLAlchemy engine.
+
+    Returns:
+        list[Migration]: The applied migrations.
+    """
+    with engine.begin() as connection:
+        if not inspect(connection).has_table(orm.batches.name):
+            log.info("Creating database schema at version %s.", HEAD)
+            orm.metadata.create_all(connection)
+            version_metadata.create_all(connection)
+            for migration in MIGRATIONS:
+                _stamp(connection, migration)
+            return []
+
+        version_metadata.create_all(connection)
+        version = current_version(connection)
+
+    applied = []
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+
+        log.info("Applying migration %s: %s.", migration.version, migration.description)
+
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            _stamp(connection, migration)
+
+        applied.append(migration)
+
+    return applied
+
+
+def upgrade_before_fork(engine: Engine) -> list[Migration]:
+    """
+    Brings the database schema up to date in a process about to fork workers, which then only check it.
+
+    The connections opened are closed, rather than inherited by the workers.
+
+    Args:
+        engine: The SQLAlchemy engine.
+
+    Returns:
+        list[Migration]: The applied migrations.
+    """
+    global _upgraded_before_fork  # pylint: disable=global-statement
+
+    applied = upgrade(engine)
+    engine.dispose()
+    _upgraded_before_fork = True
+    return applied
+
+
+def upgraded_before_fork() -> bool:
+    """
+    Tells whether the schema was upgraded before this process was forked, see upgrade_before_fork.
+    """
+    return _upgraded_before_fork
+
+
+def check(engine: Engine):
+    """
+    Verifies that the database schema is at the version expected by the application.
+
+    Args:
+        engine: The SQLAlchemy engine.
+
+    Raises:
+        SchemaVersionMismatch: When the schema is behind or ahead of the application.
+    """
+    with engine.connect() as connection:
+        version = current_version(connection)
+
+    if version != HEAD:
+        raise SchemaVersionMismatch(version, HEAD)
+
+
+def main(argv: list[str] | None = None):
+    """
+    Command line interface to the migrations, run against the configured database.
+
+    Args:
+        argv: The command line arguments.
+    """
+    # pylint: disable=import-outside-toplevel
+    from allocation.adapters.database import engine
+
+    parser = argparse.ArgumentParser(description="Manages the allocation database schema.")
+    parser.add_argument(
+        "command",
+        choices=["upgrade", "check", "current"],
+        nargs="?",
+        default="upgrade",
+        help="upgrade the schema (default), check it is up to date, or print its version",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "upgrade":
+        try:
+            applied = upgrade(engine)
+        except DuplicateBatchReferences as e:
+            raise SystemExit(e.message) from e
+        print(f"Database schema at version {HEAD}, {len(applied)} migration(s) applied.")
+    elif args.command == "check":
+        try:
+            check(engine)
+        except SchemaVersionMismatch as e:
+            raise SystemExit(e.message) from e
+        print(f"Database schema is up to date (version {HEAD}).")
+    else:
+        with engine.connect() as connection:
+            print(current_version(connection))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,8 @@ This module contains the ORM classes for the allocation domain entities.
 """
 import datetime
 
-from sqlalchemy import Column, Date, ForeignKey, Integer, MetaData, String, Table
-from sqlalchemy.orm import mapper, relationship
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, inspect
+from sqlalchemy.orm import defaultload, foreign, joinedload, lazyload, mapper, relationship, selectinload, subqueryload
 
 import allocation.domain.models as model
 
@@ -17,6 +17,7 @@ order_lines = Table(
     Column("sku", String(255)),
     Column("qty", Integer, nullable=False),
     Column("order_id", String(255)),
+    Index("ix_order_lines_order_id_sku", "order_id", "sku"),
 )
 
 batches = Table(
@@ -26,7 +27,10 @@ batches = Table(
     Column("reference", String(255)),
     Column("sku", String(255)),
     Column("_purchased_quantity", Integer, nullable=False),
+    Column("_allocated_quantity", Integer, nullable=False, default=0, server_default="0"),
     Column("eta", Date, nullable=True, default=datetime.datetime.utcnow),
+    Index("uq_batches_reference", "reference", unique=True),
+    Index("ix_batches_sku", "sku"),
 )
 
 allocations = Table(
@@ -35,15 +39,55 @@ allocations = Table(
     Column("id", Integer, primary_key=True, autoincrement=True),
     Column("orderline_id", ForeignKey("order_lines.id")),
     Column("batch_id", ForeignKey("batches.id")),
+    Index("ix_allocations_batch_id_orderline_id", "batch_id", "orderline_id"),
+    # Reverse lookup of the batch holding an order line, from the order ID through ix_order_lines_order_id_sku.
+    Index("ix_allocations_orderline_id", "orderline_id"),
+)
+
+products = Table(
+    "products",
+    metadata,
+    Column("sku", String(255), primary_key=True),
+    Column("version_number", Integer, nullable=False, server_default="0"),
+)
+
+# Not mapped: the outcome of allocations, replayed when they are retried with the same key.
+idempotency_keys = Table(
+    "idempotency_keys",
+    metadata,
+    Column("key", String(255), primary_key=True),
+    Column("fingerprint", String(255), nullable=False),
+    Column("reference", String(255), nullable=False),
+    Column("created_at", DateTime, nullable=False, index=True),
 )
 
 
-def start_mappers():
+LOADING_STRATEGIES = {
+    "select": lazyload,
+    "selectin": selectinload,
+    "joined": joinedload,
+    "subquery": subqueryload,
+}
+
+
+def start_mappers(allocations_loading: str = "selectin"):
     """
     Classic SQLAlchemy DB mapper configuration function.
+
+    Args:
+        allocations_loading (str): Default loading strategy of the batch allocations, one of
+            LOADING_STRATEGIES. "select" lazy loads them with one query per batch, while "selectin"
+            and "joined" load the allocations of every batch in a query together with them. The batches
+            of a product are loaded without their allocations, see product_batches_loader.
+
+    Raises:
+        ValueError: When the loading strategy is not supported.
     """
+    if allocations_loading not in LOADING_STRATEGIES:
+        raise ValueError(f"Unsupported loading strategy: {allocations_loading}")
+
     lines_mapper = mapper(model.OrderLine, order_lines)
-    mapper(
+    batches_mapper = mapper(
         model.Batch,
         batches,
         properties={
@@ -51,6 +95,80 @@ def start_mappers():
                 lines_mapper,
                 secondary=allocations,
                 collection_class=set,
+                lazy=allocations_loading,
+            )
+        },
+    )
+    mapper(
+        model.Product,
+        products,
+        # The version is incremented by the domain, and the UPDATE only matches the version which was loaded.
+        version_id_col=products.c.version_number,
+        version_id_generator=False,
+        properties={
+            # Batches are saved on their own, the product only loads them.
+            "batches": relationship(
+                batches_mapper,
+                primaryjoin=products.c.sku == foreign(batches.c.sku),
+                lazy="selectin",
+                viewonly=True,
             )
         },
     )
+
+
+def ensure_mappers(allocations_loading: str = "selectin") -> bool:
+    """
+    Starts the mappers once per process, unless the domain entities are already mapped.
+
+    Args:
+        allocations_loading (str): Default loading strategy of the batch allocations, see start_mappers.
+
+    Returns:
+        bool: True if the mappers were started by this call.
+    """
+    if inspect(model.Batch, raiseerr=False) is not None:
+        return False
+
+    start_mappers(allocations_loading)
+    return True
+
+
+def allocations_loader(strategy: str):
+    """
+    Builds a query option which overrides the loading strategy of the batch allocations.
+
+    Args:
+        strategy (str): One of LOADING_STRATEGIES.
+
+    Returns:
+        A loader option to be used in a repository or query.
+    """
+    return LOADING_STRATEGIES[strategy](model.Batch._allocations)  # pylint: disable=protected-access
+
+
+def eager_allocations_loader():
+    """
+    Builds a query option which loads the batch allocations with their default strategy, unless it lazy loads them.
+
+    An asynchronous session cannot lazy load, an attribute loaded on access raises MissingGreenlet, so the "select"
+    strategy is replaced by "selectin".
+
+    Returns:
+        A loader option to be used in the asynchronous repositories.
+    """
+    strategy = inspect(model.Batch).relationships["_allocations"].lazy
+    return allocations_loader("selectin" if strategy == "select" else strategy)
+
+
+def product_batches_loader():
+    """
+    Builds a query option which loads the batches of a product without their allocations.
+
+    Allocating only needs the allocated quantity of the batches, which is a column, and new allocations are still
+    inserted. The allocations are loaded with the batches themselves, where deallocating needs them.
+
+    Returns:
+        A loader option to be used in the product repositories.
+    """
+    return defaultload(model.Product.batches).noload(model.Batch._allocations)  # pylint: disable=protected-access
@@ -0,0 +1,220 @@
+"""Profiling
+
+Profiles requests with a sampling profiler, and keeps their profiles in a bounded directory.
+
+The profiler samples the stacks of every thread of the process at a fixed interval, as sync endpoints run in a
+thread pool rather than on the event loop, skipping threads which are idle. Profiles are written in the collapsed
+stack format, one line per distinct stack with its number of samples, which flamegraph.pl and speedscope render as
+flame graphs. Requests handled concurrently with the one profiled show up in its profile too.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from types import FrameType
+
+# Functions at the top of the stack of a thread blocked waiting for work, e.g. in a thread pool or the event loop.
+IDLE_FUNCTIONS = frozenset({"wait", "select", "poll"})
+
+PROFILE_ID = re.compile(r"[0-9]+-[0-9a-f]{8}")
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the other threads of the process while used as a context manager.
+
+    Attributes:
+        stacks (Counter[str]): The number of samples of every collapsed stack, root first.
+        samples (int): The number of times the threads were sampled.
+
+    Args:
+        interval: Seconds between samples.
+    """
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """
+        Renders the samples in the collapsed stack format.
+
+        Returns:
+            str: A line per stack, its frames separated by semicolons, followed by its number of samples.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _sample(self):
+        me = threading.get_ident()
+
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self.samples += 1
+
+            for thread_id, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if thread_id != me and frame.f_code.co_name not in IDLE_FUNCTIONS:
+                    self.stacks[collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+
+
+def collapse(thread_name: str, frame: FrameType | None) -> str:
+    """
+    Collapses the stack of a thread, from its root frame to the current one.
+
+    Args:
+        thread_name: The name of the thread, used as the root.
+        frame: The current frame of the thread.
+
+    Returns:
+        str: The frames, separated by semicolons.
+    """
+    frames = []
+
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+@dataclass(frozen=True)
+class ProfileInfo:
+    """
+    Describes a stored profile.
+
+    Attributes:
+        id (str): The profile ID, ordered by creation time.
+        method (str): The HTTP method of the request profiled.
+        path (str): The path of the request profiled.
+        status (int): The response status.
+        seconds (float): How long the request took.
+        samples (int): The number of samples taken.
+        created_at (float): When the request was profiled, as a UNIX timestamp.
+    """
+
+    id: str
+    method: str
+    path: str
+    status: int
+    seconds: float
+    samples: int
+    created_at: float
+
+
+class ProfileStore:
+    """
+    Keeps the latest profiles in a directory, deleting the oldest once there are too many.
+
+    Every profile is a collapsed stack file, ID.collapsed, and its description, ID.json.
+
+    Args:
+        directory: Where the profiles are written, created when missing.
+        max_profiles: How many profiles are kept at most.
+    """
+
+    def __init__(self, directory: str | Path, max_profiles: int = 50):
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def new_id() -> str:
+        """
+        Returns a new profile ID, ordered by creation time.
+        """
+        return f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+
+    def save(
+        self, profile_id: str, profiler: SamplingProfiler, method: str, path: str, status: int, seconds: float
+    ) -> ProfileInfo:
+        """
+        Writes a profile, then deletes the oldest ones beyond the limit.
+
+        Args:
+            profile_id: The profile ID, see new_id.
+            profiler: The profiler of the request.
+            method: The HTTP method of the request.
+            path: The path of the request.
+            status: The response status.
+            seconds: How long the request took.
+
+        Returns:
+            ProfileInfo: The description of the profile.
+        """
+        info = ProfileInfo(profile_id, method, path, status, seconds, profiler.samples, time.time())
+
+        with self._lock:
+            (self.directory / f"{info.id}.collapsed").write_text(profiler.collapsed())
+            (self.directory / f"{info.id}.json").write_text(json.dumps(asdict(info)))
+
+            ids = self._ids()
+
+            for old in ids[: max(len(ids) - self.max_profiles, 0)]:
+                self._delete(old)
+
+        return info
+
+    def find_all(self) -> list[ProfileInfo]:
+        """
+        Lists the stored profiles, the latest first.
+
+        Returns:
+            list[ProfileInfo]: The descriptions of the profiles.
+        """
+        profiles = []
+
+        for profile_id in reversed(self._ids()):
+            try:
+                profiles.append(ProfileInfo(**json.loads((self.directory / f"{profile_id}.json").read_text())))
+            except FileNotFoundError:
+                # Deleted by a concurrent save.
+                continue
+
+        return profiles
+
+    def path(self, profile_id: str) -> Path | None:
+        """
+        Finds the collapsed stack file of a profile.
+
+        Args:
+            profile_id: The profile ID.
+
+        Returns:
+            Path | None: The file, None when there is no such profile.
+        """
+        if not PROFILE_ID.fullmatch(profile_id):
+            return None
+
+        path = self.directory / f"{profile_id}.collapsed"
+        return path if path.is_file() else None
+
+    def _ids(self) -> list[str]:
+        ids = (path.stem for path in self.directory.glob("*.json"))
+        return sorted((profile_id for profile_id in ids if PROFILE_ID.fullmatch(profile_id)), key=_creation_order)
+
+    def _delete(self, profile_id: str):
+        for suffix in (".collapsed", ".json"):
+            (self.directory / f"{profile_id}{suffix}").unlink(missing_ok=True)
+
+
+def _creation_order(profile_id: str) -> int:
+    return int(profile_id.split("-", 1)[0])
@@ -0,0 +1,107 @@
+"""Query Statistics
+
+Counts the SQL statements executed, and the time spent executing them, while tracking is on, e.g. for the duration of
+a request. Statements are grouped by shape, the SQL text with its parameters left as placeholders, so the same query
+run once per row, the signature of N+1 loading, stands out.
+
+Tracking is scoped with a context variable, so concurrent requests are tracked apart, and statements run in the
+threads or greenlets a request starts from its context are tracked with it.
+"""
+import contextlib
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_tracked: ContextVar["QueryStats | None"] = ContextVar("tracked_queries", default=None)
+
+
+class QueryStats:
+    """
+    The statements executed while tracking.
+
+    Attributes:
+        statements (int): The number of statements executed, an executemany counting as one.
+        seconds (float): The time spent executing them.
+        shapes (Counter[str]): How many times each statement shape was executed.
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def record(self, statement: str, seconds: float):
+        """
+        Records an executed statement.
+
+        Args:
+            statement: The SQL text, with placeholders for its parameters.
+            seconds: The time it took.
+        """
+        self.statements += 1
+        self.seconds += seconds
+        self.shapes[statement] += 1
+
+    def most_repeated(self) -> tuple[str, int]:
+        """
+        Returns the statement shape executed the most times, and how many times, ("", 0) when none was.
+        """
+        return next(iter(self.shapes.most_common(1)), ("", 0))
+
+    def report(self) -> str:
+        """
+        Describes the statements executed, most repeated first, for logs and assertion messages.
+        """
+        lines = [f"{self.statements} statements in {self.seconds * 1000:.2f} ms"]
+        lines.extend(f"{count} x {statement}" for statement, count in self.shapes.most_common())
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Tracks the statements executed by instrumented engines in this context.
+
+    Returns:
+        Iterator[QueryStats]: The statistics, updated until the block exits.
+    """
+    stats = QueryStats()
+    token = _tracked.set(stats)
+
+    try:
+        yield stats
+    finally:
+        _tracked.reset(token)
+
+
+def instrument(engine: Engine):
+    """
+    Listens to the statements executed by an engine, once per engine.
+
+    The listeners only read a context variable when tracking is off.
+
+    Args:
+        engine: A synchronous engine, or the sync_engine of an asyncio one.
+    """
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _tracked.get() is not None:
+        context.query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _tracked.get()
+    started_at = getattr(context, "query_started_at", None)
+
+    if stats is not None and started_at is not None:
+        stats.record(statement, time.perf_counter() - started_at)
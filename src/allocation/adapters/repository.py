@@ -3,10 +3,54 @@ This module abstracts the Database layer with a Repository pattern.
 """
 
 import abc
-from typing import Generic, TypeVar
+import asyncio
+import functools
+from typing import Any, Callable, Generic, Mapping, Sequence, TypeVar
+
+from sqlalchemy import and_, bindparam, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row
+from sqlalchemy.sql import Select
+
+from allocation.adapters.metrics import REGISTRY
+from allocation.adapters.orm import allocations, batches, order_lines, products
+from allocation.domain.models import Allocation, OrderLine
 
 T = TypeVar("T")
 
+QUERY_SECONDS = REGISTRY.histogram(
+    "repository_query_duration_seconds", "Seconds spent in repository queries.", labels=("entity", "method")
+)
+
+
+def timed(method: Callable) -> Callable:
+    """
+    Observes the duration of a repository method in QUERY_SECONDS, labelled by the entity and the method.
+
+    Args:
+        method: A method of a repository, either synchronous or a coroutine function.
+
+    Returns:
+        Callable: The timed method.
+    """
+    name = method.__name__
+
+    if asyncio.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def timed_coroutine(self, *args, **kwargs):
+            with QUERY_SECONDS.labels(self.kind.__name__, name).time():
+                return await method(self, *args, **kwargs)
+
+        return timed_coroutine
+
+    @functools.wraps(method)
+    def timed_method(self, *args, **kwargs):
+        with QUERY_SECONDS.labels(self.kind.__name__, name).time():
+            return method(self, *args, **kwargs)
+
+    return timed_method
+
 
 class AbstractRepository(abc.ABC, Generic[T]):
     """
@@ -66,24 +110,574 @@ class AbstractRepository(abc.ABC, Generic[T]):
         """
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def find_all_by(self, **kwargs) -> list[T]:
+        """
+        Finds all entities matching the given attributes.
+
+        Args:
+            **kwargs: The attributes of the entities.
+
+        Returns:
+            list[T]: A list of the matching entities, empty if there are none.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def exists(self, **kwargs) -> bool:
+        """
+        Checks whether at least one entity matches the given attributes, without loading it.
+
+        Args:
+            **kwargs: The attributes of an entity. When omitted, checks whether the repository is empty.
+
+        Returns:
+            bool: True if there is a matching entity, otherwise False.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def find_distinct(self, attribute: str) -> list:
+        """
+        Lists the distinct values of an attribute, without loading the entities.
+
+        Args:
+            attribute (str): The name of the attribute.
+
+        Returns:
+            list: The distinct values, in no particular order.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def upsert_many(
+        self,
+        entities: Sequence[T],
+        key: str,
+        update: Sequence[str],
+        increment: Sequence[str] = (),
+        floor: Mapping[str, str] | None = None,
+    ) -> None:
+        """
+        Inserts many entities, updating the existing ones instead of duplicating them.
+
+        Args:
+            entities (Sequence[T]): The entities to save.
+            key (str): The uniquely indexed attribute identifying an existing entity.
+            update (Sequence[str]): The attributes overwritten when the entity already exists, none to keep it
+                as is.
+            increment (Sequence[str]): The attributes incremented when the entity already exists, e.g. its version.
+            floor (Mapping[str, str] | None): By overwritten attribute, the existing attribute it may not fall below.
+                An existing entity which would is kept as is.
+        """
+        raise NotImplementedError
+
 
 class SqlAlchemyRepository(AbstractRepository, Generic[T]):
     """
     SQLAlchemy repository implementation.
+
+    Args:
+        session: The SQLAlchemy session.
+        kind: The mapped entity class.
+        options: Loader options applied to every query, e.g. to override relationship loading strategies.
     """
 
-    def __init__(self, session, kind: T):
+    def __init__(self, session, kind: T, options: Sequence[Any] = ()):
         self.session = session
+        self.options = tuple(options)
         super().__init__(kind)
 
+    def _query(self):
+        return self.session.query(self.kind).options(*self.options)
+
     def save(self, entity):
         self.session.add(entity)
 
+    @timed
     def find_by_id(self, entity_id) -> T:
-        return self.session.query(self.kind).filter_by(id=entity_id).one()
+        return self._query().filter_by(id=entity_id).one()
 
+    @timed
     def find_by(self, **kwargs) -> T:
-        return self.session.query(self.kind).filter_by(**kwargs).one()
+        return self._query().filter_by(**kwargs).one_or_none()
 
+    @timed
     def find_all(self) -> list[T]:
-        return self.session.query(self.kind).all()
+        return self._query().all()
+
+    @timed
+    def find_all_by(self, **kwargs) -> list[T]:
+        return self._query().filter_by(**kwargs).all()
+
+    @timed
+    def exists(self, **kwargs) -> bool:
+        return self.session.query(self.session.query(self.kind).filter_by(**kwargs).exists()).scalar()
+
+    @timed
+    def find_distinct(self, attribute: str) -> list:
+        return [value for (value,) in self.session.query(getattr(self.kind, attribute)).distinct()]
+
+    @timed
+    def upsert_many(
+        self,
+        entities: Sequence[T],
+        key: str,
+        update: Sequence[str],
+        increment: Sequence[str] = (),
+        floor: Mapping[str, str] | None = None,
+    ) -> None:
+        if entities:
+            dialect = self.session.get_bind().dialect.name
+            statement, rows = upsert_statement(self.kind, dialect, entities, key, update, increment, floor)
+            self.session.execute(statement, rows)
+
+
+class AbstractAsyncRepository(abc.ABC, Generic[T]):
+    """
+    Abstract base class for asynchronous repository implementations.
+
+    It mirrors AbstractRepository, but every operation is awaitable.
+    """
+
+    def __init__(self, kind: T):
+        self.kind = kind
+
+    @abc.abstractmethod
+    async def save(self, entity: T) -> None:
+        """
+        Saves an entity to the repository.
+
+        Args:
+            entity (T): The entity to save.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def find_by(self, **kwargs) -> T | None:
+        """
+        Finds an entity by its attributes.
+
+        Args:
+            **kwargs: The attributes of an entity.
+
+        Returns:
+            T : An entity if exists, otherwise None.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def find_all(self) -> list[T]:
+        """
+        Find all entities.
+
+        Returns:
+            list[T]: A list of all entities in the database.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def find_all_by(self, **kwargs) -> list[T]:
+        """
+        Finds all entities matching the given attributes.
+
+        Args:
+            **kwargs: The attributes of the entities.
+
+        Returns:
+            list[T]: A list of the matching entities, empty if there are none.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def exists(self, **kwargs) -> bool:
+        """
+        Checks whether at least one entity matches the given attributes, without loading it.
+
+        Args:
+            **kwargs: The attributes of an entity. When omitted, checks whether the repository is empty.
+
+        Returns:
+            bool: True if there is a matching entity, otherwise False.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def find_distinct(self, attribute: str) -> list:
+        """
+        Lists the distinct values of an attribute, without loading the entities.
+
+        Args:
+            attribute (str): The name of the attribute.
+
+        Returns:
+            list: The distinct values, in no particular order.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def upsert_many(
+        self,
+        entities: Sequence[T],
+        key: str,
+        update: Sequence[str],
+        increment: Sequence[str] = (),
+        floor: Mapping[str, str] | None = None,
+    ) -> None:
+        """
+        Inserts many entities, updating the existing ones instead of duplicating them.
+
+        Args:
+            entities (Sequence[T]): The entities to save.
+            key (str): The uniquely indexed attribute identifying an existing entity.
+            update (Sequence[str]): The attributes overwritten when the entity already exists.
+            increment (Sequence[str]): The attributes incremented when the entity already exists.
+            floor (Mapping[str, str] | None): By overwritten attribute, the existing attribute it may not fall below.
+        """
+        raise NotImplementedError
+
+
+class AsyncSqlAlchemyRepository(AbstractAsyncRepository, Generic[T]):
+    """
+    SQLAlchemy asyncio repository implementation.
+
+    Lazy loading is not available with an AsyncSession, so relationships must be eagerly loaded, either by the
+    mapper default or by the given loader options.
+
+    Args:
+        session: The SQLAlchemy AsyncSession.
+        kind: The mapped entity class.
+        options: Loader options applied to every query.
+    """
+
+    def __init__(self, session, kind: T, options: Sequence[Any] = ()):
+        self.session = session
+        self.options = tuple(options)
+        super().__init__(kind)
+
+    async def _scalars(self, **kwargs):
+        result = await self.session.execute(select(self.kind).filter_by(**kwargs).options(*self.options))
+        return result.unique().scalars()
+
+    async def save(self, entity):
+        self.session.add(entity)
+
+    @timed
+    async def find_by(self, **kwargs) -> T:
+        return (await self._scalars(**kwargs)).one_or_none()
+
+    @timed
+    async def find_all(self) -> list[T]:
+        return (await self._scalars()).all()
+
+    @timed
+    async def find_all_by(self, **kwargs) -> list[T]:
+        return (await self._scalars(**kwargs)).all()
+
+    @timed
+    async def exists(self, **kwargs) -> bool:
+        result = await self.session.execute(select(select(self.kind).filter_by(**kwargs).exists()))
+        return result.scalar()
+
+    @timed
+    async def find_distinct(self, attribute: str) -> list:
+        result = await self.session.execute(select(getattr(self.kind, attribute)).distinct())
+        return list(result.scalars())
+
+    @timed
+    async def upsert_many(
+        self,
+        entities: Sequence[T],
+        key: str,
+        update: Sequence[str],
+        increment: Sequence[str] = (),
+        floor: Mapping[str, str] | None = None,
+    ) -> None:
+        if entities:
+            dialect = self.session.bind.dialect.name
+            statement, rows = upsert_statement(self.kind, dialect, entities, key, update, increment, floor)
+            await self.session.execute(statement, rows)
+
+
+class AbstractAllocationRepository(abc.ABC):
+    """
+    Abstract base class for repositories of allocations, looked up by order ID without loading their batches.
+    """
+
+    @abc.abstractmethod
+    def find_by_orders(self, order_ids: Sequence[str]) -> list[Allocation]:
+        """
+        Finds the allocations of some orders.
+
+        Args:
+            order_ids (Sequence[str]): The order IDs.
+
+        Returns:
+            list[Allocation]: The allocated lines of those orders, empty if there are none.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def remove(self, order_ids: Sequence[str], lines: Sequence[OrderLine] | None = None) -> list[Allocation]:
+        """
+        Deallocates the lines of some orders from their batches.
+
+        The allocated quantity of the batches and the version of their products are changed in place, so concurrent
+        allocations of those products conflict instead of overwriting the change.
+
+        Args:
+            order_ids (Sequence[str]): The order IDs.
+            lines (Sequence[OrderLine] | None): Only deallocates these lines of the orders, every line when omitted.
+
+        Returns:
+            list[Allocation]: The allocations removed, empty if there were none.
+        """
+        raise NotImplementedError
+
+
+class SqlAlchemyAllocationRepository(AbstractAllocationRepository):
+    """
+    SQLAlchemy repository of allocations, issuing a fixed number of statements whatever the number of orders.
+
+    Args:
+        session: The SQLAlchemy session.
+    """
+
+    kind = Allocation
+
+    def __init__(self, session):
+        self.session = session
+
+    @timed
+    def find_by_orders(self, order_ids: Sequence[str]) -> list[Allocation]:
+        return [allocation_of(row) for row in self.session.execute(allocations_of_orders(order_ids))]
+
+    @timed
+    def remove(self, order_ids: Sequence[str], lines: Sequence[OrderLine] | None = None) -> list[Allocation]:
+        rows = only_lines(self.session.execute(allocations_of_orders(order_ids, for_update=True)), lines)
+
+        for statement, params in deallocation_statements(rows):
+            self.session.execute(statement, params)
+
+        return [allocation_of(row) for row in rows]
+
+
+class AbstractAsyncAllocationRepository(abc.ABC):
+    """
+    Abstract base class for asynchronous repositories of allocations, see AbstractAllocationRepository.
+    """
+
+    @abc.abstractmethod
+    async def find_by_orders(self, order_ids: Sequence[str]) -> list[Allocation]:
+        """
+        Finds the allocations of some orders.
+
+        Args:
+            order_ids (Sequence[str]): The order IDs.
+
+        Returns:
+            list[Allocation]: The allocated lines of those orders, empty if there are none.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def remove(self, order_ids: Sequence[str], lines: Sequence[OrderLine] | None = None) -> list[Allocation]:
+        """
+        Deallocates the lines of some orders from their batches, see AbstractAllocationRepository.remove.
+
+        Args:
+            order_ids (Sequence[str]): The order IDs.
+            lines (Sequence[OrderLine] | None): Only deallocates these lines of the orders, every line when omitted.
+
+        Returns:
+            list[Allocation]: The allocations removed, empty if there were none.
+        """
+        raise NotImplementedError
+
+
+class AsyncSqlAlchemyAllocationRepository(AbstractAsyncAllocationRepository):
+    """
+    SQLAlchemy asyncio repository of allocations.
+
+    Args:
+        session: The SQLAlchemy AsyncSession.
+    """
+
+    kind = Allocation
+
+    def __init__(self, session):
+        self.session = session
+
+    @timed
+    async def find_by_orders(self, order_ids: Sequence[str]) -> list[Allocation]:
+        return [allocation_of(row) for row in await self.session.execute(allocations_of_orders(order_ids))]
+
+    @timed
+    async def remove(self, order_ids: Sequence[str], lines: Sequence[OrderLine] | None = None) -> list[Allocation]:
+        rows = only_lines(await self.session.execute(allocations_of_orders(order_ids, for_update=True)), lines)
+
+        for statement, params in deallocation_statements(rows):
+            await self.session.execute(statement, params)
+
+        return [allocation_of(row) for row in rows]
+
+
+def allocations_of_orders(order_ids: Sequence[str], for_update: bool = False) -> Select:
+    """
+    Selects the allocated lines of some orders together with their batch, through the order ID index.
+
+    Args:
+        order_ids: The order IDs.
+        for_update: Whether to lock the rows selected until the transaction ends, so the same lines cannot be
+            deallocated twice by concurrent transactions: the second one waits, then no longer selects them. SQLite,
+            which locks the whole database to write, ignores it.
+
+    Returns:
+        Select: The statement, ordered by batch and order line so concurrent writers lock rows in the same order.
+    """
+    statement = (
+        select(
+            order_lines.c.id.label("line_id"),
+            order_lines.c.order_id,
+            order_lines.c.sku,
+            order_lines.c.qty,
+            batches.c.id.label("batch_id"),
+            batches.c.reference,
+        )
+        .join_from(order_lines, allocations, allocations.c.orderline_id == order_lines.c.id)
+        .join(batches, batches.c.id == allocations.c.batch_id)
+        .where(order_lines.c.order_id.in_(list(order_ids)))
+        .order_by(batches.c.id, order_lines.c.id)
+    )
+    return statement.with_for_update() if for_update else statement
+
+
+def only_lines(rows, lines: Sequence[OrderLine] | None) -> list[Row]:
+    """
+    Keeps the selected allocations of some order lines.
+
+    Args:
+        rows: The rows selected by allocations_of_orders.
+        lines: The order lines to keep, every one when None.
+
+    Returns:
+        list[Row]: The rows kept.
+    """
+    if lines is None:
+        return list(rows)
+
+    wanted = set(lines)
+    return [row for row in rows if OrderLine(row.order_id, row.sku, row.qty) in wanted]
+
+
+def deallocation_statements(rows: Sequence[Row]) -> list[tuple]:
+    """
+    Builds the set-based statements removing the selected allocations.
+
+    The allocated quantity of each batch is decreased by the sum of its lines in a single executemany, the product
+    versions are incremented in a single UPDATE, then the allocations and their order lines are deleted.
+
+    Args:
+        rows: The rows selected by allocations_of_orders.
+
+    Returns:
+        list[tuple]: The statements and their parameters, to be passed in order to a session's execute.
+    """
+    if not rows:
+        return []
+
+    freed: dict[int, int] = {}
+
+    for row in rows:
+        freed[row.batch_id] = freed.get(row.batch_id, 0) + row.qty
+
+    allocated_quantity = batches.c["_allocated_quantity"]
+    line_ids = [row.line_id for row in rows]
+
+    return [
+        (
+            batches.update()
+            .where(batches.c.id == bindparam("b_id"))
+            .values({allocated_quantity: allocated_quantity - bindparam("freed")}),
+            [{"b_id": batch_id, "freed": qty} for batch_id, qty in freed.items()],
+        ),
+        (
+            products.update()
+            .where(products.c.sku.in_(sorted({row.sku for row in rows})))
+            .values(version_number=products.c.version_number + 1),
+            None,
+        ),
+        (allocations.delete().where(allocations.c.orderline_id.in_(line_ids)), None),
+        (order_lines.delete().where(order_lines.c.id.in_(line_ids)), None),
+    ]
+
+
+def allocation_of(row: Row) -> Allocation:
+    """
+    Maps a row selected by allocations_of_orders to an allocation.
+    """
+    return Allocation(row.order_id, row.sku, row.qty, row.reference)
+
+
+UPSERT_DIALECTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def upsert_statement(
+    kind,
+    dialect: str,
+    entities: Sequence[Any],
+    key: str,
+    update: Sequence[str],
+    increment: Sequence[str] = (),
+    floor: Mapping[str, str] | None = None,
+) -> tuple:
+    """
+    Builds an INSERT ... ON CONFLICT DO UPDATE statement for mapped entities, executed once per entity.
+
+    Args:
+        kind: The mapped entity class.
+        dialect: The name of the database dialect.
+        entities: The entities to save.
+        key: The uniquely indexed attribute identifying an existing entity.
+        update: The attributes overwritten when the entity already exists, none to keep it as is.
+        increment: The attributes incremented when the entity already exists.
+        floor: By overwritten attribute, the existing attribute it may not fall below. The conflicting rows which
+            would are left untouched.
+
+    Returns:
+        tuple: The statement and its parameters, to be passed to a session's execute.
+
+    Raises:
+        NotImplementedError: When the dialect does not support upserts.
+    """
+    if dialect not in UPSERT_DIALECTS:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+
+    mapper = inspect(kind)
+    # Autoincremented keys are left to the database, natural ones are inserted like any other column.
+    columns = {
+        prop.key: prop.columns[0]
+        for prop in mapper.column_attrs
+        if not (prop.columns[0].primary_key and prop.columns[0].autoincrement is True)
+    }
+    rows = [{column.name: getattr(entity, attribute) for attribute, column in columns.items()} for entity in entities]
+
+    statement = UPSERT_DIALECTS[dialect](mapper.local_table)
+
+    if not update and not increment:
+        return statement.on_conflict_do_nothing(index_elements=[columns[key]]), rows
+
+    set_ = {columns[attribute].name: statement.excluded[columns[attribute].name] for attribute in update}
+    set_.update({columns[attribute].name: columns[attribute] + 1 for attribute in increment})
+    where = [
+        statement.excluded[columns[attribute].name] >= columns[lowest] for attribute, lowest in (floor or {}).items()
+    ]
+
+    statement = statement.on_conflict_do_update(
+        index_elements=[columns[key]], set_=set_, where=and_(*where) if where else None
+    )
+
+    return statement, rows
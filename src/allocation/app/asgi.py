@@ -3,25 +3,108 @@ import logging
 
 from fastapi import FastAPI
 
-from allocation.adapters import database
-from allocation.adapters.orm import metadata
+from allocation.adapters import database, migrations, orm
+from allocation.adapters.idempotency import SqlAlchemyIdempotencyStore
+from allocation.adapters.profiling import ProfileStore
 from allocation.app.config.settings import settings
+from allocation.app.middleware import MetricsMiddleware, ProfilingMiddleware, QueryStatsMiddleware
 from allocation.app.router import base_router, root_api_router
 from allocation.app.utils.aiohttp_client import AiohttpClient
+from allocation.entrypoints.responses import json_response_class
+from allocation.service_layer import dependencies
+from allocation.service_layer.allocation_engine import InMemoryAllocationEngine
+from allocation.service_layer.batcher import AllocationBatcher
+from allocation.service_layer.dispatcher import AllocationDispatcher
+from allocation.service_layer.idempotency import IdempotencyCache
+from allocation.service_layer.sku_catalog import SkuCatalog
+from allocation.service_layer.unit_of_work import AsyncSqlAlchemyUnitOfWork, SqlAlchemyUnitOfWork
+from allocation.settings.config import start_logging, stop_logging
 
 log = logging.getLogger(__name__)
 
 
+def allocation_service_factory():
+    """
+    Builds an allocation service outside of a request, for the allocation dispatcher and batcher.
+    """
+    engine, catalog = dependencies.get_allocation_engine(), dependencies.get_sku_catalog()
+
+    if settings.ASYNC_ENDPOINTS:
+        return dependencies.get_async_allocation_service(AsyncSqlAlchemyUnitOfWork(), engine, catalog)
+
+    return dependencies.get_allocation_service(SqlAlchemyUnitOfWork(), engine, catalog)
+
+
 async def on_startup():
     """Define FastAPI startup event handler.
 
     Resources:
         1. https://fastapi.tiangolo.com/advanced/events/#startup-event
     """
+    start_logging(
+        level=settings.LOG_LEVEL,
+        request_level=settings.LOG_REQUEST_LEVEL,
+        request_sample_rate=settings.LOG_REQUEST_SAMPLE_RATE,
+        json_format=settings.LOG_JSON,
+        queue_size=settings.LOG_QUEUE_SIZE,
+    )
     log.debug("Execute FastAPI startup event handler.")
 
-    if settings.USE_SQLITE:
-        metadata.create_all(database.engine)
+    orm.ensure_mappers(settings.ORM_ALLOCATIONS_LOADING)
+
+    # Under gunicorn, the arbiter upgraded the schema before forking this worker, see server.on_starting.
+    if settings.USE_SQLITE and not migrations.upgraded_before_fork():
+        migrations.upgrade(database.engine)
+    else:
+        migrations.check(database.engine)
+
+    database.warm_up(database.engine, settings.DB_POOL_WARMUP)
+
+    if settings.ASYNC_ENDPOINTS:
+        await database.warm_up_async(database.async_engine, settings.DB_POOL_WARMUP)
+
+    if settings.ALLOCATION_ENGINE == "memory":
+        engine = InMemoryAllocationEngine(
+            SqlAlchemyUnitOfWork,
+            queue_size=settings.WRITE_BEHIND_QUEUE_SIZE,
+            flush_size=settings.WRITE_BEHIND_FLUSH_SIZE,
+        )
+        dependencies.start_allocation_engine(engine)
+
+    if settings.SKU_CATALOG != "off":
+        catalog = SkuCatalog(
+            SqlAlchemyUnitOfWork,
+            bloom=settings.SKU_CATALOG == "bloom",
+            error_rate=settings.SKU_CATALOG_ERROR_RATE,
+            ttl=settings.SKU_CATALOG_TTL or None,
+        )
+        dependencies.start_sku_catalog(catalog)
+
+    if settings.IDEMPOTENCY_CACHE_SIZE:
+        cache = IdempotencyCache(
+            SqlAlchemyIdempotencyStore(database.engine),
+            max_size=settings.IDEMPOTENCY_CACHE_SIZE,
+            ttl=settings.IDEMPOTENCY_TTL,
+        )
+        dependencies.start_idempotency_cache(cache)
+
+    if settings.PROFILING_ENABLED:
+        dependencies.start_profile_store(ProfileStore(settings.PROFILING_DIR, settings.PROFILING_MAX_PROFILES))
+
+    if settings.ALLOCATION_WORKERS:
+        dispatcher = AllocationDispatcher(
+            allocation_service_factory,
+            workers=settings.ALLOCATION_WORKERS,
+            queue_size=settings.ALLOCATION_QUEUE_SIZE,
+        )
+        await dependencies.start_allocation_dispatcher(dispatcher)
+    elif settings.ALLOCATION_BATCH_WINDOW_MS:
+        batcher = AllocationBatcher(
+            allocation_service_factory,
+            window=settings.ALLOCATION_BATCH_WINDOW_MS / 1000,
+            max_size=settings.ALLOCATION_BATCH_SIZE,
+        )
+        await dependencies.start_allocation_batcher(batcher)
 
     AiohttpClient.get_aiohttp_client()
 
@@ -33,7 +116,15 @@ async def on_shutdown():
     """
     log.debug("Execute FastAPI shutdown event handler.")
 
+    await dependencies.stop_allocation_dispatcher()
+    await dependencies.stop_allocation_batcher()
+    dependencies.stop_allocation_engine()
+    dependencies.stop_sku_catalog()
+    dependencies.stop_idempotency_cache()
+    dependencies.stop_profile_store()
     await AiohttpClient.close_aiohttp_client()
+    await database.async_engine.dispose()
+    stop_logging()
 
 
 def get_application() -> FastAPI:
@@ -49,10 +140,29 @@ def get_application() -> FastAPI:
         debug=settings.DEBUG,
         version=settings.VERSION,
         docs_url=settings.DOCS_URL,
+        default_response_class=json_response_class(settings.JSON_RESPONSE),
         on_startup=[on_startup],
         on_shutdown=[on_shutdown],
     )
 
+    if settings.DEBUG or settings.QUERY_WARN_STATEMENTS or settings.QUERY_WARN_REPEATS:
+        app.add_middleware(
+            QueryStatsMiddleware,
+            headers=settings.DEBUG,
+            max_statements=settings.QUERY_WARN_STATEMENTS,
+            max_repeats=settings.QUERY_WARN_REPEATS,
+        )
+
+    # Only profiles requests once a profile store is started, i.e. when PROFILING_ENABLED.
+    app.add_middleware(
+        ProfilingMiddleware,
+        sample_rate=settings.PROFILING_SAMPLE_RATE,
+        interval=settings.PROFILING_INTERVAL_MS / 1000,
+    )
+
+    if settings.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+
     log.debug("Add application routes.")
 
     app.include_router(base_router)
@@ -14,14 +14,183 @@ class Application(BaseSettings):
         * FASTAPI_PROJECT_NAME
         * FASTAPI_VERSION
         * FASTAPI_DOCS_URL
+        * FASTAPI_JSON_RESPONSE
         * FASTAPI_USE_SQLITE
+        * FASTAPI_ORM_ALLOCATIONS_LOADING
+        * FASTAPI_ASYNC_ENDPOINTS
+        * FASTAPI_INGESTION_CHUNK_SIZE
+        * FASTAPI_INGESTION_MAX_LINE_LENGTH
+        * FASTAPI_DATABASE_URL
+        * FASTAPI_ASYNC_DATABASE_URL
+        * FASTAPI_DB_POOL_SIZE
+        * FASTAPI_DB_MAX_OVERFLOW
+        * FASTAPI_DB_POOL_RECYCLE
+        * FASTAPI_DB_POOL_PRE_PING
+        * FASTAPI_DB_POOL_WARMUP
+        * FASTAPI_DB_STATEMENT_CACHE_SIZE
+        * FASTAPI_QUERY_WARN_STATEMENTS
+        * FASTAPI_QUERY_WARN_REPEATS
+        * FASTAPI_SQLITE_JOURNAL_MODE
+        * FASTAPI_SQLITE_SYNCHRONOUS
+        * FASTAPI_SQLITE_BUSY_TIMEOUT
+        * FASTAPI_SQLITE_CACHE_SIZE
+        * FASTAPI_SQLITE_PRAGMAS
+        * FASTAPI_ALLOCATION_ENGINE
+        * FASTAPI_WRITE_BEHIND_QUEUE_SIZE
+        * FASTAPI_WRITE_BEHIND_FLUSH_SIZE
+        * FASTAPI_SKU_CATALOG
+        * FASTAPI_SKU_CATALOG_TTL
+        * FASTAPI_SKU_CATALOG_ERROR_RATE
+        * FASTAPI_ALLOCATION_RETRIES
+        * FASTAPI_ALLOCATION_RETRY_BACKOFF
+        * FASTAPI_ALLOCATION_WORKERS
+        * FASTAPI_ALLOCATION_QUEUE_SIZE
+        * FASTAPI_ALLOCATION_BATCH_WINDOW_MS
+        * FASTAPI_ALLOCATION_BATCH_SIZE
+        * FASTAPI_IDEMPOTENCY_CACHE_SIZE
+        * FASTAPI_IDEMPOTENCY_TTL
+        * FASTAPI_METRICS_ENABLED
+        * FASTAPI_PROFILING_ENABLED
+        * FASTAPI_PROFILING_SAMPLE_RATE
+        * FASTAPI_PROFILING_INTERVAL_MS
+        * FASTAPI_PROFILING_DIR
+        * FASTAPI_PROFILING_MAX_PROFILES
+        * FASTAPI_ADMIN_TOKEN
+        * FASTAPI_LOG_LEVEL
+        * FASTAPI_LOG_REQUEST_LEVEL
+        * FASTAPI_LOG_REQUEST_SAMPLE_RATE
+        * FASTAPI_LOG_JSON
+        * FASTAPI_LOG_QUEUE_SIZE
+        * FASTAPI_SERVER_BIND
+        * FASTAPI_SERVER_WORKERS
+        * FASTAPI_SERVER_LOOP
+        * FASTAPI_SERVER_HTTP
+        * FASTAPI_SERVER_BACKLOG
+        * FASTAPI_SERVER_KEEPALIVE
+        * FASTAPI_SERVER_MAX_REQUESTS
+        * FASTAPI_SERVER_GRACEFUL_TIMEOUT
+        * FASTAPI_SERVER_PRELOAD
     Attributes:
         DEBUG (bool): FastAPI logging level. You should disable this for
             production.
         PROJECT_NAME (str): FastAPI project name.
         VERSION (str): Application version.
         DOCS_URL (str): Path where swagger ui will be served at.
+        JSON_RESPONSE (str): Encoder of the JSON responses: json, the standard
+            library, or orjson, which needs the orjson package.
         USE_SQLITE (bool): Whether to use SQLite DB.
+        ORM_ALLOCATIONS_LOADING (str): Loading strategy of the batch allocations
+            relationship: select, selectin, joined or subquery. It applies to
+            batches loaded on their own, e.g. to deallocate, the batches of a
+            product being loaded without their allocations. The asynchronous
+            endpoints, which cannot lazy load, use selectin instead of select.
+        ASYNC_ENDPOINTS (bool): Whether to serve the API with the asynchronous
+            endpoints and unit of work, instead of the threadpool ones.
+        INGESTION_CHUNK_SIZE (int): How many batches of an ingested feed are
+            written per transaction.
+        INGESTION_MAX_LINE_LENGTH (int): Bytes a line of an ingested feed may
+            take at most, longer ones are rejected rather than buffered.
+        DATABASE_URL (str): SQLAlchemy URL of the database.
+        ASYNC_DATABASE_URL (str): SQLAlchemy URL of the same database, with an
+            asyncio driver.
+        DB_POOL_SIZE (int): Connections kept open in the pool.
+        DB_MAX_OVERFLOW (int): Connections opened beyond the pool size under load.
+        DB_POOL_RECYCLE (int): Seconds after which a connection is replaced, -1
+            to keep them.
+        DB_POOL_PRE_PING (bool): Whether to test connections on checkout.
+        DB_POOL_WARMUP (int): Connections opened at startup, so the first
+            requests do not pay for them.
+        DB_STATEMENT_CACHE_SIZE (int): Compiled statements cached per engine.
+        QUERY_WARN_STATEMENTS (int): Statements a request may execute before
+            a warning is logged. 0, the default, disables the warning, as
+            bulk allocation and batch ingestion execute many by design. In
+            debug mode, the statements and the time spent on them are also
+            returned in the X-DB-Statements and X-DB-Time-Ms response headers.
+        QUERY_WARN_REPEATS (int): Times a request may execute the same
+            statement before an N+1 warning is logged. 0, the default,
+            disables it, as bulk allocation loads a product per SKU and
+            ingestion upserts a chunk at a time with the same statements.
+        SQLITE_JOURNAL_MODE (str): SQLite journal mode. WAL lets readers run
+            concurrently with a writer.
+        SQLITE_SYNCHRONOUS (str): SQLite synchronous mode. NORMAL only syncs
+            the WAL on checkpoints.
+        SQLITE_BUSY_TIMEOUT (int): Milliseconds SQLite waits on a locked
+            database before failing.
+        SQLITE_CACHE_SIZE (int): SQLite page cache per connection, in pages,
+            or in KiB when negative.
+        SQLITE_PRAGMAS (dict): Additional SQLite pragmas applied on connect,
+            e.g. {"mmap_size": 268435456}.
+        ALLOCATION_ENGINE (str): Where order lines are allocated: "database",
+            or "memory" for the in-process engine with write-behind persistence.
+            The memory engine must be the only writer of the database.
+        WRITE_BEHIND_QUEUE_SIZE (int): Allocations of the memory engine which
+            may wait to be persisted.
+        WRITE_BEHIND_FLUSH_SIZE (int): Allocations of the memory engine
+            persisted per transaction at most.
+        SKU_CATALOG (str): How known SKUs are cached to reject unknown ones
+            without querying the database: "off", "set" or "bloom". Batches
+            added by other processes are only seen once the catalog expires.
+        SKU_CATALOG_TTL (float): Seconds after which the SKU catalog is
+            reloaded, 0 to keep it. Required with several server workers.
+        SKU_CATALOG_ERROR_RATE (float): False positive rate of the bloom SKU
+            catalog.
+        ALLOCATION_RETRIES (int): How many times an allocation is retried when
+            its product was changed concurrently.
+        ALLOCATION_RETRY_BACKOFF (float): Seconds waited before the first
+            retry at most, doubled on every following one.
+        ALLOCATION_WORKERS (int): Number of SKU-affine workers allocating the
+            order lines of the allocation endpoint, 0 to allocate them in each
+            request.
+        ALLOCATION_QUEUE_SIZE (int): Order lines which may wait for each
+            allocation worker.
+        ALLOCATION_BATCH_WINDOW_MS (float): Milliseconds during which the
+            order lines of the allocation endpoint are grouped, to be allocated
+            with a single commit. 0 commits each one on its own. Ignored when
+            ALLOCATION_WORKERS is set.
+        ALLOCATION_BATCH_SIZE (int): Order lines grouped at most.
+        IDEMPOTENCY_CACHE_SIZE (int): Outcomes of allocations kept in memory
+            to replay retries, by Idempotency-Key header or else by order line.
+            They are also stored in the database, at the cost of a read and a
+            write per allocation. 0, the default, only relies on retried order
+            lines being found allocated already.
+        IDEMPOTENCY_TTL (float): Seconds after which a stored outcome is no
+            longer replayed.
+        METRICS_ENABLED (bool): Whether requests are measured and the metrics
+            exposed at /metrics in the Prometheus text format. They are kept
+            per server worker, see allocation.app.server.
+        PROFILING_ENABLED (bool): Whether requests sent with an X-Profile: 1
+            header and the admin token, and sampled ones, are profiled. Their
+            profiles are listed and downloaded at /api/v1/profiles.
+        PROFILING_SAMPLE_RATE (float): Fraction of the other requests profiled.
+        PROFILING_INTERVAL_MS (float): Milliseconds between stack samples.
+        PROFILING_DIR (str): Directory the profiles are stored in.
+        PROFILING_MAX_PROFILES (int): Profiles kept, the oldest are deleted.
+        ADMIN_TOKEN (str): Shared secret sent in the X-Admin-Token header to
+            profile a request on demand, and to list and download profiles.
+            Both are refused while it is empty.
+        LOG_LEVEL (str): Level of the package loggers.
+        LOG_REQUEST_LEVEL (str): Level of the lines logged on every allocation
+            request.
+        LOG_REQUEST_SAMPLE_RATE (float): Fraction of those lines logged below
+            WARNING.
+        LOG_JSON (bool): Whether records are written as JSON objects, one per
+            line, rather than text.
+        LOG_QUEUE_SIZE (int): Records which may wait to be written by the
+            logging thread, the others are dropped. 0 for no limit.
+        SERVER_BIND (str): Address the production server listens on.
+        SERVER_WORKERS (int): Worker processes of the production server, 0 for
+            one per CPU available.
+        SERVER_LOOP (str): Event loop of the workers: auto, asyncio or uvloop.
+        SERVER_HTTP (str): HTTP parser of the workers: auto, h11 or httptools.
+        SERVER_BACKLOG (int): Connections which may wait to be accepted.
+        SERVER_KEEPALIVE (int): Seconds an idle keep-alive connection is kept.
+        SERVER_MAX_REQUESTS (int): Requests after which a worker is gracefully
+            replaced, give or take a tenth so they are not all replaced at
+            once. 0 keeps the workers.
+        SERVER_GRACEFUL_TIMEOUT (int): Seconds a stopping worker may take to
+            finish the requests it is handling.
+        SERVER_PRELOAD (bool): Whether the application is loaded before
+            forking the workers, sharing its memory.
     """
 
     DEBUG: bool = True
@@ -29,7 +198,62 @@ class Application(BaseSettings):
     PROJECT_DESCRIPTION: str = "This service is responsible for allocating line orders on batch operations."
     VERSION: str = __version__
     DOCS_URL: str = "/docs"
+    JSON_RESPONSE: str = "json"
     USE_SQLITE: bool = True
+    ORM_ALLOCATIONS_LOADING: str = "selectin"
+    ASYNC_ENDPOINTS: bool = False
+    INGESTION_CHUNK_SIZE: int = 1000
+    INGESTION_MAX_LINE_LENGTH: int = 65536
+    DATABASE_URL: str = "sqlite:///./sql_app.db"
+    ASYNC_DATABASE_URL: str = "sqlite+aiosqlite:///./sql_app.db"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE: int = -1
+    DB_POOL_PRE_PING: bool = False
+    DB_POOL_WARMUP: int = 0
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    QUERY_WARN_STATEMENTS: int = 0
+    QUERY_WARN_REPEATS: int = 0
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT: int = 5000
+    SQLITE_CACHE_SIZE: int = -20000
+    SQLITE_PRAGMAS: dict[str, str | int] = {}
+    ALLOCATION_ENGINE: str = "database"
+    WRITE_BEHIND_QUEUE_SIZE: int = 10000
+    WRITE_BEHIND_FLUSH_SIZE: int = 100
+    SKU_CATALOG: str = "off"
+    SKU_CATALOG_TTL: float = 0
+    SKU_CATALOG_ERROR_RATE: float = 0.01
+    ALLOCATION_RETRIES: int = 3
+    ALLOCATION_RETRY_BACKOFF: float = 0.01
+    ALLOCATION_WORKERS: int = 0
+    ALLOCATION_QUEUE_SIZE: int = 1000
+    ALLOCATION_BATCH_WINDOW_MS: float = 0
+    ALLOCATION_BATCH_SIZE: int = 100
+    IDEMPOTENCY_CACHE_SIZE: int = 0
+    IDEMPOTENCY_TTL: float = 86400
+    METRICS_ENABLED: bool = True
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0
+    PROFILING_INTERVAL_MS: float = 2
+    PROFILING_DIR: str = "profiles"
+    PROFILING_MAX_PROFILES: int = 50
+    ADMIN_TOKEN: str = ""
+    LOG_LEVEL: str = "INFO"
+    LOG_REQUEST_LEVEL: str = "INFO"
+    LOG_REQUEST_SAMPLE_RATE: float = 1.0
+    LOG_JSON: bool = False
+    LOG_QUEUE_SIZE: int = 10000
+    SERVER_BIND: str = "0.0.0.0:8000"
+    SERVER_WORKERS: int = 0
+    SERVER_LOOP: str = "auto"
+    SERVER_HTTP: str = "auto"
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE: int = 5
+    SERVER_MAX_REQUESTS: int = 0
+    SERVER_GRACEFUL_TIMEOUT: int = 30
+    SERVER_PRELOAD: bool = False
 
     # All your additional application configuration should go either here or in
     # separate file in this submodule.
@@ -0,0 +1,195 @@
+"""Application middleware.
+
+Every middleware is a plain ASGI middleware, so the response body is streamed through untouched. MetricsMiddleware
+measures every HTTP request, at the cost of a couple of clock reads and counter updates per request,
+QueryStatsMiddleware tracks the SQL statements each request executes and ProfilingMiddleware profiles requests on
+demand.
+"""
+import asyncio
+import logging
+import random
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from allocation.adapters.metrics import REGISTRY
+from allocation.adapters.profiling import SamplingProfiler
+from allocation.adapters.query_stats import QueryStats, track_queries
+from allocation.app.utils.admin import is_admin
+from allocation.service_layer import dependencies
+
+log = logging.getLogger(__name__)
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Seconds spent handling HTTP requests.", labels=("method", "route")
+)
+REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests handled.", labels=("method", "route", "status"))
+IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests being handled.", labels=("method",))
+
+
+class MetricsMiddleware:
+    """
+    Measures the latency, status and concurrency of HTTP requests.
+
+    Requests are labelled by the path template of the route which handled them, e.g. /api/v1/orders/{order_id}, so
+    the number of series does not grow with the IDs requested. Requests matching no route are labelled unmatched.
+
+    Args:
+        app: The ASGI application.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        in_flight = IN_FLIGHT.labels(method)
+
+        async def send_status(message: Message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight.dec()
+            # The router stores the route matched in the scope, which the application shares with this middleware.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(method, route).observe(elapsed)
+            REQUESTS.labels(method, route, str(status)).inc()
+
+
+class QueryStatsMiddleware:
+    """
+    Tracks the SQL statements executed while handling each HTTP request, see query_stats.
+
+    A warning is logged when a request executes too many statements, or the same statement too many times, which is
+    how N+1 loading shows. Statements executed by background workers, e.g. the allocation dispatcher, are not
+    attributed to the request waiting for them.
+
+    Args:
+        app: The ASGI application.
+        headers: Whether to return the statements and the milliseconds spent on them in the X-DB-Statements and
+            X-DB-Time-Ms response headers, counted until the response starts.
+        max_statements: Statements a request may execute without a warning, 0 for no limit.
+        max_repeats: Times a request may execute the same statement without a warning, 0 for no limit.
+    """
+
+    def __init__(self, app: ASGIApp, headers: bool = False, max_statements: int = 0, max_repeats: int = 0):
+        self.app = app
+        self.headers = headers
+        self.max_statements = max_statements
+        self.max_repeats = max_repeats
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+
+            async def send_stats(message: Message):
+                if self.headers and message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers["X-DB-Statements"] = str(stats.statements)
+                    headers["X-DB-Time-Ms"] = f"{stats.seconds * 1000:.3f}"
+
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_stats)
+            finally:
+                self._warn(scope, stats)
+
+    def _warn(self, scope: Scope, stats: QueryStats):
+        statement, repeats = stats.most_repeated()
+
+        if self.max_statements and stats.statements > self.max_statements:
+            log.warning(
+                "%s %s executed %d statements in %.2f ms",
+                scope["method"],
+                scope["path"],
+                stats.statements,
+                stats.seconds * 1000,
+            )
+
+        if self.max_repeats and repeats > self.max_repeats:
+            log.warning(
+                "%s %s executed a statement %d times, likely N+1 loading: %s",
+                scope["method"],
+                scope["path"],
+                repeats,
+                statement,
+            )
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the HTTP requests sent with an X-Profile: 1 header and the admin token, and a fraction of the others,
+    see profiling.
+
+    The profile is stored once the request is handled, and its ID returned in the X-Profile-Id response header.
+    Requests pass through untouched while no profile store is started.
+
+    Args:
+        app: The ASGI application.
+        sample_rate: Fraction of the requests without the header profiled.
+        interval: Seconds between stack samples.
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float = 0.0, interval: float = 0.002):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.interval = interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        store = dependencies.get_profile_store()
+
+        if scope["type"] != "http" or store is None or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        # Reserved before the response starts, so its ID can be returned while the profile is still being taken.
+        profile_id = store.new_id()
+
+        async def send_profile_id(message: Message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile_id
+
+            await send(message)
+
+        profiler = SamplingProfiler(self.interval)
+        start = time.perf_counter()
+
+        try:
+            with profiler:
+                await self.app(scope, receive, send_profile_id)
+        finally:
+            seconds = time.perf_counter() - start
+            await asyncio.to_thread(store.save, profile_id, profiler, scope["method"], scope["path"], status, seconds)
+
+    def _wanted(self, scope: Scope) -> bool:
+        headers = Headers(scope=scope)
+
+        if headers.get("x-profile") == "1" and is_admin(headers):
+            return True
+
+        return self.sample_rate > 0 and random.random() < self.sample_rate
@@ -6,14 +6,25 @@ Resources:
 """
 from fastapi import APIRouter
 
-from allocation.entrypoints import allocation, base, batch
+from allocation.app.config.settings import settings
+from allocation.entrypoints import allocation, base, batch, batcher, catalog, dispatcher, metrics, profiles
 
 root_api_router = APIRouter(prefix="/api")
 base_router = APIRouter()
 
 # Base Routers
 base_router.include_router(base.router)
+base_router.include_router(metrics.router)
 
 # API Routers
-root_api_router.include_router(batch.router)
-root_api_router.include_router(allocation.router)
+root_api_router.include_router(catalog.router)
+root_api_router.include_router(dispatcher.router)
+root_api_router.include_router(batcher.router)
+root_api_router.include_router(profiles.router)
+
+if settings.ASYNC_ENDPOINTS:
+    root_api_router.include_router(batch.async_router)
+    root_api_router.include_router(allocation.async_router)
+else:
+    root_api_router.include_router(batch.router)
+    root_api_router.include_router(allocation.router)
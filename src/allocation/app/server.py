@@ -0,0 +1,114 @@
+"""Production Server
+
+This module configures gunicorn to serve the application from several uvicorn worker processes, one per CPU by
+default, see the SERVER_* settings.
+
+The schema of a SQLite database is upgraded once by the arbiter, before the workers start, rather than by every worker
+at once: the workers forked from it only check the schema version. Each worker replaces the database connection pools it
+inherited when it is forked, so workers never share a connection. The in-memory state of the application, e.g. the SKU
+catalog, the idempotency cache and the metrics, is kept per worker, so a SKU catalog must expire to see the batches
+added through the other workers.
+
+The metrics are not aggregated across workers: each scrape of /metrics is answered by whichever worker accepts the
+connection, so its counters seem to jump back and forth. To scrape every worker, run a single one per container,
+with FASTAPI_SERVER_WORKERS=1, and scale the containers instead, letting Prometheus discover and scrape each of them
+and aggregate with sum(). Otherwise rely on the rates of several scrapes only, or disable FASTAPI_METRICS_ENABLED.
+
+Usage:
+    allocation-serve [gunicorn options]
+    gunicorn --config python:allocation.app.server allocation.main:app
+"""
+import os
+import sys
+
+from allocation.adapters import database, migrations
+from allocation.app.config.settings import Application, settings
+
+APP = "allocation.main:app"
+
+
+def cpu_count() -> int:
+    """
+    Returns the number of CPUs this process may run on, which a container may limit.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def server_options(app_settings: Application = settings) -> dict:
+    """
+    Builds the gunicorn settings.
+
+    Args:
+        app_settings: The application settings.
+
+    Returns:
+        dict: The value of each gunicorn setting.
+
+    Raises:
+        ValueError: If several workers would run the memory allocation engine, or a SKU catalog which never expires.
+    """
+    workers = app_settings.SERVER_WORKERS or cpu_count()
+
+    if app_settings.ALLOCATION_ENGINE == "memory" and workers > 1:
+        raise ValueError("The memory allocation engine must be the only writer of the database, run a single worker")
+
+    if app_settings.SKU_CATALOG != "off" and not app_settings.SKU_CATALOG_TTL and workers > 1:
+        raise ValueError(
+            "The SKU catalog of a worker never sees the batches added through the others unless it expires, "
+            "set SKU_CATALOG_TTL or run a single worker"
+        )
+
+    return {
+        "bind": app_settings.SERVER_BIND,
+        "workers": workers,
+        "worker_class": "allocation.app.workers.UvicornWorker",
+        "backlog": app_settings.SERVER_BACKLOG,
+        "keepalive": app_settings.SERVER_KEEPALIVE,
+        "max_requests": app_settings.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": app_settings.SERVER_MAX_REQUESTS // 10,
+        "graceful_timeout": app_settings.SERVER_GRACEFUL_TIMEOUT,
+        "preload_app": app_settings.SERVER_PRELOAD,
+    }
+
+
+def on_starting(server):
+    """
+    Upgrades the SQLite schema before the workers start, see the gunicorn server hooks.
+    """
+    if settings.METRICS_ENABLED and server.num_workers > 1:
+        server.log.warning("Metrics are kept per worker, each scrape of /metrics reads a single one of them")
+
+    if settings.USE_SQLITE:
+        migrations.upgrade_before_fork(database.engine)
+
+
+def post_fork(server, worker):
+    """
+    Replaces the connection pools inherited by a new worker, see the gunicorn server hooks.
+    """
+    database.reset_after_fork()
+
+
+def main(argv: list[str] | None = None):
+    """
+    Runs gunicorn with this configuration, passing it the command line options.
+
+    Args:
+        argv: The gunicorn options, the command line ones by default.
+    """
+    # gunicorn is only needed to serve, not to import the configuration.
+    from gunicorn.app.wsgiapp import run  # pylint: disable=import-outside-toplevel
+
+    options = sys.argv[1:] if argv is None else argv
+    sys.argv = ["allocation-serve", "--config", "python:allocation.app.server", *options, APP]
+    run()
+
+
+# gunicorn reads its settings from the variables of this module.
+globals().update(server_options())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Administration access.
+
+Operations which expose the internals of the service, e.g. profiling requests, are only allowed to the requests
+carrying the shared admin token in an X-Admin-Token header, see the ADMIN_TOKEN setting.
+"""
+import secrets
+from typing import Mapping
+
+from allocation.app.config.settings import settings
+
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+
+def is_admin(headers: Mapping[str, str]) -> bool:
+    """
+    Checks whether a request carries the admin token, never the case while no token is set.
+
+    Args:
+        headers: The request headers, looked up case-insensitively.
+
+    Returns:
+        bool: True if the request carries the admin token.
+    """
+    token = settings.ADMIN_TOKEN
+    return bool(token) and secrets.compare_digest(headers.get(ADMIN_TOKEN_HEADER, "").encode(), token.encode())
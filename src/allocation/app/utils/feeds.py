@@ -0,0 +1,147 @@
+"""Incremental parsers for uploaded feeds.
+
+Records are parsed one line at a time as the body is received, so memory use does not depend on the upload size.
+Supported formats are NDJSON (one JSON object per line) and CSV with a header row and one record per line. Lines
+which are not valid UTF-8, or too long to be buffered, are reported as errors in place of their records.
+"""
+import csv
+import json
+from typing import AsyncIterator, Callable
+
+# Bytes a line may take at most, as it is buffered until its end is received.
+MAX_LINE_LENGTH = 65536
+
+Record = dict | ValueError
+
+Line = str | ValueError
+
+
+def decode_line(line: bytes, max_length: int) -> Line:
+    """
+    Decodes a line as UTF-8, without its carriage return.
+
+    Args:
+        line: The line, without its line feed.
+        max_length: Bytes the line may take at most.
+
+    Returns:
+        Line: The decoded line, or the error which prevented its decoding.
+    """
+    if len(line) > max_length:
+        return ValueError(f"Line longer than {max_length} bytes")
+
+    try:
+        return line.decode().rstrip("\r")
+    except UnicodeDecodeError as e:
+        return ValueError(f"Line is not valid UTF-8, {e.reason} at byte {e.start}")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_length: int = MAX_LINE_LENGTH) -> AsyncIterator[Line]:
+    """
+    Splits a stream of bytes into decoded lines.
+
+    Args:
+        chunks: The body chunks, as received.
+        max_length: Bytes a line may take at most. The rest of a longer line is dropped, rather than buffered.
+
+    Yields:
+        Line: Each line, without its line terminator, or the error which prevented its decoding.
+    """
+    buffer = b""
+    skipping = False
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+
+        for line in lines:
+            if skipping:
+                # The end of a line already reported as too long.
+                skipping = False
+                continue
+
+            yield decode_line(line, max_length)
+
+        if len(buffer) > max_length:
+            if not skipping:
+                yield ValueError(f"Line longer than {max_length} bytes")
+                skipping = True
+
+            buffer = b""
+
+    if buffer and not skipping:
+        yield decode_line(buffer, max_length)
+
+
+async def parse_ndjson(lines: AsyncIterator[Line]) -> AsyncIterator[tuple[int, Record]]:
+    """
+    Parses NDJSON lines, skipping blank ones.
+
+    Args:
+        lines: The lines of the feed.
+
+    Yields:
+        tuple[int, Record]: The line number and its record, or the error which prevented its parsing.
+    """
+    number = 0
+
+    async for line in lines:
+        number += 1
+
+        if isinstance(line, ValueError):
+            yield number, line
+            continue
+
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, e
+            continue
+
+        yield number, record if isinstance(record, dict) else ValueError("Expected a JSON object")
+
+
+async def parse_csv(lines: AsyncIterator[Line]) -> AsyncIterator[tuple[int, Record]]:
+    """
+    Parses CSV lines, the first one being the header. Empty values are read as missing.
+
+    Args:
+        lines: The lines of the feed.
+
+    Yields:
+        tuple[int, Record]: The line number and its record, or the error which prevented its parsing.
+    """
+    header: list[str] | None = None
+    number = 0
+
+    async for line in lines:
+        number += 1
+
+        if isinstance(line, ValueError):
+            yield number, line
+            continue
+
+        if not line.strip():
+            continue
+
+        values = next(csv.reader([line]))
+
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+
+        if len(values) != len(header):
+            yield number, ValueError(f"Expected {len(header)} values, got {len(values)}")
+            continue
+
+        yield number, {name: value or None for name, value in zip(header, values)}
+
+
+PARSERS: dict[str, Callable[[AsyncIterator[Line]], AsyncIterator[tuple[int, Record]]]] = {
+    "application/x-ndjson": parse_ndjson,
+    "application/jsonl": parse_ndjson,
+    "text/csv": parse_csv,
+}
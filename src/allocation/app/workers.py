@@ -0,0 +1,15 @@
+"""Server Workers
+
+The uvicorn worker run by the production server, see server.
+"""
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+from allocation.app.config.settings import settings
+
+
+class UvicornWorker(BaseUvicornWorker):
+    """
+    Runs the application with the event loop and HTTP parser chosen in the SERVER_LOOP and SERVER_HTTP settings.
+    """
+
+    CONFIG_KWARGS = {"loop": settings.SERVER_LOOP, "http": settings.SERVER_HTTP}
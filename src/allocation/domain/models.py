@@ -22,6 +22,24 @@ class OrderLine:
     qty: int
 
 
+@dataclass(frozen=True)
+class Allocation:
+    """
+    Represents an order line allocated to a batch.
+
+    Attributes:
+        order_id (str): The order ID.
+        sku (str): The SKU.
+        qty (int): The quantity.
+        reference (str): The reference of the batch.
+    """
+
+    order_id: str
+    sku: str
+    qty: int
+    reference: str
+
+
 class Batch:
     """
     Represents Batch of a Stock.
@@ -37,6 +55,7 @@ class Batch:
         self.sku: str = sku
         self.eta: date | None = eta
         self._purchased_quantity = qty
+        self._allocated_quantity = 0
         self._allocations: set[OrderLine] = set()
 
     def allocate(self, line: OrderLine):
@@ -46,8 +65,9 @@ class Batch:
         Args:
             line (OrderLine): The line to allocate.
         """
-        if self.can_allocate(line):
+        if self.can_allocate(line) and line not in self._allocations:
             self._allocations.add(line)
+            self._allocated_quantity += line.qty
 
     def deallocate(self, line: OrderLine):
         """
@@ -58,6 +78,7 @@ class Batch:
         """
         if line in self._allocations:
             self._allocations.remove(line)
+            self._allocated_quantity -= line.qty
 
     def can_allocate(self, line: OrderLine) -> bool:
         """
@@ -74,12 +95,12 @@ class Batch:
     @property
     def allocated_quantity(self) -> int:
         """
-        Sums the quantities of the allocated lines.
+        The sum of the quantities of the allocated lines, kept up to date on every allocation.
 
         Returns:
             int: the quantity allocated.
         """
-        return sum(line.qty for line in self._allocations)
+        return self._allocated_quantity
 
     @property
     def available_quantity(self) -> int:
@@ -105,3 +126,49 @@ class Batch:
         if other.eta is None:
             return True
         return self.eta > other.eta
+
+
+class Product:
+    """
+    Represents the batches of a SKU, the consistency boundary of allocations.
+
+    Every change to a product increments its version number, so concurrent changes to the same SKU are detected
+    when the second one is committed, while changes to different SKUs do not contend.
+
+    Attributes:
+        sku (str): The SKU.
+        batches (list[Batch]): The batches of the SKU.
+        version_number (int): Incremented on every allocation.
+    """
+
+    def __init__(self, sku: str, batches: list[Batch] | None = None, version_number: int = 0):
+        self.sku: str = sku
+        self.batches: list[Batch] = batches if batches is not None else []
+        self.version_number: int = version_number
+
+    def allocate(self, line: OrderLine) -> str | None:
+        """
+        Allocates a line to the earliest batch it fits in.
+
+        Args:
+            line (OrderLine): The line to allocate.
+
+        Returns:
+            str | None: The reference of the batch allocated, None if there is no stock available.
+        """
+        batch = next((batch for batch in sorted(self.batches) if batch.can_allocate(line)), None)
+
+        if batch is None:
+            return None
+
+        batch.allocate(line)
+        self.version_number += 1
+        return batch.reference
+
+    def __eq__(self, other):
+        if not isinstance(other, Product):
+            return False
+        return other.sku == self.sku
+
+    def __hash__(self):
+        return hash(self.sku)
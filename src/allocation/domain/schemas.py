@@ -3,6 +3,7 @@ This module contains the schemas used for request/response validation in the all
 """
 from datetime import date
 from re import sub
+from typing import Any
 
 from pydantic import BaseConfig, BaseModel, Field, validator
 
@@ -27,6 +28,21 @@ class CamelCaseModel(BaseModel):
         alias_generator = to_camel
         allow_population_by_field_name = True
 
+    @classmethod
+    def serialize(cls, obj: Any) -> dict:
+        """
+        Maps the attributes of an object to the aliases of the model fields, without validating them.
+
+        Only meant for objects of the domain, whose attributes already have the types of the fields.
+
+        Args:
+            obj: An object with an attribute per field.
+
+        Returns:
+            dict: The JSON object.
+        """
+        return {field.alias: getattr(obj, name) for name, field in cls.__fields__.items()}
+
 
 class OrderLine(CamelCaseModel):
     """
@@ -79,3 +95,125 @@ class BatchIn(CamelCaseModel):
             raise ValueError("Quantity must be greater than zero.")
 
         return v
+
+
+class BatchOut(BatchIn):
+    """
+    Represents a batch added.
+    """
+
+
+class BatchReference(CamelCaseModel):
+    """
+    Represents the batch an order line was allocated to, or deallocated from.
+    """
+
+    reference: str = Field(description="The reference of the batch.")
+
+
+class AllocationResult(CamelCaseModel):
+    """
+    Represents the outcome of allocating one of many order lines.
+    """
+
+    order_id: str
+    sku: str
+    qty: int
+    reference: str | None = Field(description="The reference of the batch allocated.")
+    error: str | None = Field(description="Why it was not allocated: InvalidSku, OutOfStock or NoBatchesAvailable.")
+
+
+class Allocation(CamelCaseModel):
+    """
+    Represents an order line allocated to a batch.
+    """
+
+    order_id: str
+    sku: str
+    qty: int
+    reference: str = Field(description="The reference of the batch.")
+
+
+class RejectedRecord(CamelCaseModel):
+    """
+    Represents a record of an ingested feed which could not be parsed.
+    """
+
+    line: int = Field(description="The line number of the record in the feed.")
+    detail: str = Field(description="Why the record was rejected.")
+
+
+class BatchIngestionReport(CamelCaseModel):
+    """
+    Represents the outcome of ingesting a feed of batches.
+    """
+
+    accepted: int = Field(description="The number of batches added or updated.")
+    rejected: int = Field(description="The number of records which could not be parsed.")
+    errors: list[RejectedRecord] = Field(description="The first rejected records.")
+
+
+class SkuCatalogStats(CamelCaseModel):
+    """
+    Represents the counters of the SKU catalog.
+    """
+
+    size: int = Field(description="The number of SKUs known.")
+    hits: int = Field(description="Lookups answered by the catalog alone, i.e. rejected SKUs.")
+    misses: int = Field(description="Lookups of possibly known SKUs, which went on to the database.")
+    false_positives: int = Field(description="Misses for which the database did not know the SKU either.")
+    refreshes: int = Field(description="How many times the catalog was loaded from the database.")
+
+
+class WorkerStats(CamelCaseModel):
+    """
+    Represents the counters of an allocation dispatcher worker.
+    """
+
+    worker: int = Field(description="The index of the worker.")
+    queue_depth: int = Field(description="The number of order lines waiting for the worker.")
+    processed: int = Field(description="The number of order lines allocated, or rejected, by the worker.")
+    mean_latency: float = Field(description="The mean seconds from submitting an order line to its outcome.")
+    max_latency: float = Field(description="The maximum seconds from submitting an order line to its outcome.")
+
+
+class HistogramBucket(CamelCaseModel):
+    """
+    Represents a cumulative histogram bucket.
+    """
+
+    le: float = Field(description="The upper bound of the bucket.")
+    count: int = Field(description="The number of observations lower than or equal to the bound.")
+
+
+class Histogram(CamelCaseModel):
+    """
+    Represents a histogram of observations.
+    """
+
+    buckets: list[HistogramBucket]
+    count: int = Field(description="The number of observations.")
+    sum: float = Field(description="The sum of the observations.")
+
+
+class BatcherStats(CamelCaseModel):
+    """
+    Represents the histograms of the allocation batcher.
+    """
+
+    batch_size: Histogram = Field(description="The number of allocations applied together.")
+    wait_seconds: Histogram = Field(description="The seconds allocations waited for their group to be applied.")
+
+
+class ProfileInfo(CamelCaseModel):
+    """
+    Represents a stored request profile.
+    """
+
+    id: str = Field(description="The profile ID, to download it.")
+    method: str = Field(description="The HTTP method of the request profiled.")
+    path: str = Field(description="The path of the request profiled.")
+    status: int = Field(description="The response status.")
+    seconds: float = Field(description="How long the request took.")
+    samples: int = Field(description="The number of stack samples taken.")
+    created_at: float = Field(description="When the request was profiled, as a UNIX timestamp.")
@@ -1,41 +1,357 @@
 """
 This module describes the allocation service available endpoints.
+
+The router endpoints run in the threadpool with a blocking unit of work, while the async_router ones await an
+asynchronous unit of work on the event loop. The application includes one of them, see the ASYNC_ENDPOINTS setting.
+
+When the allocation dispatcher or batcher is enabled, single allocations are submitted to it instead, see the
+ALLOCATION_WORKERS and ALLOCATION_BATCH_WINDOW_MS settings. A retried order line returns the batch it was allocated
+to rather than being allocated again, and outcomes may also be replayed from memory, see the IDEMPOTENCY_CACHE_SIZE
+setting.
 """
 import logging
-from logging.config import dictConfig
+from functools import partial
+from typing import Awaitable, Callable
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
+from starlette.concurrency import run_in_threadpool
 
-from allocation.domain import schemas
-from allocation.service_layer.allocation_service import AllocationService, InvalidSku, NoBatchesAvailable, OutOfStock
-from allocation.service_layer.dependencies import get_uow
-from allocation.service_layer.unit_of_work import AbstractUnitOfWork
-from allocation.settings.config import LogConfig
+from allocation.domain import models, schemas
+from allocation.entrypoints.responses import render, render_all
+from allocation.service_layer.allocation_engine import WriteBehindBacklog
+from allocation.service_layer.allocation_service import (
+    AllocationService,
+    AsyncAllocationService,
+    InvalidSku,
+    NoBatchesAvailable,
+    NotAllocated,
+    OutOfStock,
+)
+from allocation.service_layer.batcher import AllocationBatcher
+from allocation.service_layer.dependencies import (
+    get_allocation_batcher,
+    get_allocation_dispatcher,
+    get_allocation_service,
+    get_async_allocation_service,
+    get_idempotency_cache,
+)
+from allocation.service_layer.dispatcher import AllocationDispatcher
+from allocation.service_layer.idempotency import IdempotencyCache, IdempotencyKeyReused
+from allocation.service_layer.unit_of_work import ConcurrentUpdate
+from allocation.settings.config import LOGGER_NAME
 
 router = APIRouter(prefix="/v1", tags=["allocation"])
+async_router = APIRouter(prefix="/v1", tags=["allocation"])
+
+logger = logging.getLogger(LOGGER_NAME)
+
+IDEMPOTENCY_KEY_DESCRIPTION = (
+    "Retrying with the same key replays the first successful outcome, when the idempotency cache is enabled. "
+    "With or without a key, an order line allocated already returns its batch instead of being allocated again."
+)
+
+
+@router.post("/allocations", status_code=201, response_model=schemas.BatchReference)
+async def allocate(
+    order: schemas.OrderLine,
+    idempotency_key: str | None = Header(default=None, description=IDEMPOTENCY_KEY_DESCRIPTION),
+    service: AllocationService = Depends(get_allocation_service),
+    dispatcher: AllocationDispatcher | None = Depends(get_allocation_dispatcher),
+    batcher: AllocationBatcher | None = Depends(get_allocation_batcher),
+    idempotency: IdempotencyCache | None = Depends(get_idempotency_cache),
+):
+    """
+    Allocates an order line.
+    """
+    logger.info("Allocating order (%s)", order)
+
+    allocate_line = partial(run_in_threadpool, service.allocate, **order.dict())
+    allocation = await submit(order, allocate_line, dispatcher, batcher, idempotency, idempotency_key)
+    return render(schemas.BatchReference, allocation, status_code=201)
+
+
+@router.post("/allocations/bulk", response_model=list[schemas.AllocationResult])
+def allocate_many(
+    lines: list[schemas.OrderLine],
+    service: AllocationService = Depends(get_allocation_service),
+):
+    """
+    Allocates many order lines in a single transaction, reporting the outcome of each one.
+    """
+    logger.info("Allocating %d order lines", len(lines))
+
+    try:
+        return render_all(schemas.AllocationResult, service.allocate_many(line.dict() for line in lines))
+    except ConcurrentUpdate as e:
+        logger.warning("Could not allocate %d order lines after retrying concurrent updates", len(lines))
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except WriteBehindBacklog as e:
+        logger.warning("Allocation backlog is full")
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+
+@router.post("/deallocations", response_model=schemas.BatchReference)
+async def deallocate(
+    order: schemas.OrderLine,
+    service: AllocationService = Depends(get_allocation_service),
+    idempotency: IdempotencyCache | None = Depends(get_idempotency_cache),
+):
+    """
+    Deallocates an order line from the batch holding it.
+    """
+    logger.info("Deallocating order (%s)", order)
 
-dictConfig(LogConfig().dict())
-logger = logging.getLogger("allocation_service")
+    deallocate_line = partial(run_in_threadpool, service.deallocate, **order.dict())
+    deallocation = await release_line(order, deallocate_line, idempotency)
+    return render(schemas.BatchReference, deallocation)
 
 
-@router.post("/allocations", status_code=201)
-def allocate(
+@router.delete("/orders/{order_id}", response_model=list[schemas.Allocation])
+async def cancel_order(
+    order_id: str,
+    service: AllocationService = Depends(get_allocation_service),
+    idempotency: IdempotencyCache | None = Depends(get_idempotency_cache),
+):
+    """
+    Deallocates every line of an order.
+    """
+    logger.info("Cancelling order %s", order_id)
+
+    removed = await release_orders(partial(run_in_threadpool, service.cancel_order, order_id), idempotency)
+    return render_all(schemas.Allocation, removed)
+
+
+@router.post("/orders/cancellations", response_model=list[schemas.Allocation])
+async def cancel_orders(
+    order_ids: list[str],
+    service: AllocationService = Depends(get_allocation_service),
+    idempotency: IdempotencyCache | None = Depends(get_idempotency_cache),
+):
+    """
+    Deallocates every line of many orders in a single transaction. Orders without allocations are ignored.
+    """
+    logger.info("Cancelling %d orders", len(order_ids))
+
+    removed = await release_orders(partial(run_in_threadpool, service.cancel_orders, order_ids), idempotency)
+    return render_all(schemas.Allocation, removed)
+
+
+@async_router.post("/allocations", status_code=201, response_model=schemas.BatchReference)
+async def allocate_async(
     order: schemas.OrderLine,
-    uow: AbstractUnitOfWork = Depends(get_uow),
+    idempotency_key: str | None = Header(default=None, description=IDEMPOTENCY_KEY_DESCRIPTION),
+    service: AsyncAllocationService = Depends(get_async_allocation_service),
+    dispatcher: AllocationDispatcher | None = Depends(get_allocation_dispatcher),
+    batcher: AllocationBatcher | None = Depends(get_allocation_batcher),
+    idempotency: IdempotencyCache | None = Depends(get_idempotency_cache),
 ):
     """
     Allocates an order line.
     """
     logger.info("Allocating order (%s)", order)
 
+    allocate_line = partial(service.allocate, **order.dict())
+    allocation = await submit(order, allocate_line, dispatcher, batcher, idempotency, idempotency_key)
+    return render(schemas.BatchReference, allocation, status_code=201)
+
+
+@async_router.post("/allocations/bulk", response_model=list[schemas.AllocationResult])
+async def allocate_many_async(
+    lines: list[schemas.OrderLine],
+    service: AsyncAllocationService = Depends(get_async_allocation_service),
+):
+    """
+    Allocates many order lines in a single transaction, reporting the outcome of each one.
+    """
+    logger.info("Allocating %d order lines", len(lines))
+
+    try:
+        return render_all(schemas.AllocationResult, await service.allocate_many(line.dict() for line in lines))
+    except ConcurrentUpdate as e:
+        logger.warning("Could not allocate %d order lines after retrying concurrent updates", len(lines))
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except WriteBehindBacklog as e:
+        logger.warning("Allocation backlog is full")
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+
+@async_router.post("/deallocations", response_model=schemas.BatchReference)
+async def deallocate_async(
+    order: schemas.OrderLine,
+    service: AsyncAllocationService = Depends(get_async_allocation_service),
+    idempotency: IdempotencyCache | None = Depends(get_idempotency_cache),
+):
+    """
+    Deallocates an order line from the batch holding it.
+    """
+    logger.info("Deallocating order (%s)", order)
+
+    deallocation = await release_line(order, partial(service.deallocate, **order.dict()), idempotency)
+    return render(schemas.BatchReference, deallocation)
+
+
+@async_router.delete("/orders/{order_id}", response_model=list[schemas.Allocation])
+async def cancel_order_async(
+    order_id: str,
+    service: AsyncAllocationService = Depends(get_async_allocation_service),
+    idempotency: IdempotencyCache | None = Depends(get_idempotency_cache),
+):
+    """
+    Deallocates every line of an order.
+    """
+    logger.info("Cancelling order %s", order_id)
+
+    removed = await release_orders(partial(service.cancel_order, order_id), idempotency)
+    return render_all(schemas.Allocation, removed)
+
+
+@async_router.post("/orders/cancellations", response_model=list[schemas.Allocation])
+async def cancel_orders_async(
+    order_ids: list[str],
+    service: AsyncAllocationService = Depends(get_async_allocation_service),
+    idempotency: IdempotencyCache | None = Depends(get_idempotency_cache),
+):
+    """
+    Deallocates every line of many orders in a single transaction. Orders without allocations are ignored.
+    """
+    logger.info("Cancelling %d orders", len(order_ids))
+
+    removed = await release_orders(partial(service.cancel_orders, order_ids), idempotency)
+    return render_all(schemas.Allocation, removed)
+
+
+async def submit(
+    order: schemas.OrderLine,
+    allocate_line: Callable[[], Awaitable[str]],
+    dispatcher: AllocationDispatcher | None,
+    batcher: AllocationBatcher | None,
+    idempotency: IdempotencyCache | None,
+    idempotency_key: str | None,
+) -> schemas.BatchReference:
+    """
+    Allocates an order line with the dispatcher, the batcher, or else the request's own service, at most once per
+    idempotency key.
+
+    Args:
+        order: The order line.
+        allocate_line: Allocates the order line with the request's own service.
+        dispatcher: The allocation dispatcher, if enabled.
+        batcher: The allocation batcher, if enabled.
+        idempotency: The idempotency cache, if enabled.
+        idempotency_key: The Idempotency-Key header. Without one, the order line itself is the key.
+
+    Returns:
+        schemas.BatchReference: The reference of the batch allocated.
+    """
+    fingerprint = line_fingerprint(order.order_id, order.sku, order.qty)
+
+    if dispatcher is not None:
+        run = partial(dispatcher.allocate, **order.dict())
+    elif batcher is not None:
+        run = partial(batcher.allocate, **order.dict())
+    else:
+        run = allocate_line
+
     try:
-        service = AllocationService(uow)
-        batch_ref = service.allocate(**order.dict())
+        if idempotency is None:
+            batch_ref = await run()
+        else:
+            key = f"key:{idempotency_key}" if idempotency_key is not None else f"line:{fingerprint}"
+            batch_ref = await idempotency.run(key, fingerprint, run)
     except (InvalidSku, OutOfStock) as e:
         logger.error("Could not allocate for order (%s)", order)
         raise HTTPException(status_code=400, detail=str(e)) from e
     except NoBatchesAvailable as e:
         logger.warning("No batches available")
         raise HTTPException(status_code=404, detail=str(e)) from e
+    except ConcurrentUpdate as e:
+        logger.warning("Could not allocate for order (%s) after retrying concurrent updates", order)
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except IdempotencyKeyReused as e:
+        logger.warning("Idempotency key %s reused for order (%s)", idempotency_key, order)
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    except WriteBehindBacklog as e:
+        logger.warning("Allocation backlog is full")
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+    return schemas.BatchReference(reference=batch_ref)
+
+
+async def release_line(
+    order: schemas.OrderLine,
+    deallocate_line: Callable[[], Awaitable[str]],
+    idempotency: IdempotencyCache | None,
+) -> schemas.BatchReference:
+    """
+    Deallocates an order line, so retrying its allocation allocates it again.
+
+    Args:
+        order: The order line.
+        deallocate_line: Deallocates the order line with the request's service.
+        idempotency: The idempotency cache, if enabled.
+
+    Returns:
+        schemas.BatchReference: The reference of the batch deallocated.
+    """
+    try:
+        batch_ref = await deallocate_line()
+    except NotAllocated as e:
+        logger.warning("Order line (%s) is not allocated", order)
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    except WriteBehindBacklog as e:
+        logger.warning("Allocation backlog is full")
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+    await forget_allocations(idempotency, [models.Allocation(**order.dict(), reference=batch_ref)])
+
+    return schemas.BatchReference(reference=batch_ref)
+
+
+async def release_orders(
+    cancel: Callable[[], Awaitable[list[models.Allocation]]],
+    idempotency: IdempotencyCache | None,
+) -> list[models.Allocation]:
+    """
+    Deallocates the lines of some orders, so retrying their allocation allocates them again.
+
+    Args:
+        cancel: Cancels the orders with the request's service.
+        idempotency: The idempotency cache, if enabled.
+
+    Returns:
+        list[models.Allocation]: The allocations removed.
+    """
+    try:
+        removed = await cancel()
+    except NotAllocated as e:
+        logger.warning("Order %s is not allocated", e.order_id)
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    except WriteBehindBacklog as e:
+        logger.warning("Allocation backlog is full")
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+    await forget_allocations(idempotency, removed)
+
+    return removed
+
+
+async def forget_allocations(idempotency: IdempotencyCache | None, allocations: list[models.Allocation]):
+    """
+    Forgets the outcome of allocating some order lines without an idempotency key, as they were deallocated.
 
-    return {"reference": batch_ref}
+    Outcomes of explicit Idempotency-Key headers are kept: those requests did run, and are still replayed.
+
+    Args:
+        idempotency: The idempotency cache, if enabled.
+        allocations: The allocations removed.
+    """
+    if idempotency is not None:
+        keys = [f"line:{line_fingerprint(a.order_id, a.sku, a.qty)}" for a in allocations]
+        await idempotency.forget(keys)
+
+
+def line_fingerprint(order_id: str, sku: str, qty: int) -> str:
+    """
+    Identifies an order line, to tell apart requests sent with the same idempotency key.
+    """
+    return f"{order_id}:{sku}:{qty}"
@@ -1,30 +1,148 @@
 """Batches Entry Point.
 
-This module contains the entry point for the Batch resource.
+This module contains the entry point for the Batch resource, with a blocking router and an asynchronous one.
 """
 
-from fastapi import APIRouter, Depends
+from functools import partial
+from typing import Awaitable, Callable
 
-from allocation.domain.schemas import BatchIn
-from allocation.service_layer.allocation_service import AllocationService
-from allocation.service_layer.dependencies import get_uow
-from allocation.service_layer.unit_of_work import AbstractUnitOfWork
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from allocation.app.config.settings import settings
+from allocation.app.utils.feeds import PARSERS, iter_lines
+from allocation.domain.schemas import BatchIn, BatchIngestionReport, BatchOut, RejectedRecord
+from allocation.service_layer.allocation_service import AllocationService, AsyncAllocationService, DuplicateBatch
+from allocation.service_layer.dependencies import get_allocation_service, get_async_allocation_service
 
 router = APIRouter(prefix="/v1", tags=["batch"])
+async_router = APIRouter(prefix="/v1", tags=["batch"])
+
+# Rejected records reported back, the others are only counted.
+MAX_REPORTED_ERRORS = 100
+
+INGESTION_DESCRIPTION = (
+    "Streams a feed of batches, as NDJSON or CSV, and upserts them on their reference in chunks. "
+    "Records which cannot be parsed are skipped and reported."
+)
 
 
 @router.post(
     "/batches",
     status_code=201,
+    response_model=BatchOut,
     summary="Create a new batch",
 )
 def add_batch(
     batch: BatchIn,
-    uow: AbstractUnitOfWork = Depends(get_uow),
+    service: AllocationService = Depends(get_allocation_service),
+):
+    """
+    Adds a new batch.
+    """
+    try:
+        service.add_batch(**batch.dict())
+    except DuplicateBatch as e:
+        raise HTTPException(status_code=409, detail=e.message) from e
+
+    return batch
+
+
+@async_router.post(
+    "/batches",
+    status_code=201,
+    response_model=BatchOut,
+    summary="Create a new batch",
+)
+async def add_batch_async(
+    batch: BatchIn,
+    service: AsyncAllocationService = Depends(get_async_allocation_service),
 ):
     """
     Adds a new batch.
     """
-    service = AllocationService(uow)
+    try:
+        await service.add_batch(**batch.dict())
+    except DuplicateBatch as e:
+        raise HTTPException(status_code=409, detail=e.message) from e
+
+    return batch
+
+
+async def ingest(request: Request, write_chunk: Callable[[list[dict]], Awaitable[int]]) -> BatchIngestionReport:
+    """
+    Parses an uploaded feed of batches as it is received, writing it in chunks.
+
+    Args:
+        request: The request whose body is the feed.
+        write_chunk: Adds or updates a chunk of batches, returning how many were written.
+
+    Returns:
+        BatchIngestionReport: How many batches were written, and which records were rejected.
+
+    Raises:
+        HTTPException: When the feed format is not supported.
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+
+    if media_type not in PARSERS:
+        raise HTTPException(status_code=415, detail=f"Unsupported feed format, expected one of {', '.join(PARSERS)}")
+
+    report = BatchIngestionReport(accepted=0, rejected=0, errors=[])
+    chunk: list[dict] = []
+
+    async for number, record in PARSERS[media_type](iter_lines(request.stream(), settings.INGESTION_MAX_LINE_LENGTH)):
+        try:
+            batch = BatchIn.parse_obj(record) if isinstance(record, dict) else record
+        except ValidationError as e:
+            batch = e
+
+        if isinstance(batch, Exception):
+            report.rejected += 1
+            if len(report.errors) < MAX_REPORTED_ERRORS:
+                report.errors.append(RejectedRecord(line=number, detail=str(batch)))
+            continue
+
+        chunk.append(batch.dict())
+
+        if len(chunk) >= settings.INGESTION_CHUNK_SIZE:
+            report.accepted += await write_chunk(chunk)
+            chunk = []
+
+    if chunk:
+        report.accepted += await write_chunk(chunk)
+
+    return report
+
+
+@router.post(
+    "/batches/ingest",
+    response_model=BatchIngestionReport,
+    summary="Ingest a feed of batches",
+    description=INGESTION_DESCRIPTION,
+)
+async def ingest_batches(
+    request: Request,
+    service: AllocationService = Depends(get_allocation_service),
+):
+    """
+    Ingests a feed of batches, writing each chunk from the threadpool.
+    """
+    return await ingest(request, partial(run_in_threadpool, service.add_batches))
 
-    service.add_batch(**batch.dict())
+
+@async_router.post(
+    "/batches/ingest",
+    response_model=BatchIngestionReport,
+    summary="Ingest a feed of batches",
+    description=INGESTION_DESCRIPTION,
+)
+async def ingest_batches_async(
+    request: Request,
+    service: AsyncAllocationService = Depends(get_async_allocation_service),
+):
+    """
+    Ingests a feed of batches.
+    """
+    return await ingest(request, service.add_batches)
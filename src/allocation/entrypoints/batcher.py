@@ -0,0 +1,27 @@
+"""Allocation Batcher Entry Point.
+
+This module exposes the histograms of the allocation batcher, to tune its window.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from allocation.domain.schemas import BatcherStats
+from allocation.service_layer.batcher import AllocationBatcher
+from allocation.service_layer.dependencies import get_allocation_batcher
+
+router = APIRouter(prefix="/v1", tags=["batcher"])
+
+
+@router.get(
+    "/batcher/stats",
+    response_model=BatcherStats,
+    summary="Get the allocation batcher histograms",
+)
+def get_batcher_stats(batcher: AllocationBatcher | None = Depends(get_allocation_batcher)):
+    """
+    Returns the batch size and wait time histograms of the allocation batcher.
+    """
+    if batcher is None:
+        raise HTTPException(status_code=404, detail="The allocation batcher is disabled")
+
+    return batcher.stats()
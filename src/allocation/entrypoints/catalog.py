@@ -0,0 +1,27 @@
+"""SKU Catalog Entry Point.
+
+This module exposes the counters of the SKU catalog, to tell how much database traffic it saves.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from allocation.domain.schemas import SkuCatalogStats
+from allocation.service_layer.dependencies import get_sku_catalog
+from allocation.service_layer.sku_catalog import SkuCatalog
+
+router = APIRouter(prefix="/v1", tags=["catalog"])
+
+
+@router.get(
+    "/catalog/stats",
+    response_model=SkuCatalogStats,
+    summary="Get the SKU catalog counters",
+)
+def get_catalog_stats(catalog: SkuCatalog | None = Depends(get_sku_catalog)):
+    """
+    Returns the hits and misses of the SKU catalog.
+    """
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="The SKU catalog is disabled")
+
+    return catalog.stats()
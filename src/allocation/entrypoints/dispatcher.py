@@ -0,0 +1,27 @@
+"""Allocation Dispatcher Entry Point.
+
+This module exposes the queue depth and latency of the allocation dispatcher workers.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from allocation.domain.schemas import WorkerStats
+from allocation.service_layer.dependencies import get_allocation_dispatcher
+from allocation.service_layer.dispatcher import AllocationDispatcher
+
+router = APIRouter(prefix="/v1", tags=["dispatcher"])
+
+
+@router.get(
+    "/dispatcher/stats",
+    response_model=list[WorkerStats],
+    summary="Get the allocation dispatcher counters",
+)
+def get_dispatcher_stats(dispatcher: AllocationDispatcher | None = Depends(get_allocation_dispatcher)):
+    """
+    Returns the queue depth and latency of every allocation worker.
+    """
+    if dispatcher is None:
+        raise HTTPException(status_code=404, detail="The allocation dispatcher is disabled")
+
+    return dispatcher.stats()
@@ -0,0 +1,172 @@
+"""Metrics Entry Point.
+
+This module exposes the metrics of the process in the Prometheus text exposition format, to be scraped.
+
+Besides the metrics updated as requests are handled, the counters already kept by the SKU catalog, the allocation
+engine, dispatcher and batcher, the idempotency cache and the logging queue are collected when rendering.
+"""
+from typing import Iterable
+
+from fastapi import APIRouter, HTTPException
+from starlette.responses import PlainTextResponse
+
+from allocation.adapters.metrics import REGISTRY, Counter, Family, Gauge
+from allocation.app.config.settings import settings
+from allocation.service_layer import dependencies
+from allocation.settings.config import get_log_handler
+
+# Starlette appends the charset.
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Renders every metric of the process.
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def stat(kind: type, name: str, description: str, values: dict[tuple, float], labels: tuple = ()) -> Family:
+    """
+    Builds a counter or gauge from values kept elsewhere.
+
+    Args:
+        kind: Counter or Gauge.
+        name: The metric name.
+        description: What is measured.
+        values: The value of every combination of label values.
+        labels: The label names.
+
+    Returns:
+        Family: The metric.
+    """
+    family = Family(name, description, kind, labels)
+
+    for label_values, value in values.items():
+        family.labels(*label_values).inc(value)
+
+    return family
+
+
+@REGISTRY.collector
+def collect_sku_catalog() -> Iterable[Family]:
+    """
+    Collects the counters of the SKU catalog, when enabled.
+    """
+    catalog = dependencies.get_sku_catalog()
+
+    if catalog is None:
+        return
+
+    stats = catalog.stats()
+    yield stat(Gauge, "sku_catalog_size", "SKUs known to the catalog.", {(): stats["size"]})
+
+    for counter in ("hits", "misses", "false_positives", "refreshes"):
+        description = f"SKU catalog {counter.replace('_', ' ')}."
+        yield stat(Counter, f"sku_catalog_{counter}_total", description, {(): stats[counter]})
+
+
+@REGISTRY.collector
+def collect_allocation_engine() -> Iterable[Family]:
+    """
+    Collects the write-behind backlog of the allocation engine, when enabled.
+    """
+    engine = dependencies.get_allocation_engine()
+
+    if engine is None:
+        return
+
+    yield stat(Gauge, "allocation_engine_backlog", "Allocations waiting to be persisted.", {(): engine.backlog})
+    failed_writes = {(): engine.failed_writes}
+    yield stat(Counter, "allocation_engine_failed_writes_total", "Allocations which failed to persist.", failed_writes)
+    rejected_writes = {(): engine.rejected_writes}
+    yield stat(
+        Counter, "allocation_engine_rejected_writes_total", "Allocations given back by the database.", rejected_writes
+    )
+    unpersisted = {(): len(engine.failed)}
+    yield stat(Gauge, "allocation_engine_unpersisted", "Failed allocations waiting to be replayed.", unpersisted)
+
+
+@REGISTRY.collector
+def collect_allocation_dispatcher() -> Iterable[Family]:
+    """
+    Collects the queues of the allocation dispatcher workers, when enabled.
+    """
+    dispatcher = dependencies.get_allocation_dispatcher()
+
+    if dispatcher is None:
+        return
+
+    workers = dispatcher.stats()
+    labels = ("worker",)
+    yield stat(
+        Gauge,
+        "allocation_dispatcher_queue_depth",
+        "Allocations queued for a worker.",
+        {(str(worker["worker"]),): worker["queue_depth"] for worker in workers},
+        labels,
+    )
+    yield stat(
+        Counter,
+        "allocation_dispatcher_processed_total",
+        "Allocations processed by a worker.",
+        {(str(worker["worker"]),): worker["processed"] for worker in workers},
+        labels,
+    )
+
+
+@REGISTRY.collector
+def collect_allocation_batcher() -> Iterable[Family]:
+    """
+    Collects the histograms of the allocation batcher, when enabled.
+    """
+    batcher = dependencies.get_allocation_batcher()
+
+    if batcher is None:
+        return
+
+    for histogram in (batcher.batch_sizes, batcher.wait_seconds):
+        family = Family(histogram.name, histogram.description, lambda histogram=histogram: histogram)
+        family.labels()
+        yield family
+
+
+@REGISTRY.collector
+def collect_idempotency_cache() -> Iterable[Family]:
+    """
+    Collects the counters of the idempotency cache, when enabled.
+    """
+    cache = dependencies.get_idempotency_cache()
+
+    if cache is None:
+        return
+
+    stats = cache.stats()
+    yield stat(Gauge, "idempotency_cache_size", "Outcomes kept in memory.", {(): stats["size"]})
+
+    for counter, description in (
+        ("hits", "Requests answered with a stored outcome."),
+        ("misses", "Requests which ran."),
+        ("joined", "Requests which waited for a duplicate in flight."),
+    ):
+        yield stat(Counter, f"idempotency_cache_{counter}_total", description, {(): stats[counter]})
+
+
+@REGISTRY.collector
+def collect_log_queue() -> Iterable[Family]:
+    """
+    Collects the records dropped by the logging queue, once logging is started.
+    """
+    handler = get_log_handler()
+
+    if handler is None:
+        return
+
+    dropped = {(): handler.dropped}
+    yield stat(Counter, "log_records_dropped_total", "Log records dropped while the logging queue was full.", dropped)
@@ -0,0 +1,70 @@
+"""Request Profiles Entry Point.
+
+This module lists and downloads the profiles of the requests profiled on demand, in the collapsed stack format
+rendered by flamegraph.pl and speedscope. Only requests carrying the admin token are answered.
+"""
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from starlette.responses import FileResponse
+
+from allocation.adapters.profiling import ProfileStore
+from allocation.app.utils.admin import ADMIN_TOKEN_HEADER, is_admin
+from allocation.domain.schemas import ProfileInfo
+from allocation.service_layer.dependencies import get_profile_store
+
+router = APIRouter(prefix="/v1", tags=["profiles"])
+
+
+def require_admin(x_admin_token: str | None = Header(default=None, description="The admin token.")):
+    """
+    Checks the request carries the admin token.
+
+    Raises:
+        HTTPException: 403 when it does not.
+    """
+    if not is_admin({ADMIN_TOKEN_HEADER: x_admin_token or ""}):
+        raise HTTPException(status_code=403, detail="The admin token is required")
+
+
+def require_profile_store(
+    store: ProfileStore | None = Depends(get_profile_store), _: None = Depends(require_admin)
+) -> ProfileStore:
+    """
+    Returns the store of request profiles, to admin requests only.
+
+    Raises:
+        HTTPException: 403 without the admin token, 404 when profiling is disabled.
+    """
+    if store is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+    return store
+
+
+@router.get(
+    "/profiles",
+    response_model=list[ProfileInfo],
+    summary="List the request profiles",
+)
+def list_profiles(store: ProfileStore = Depends(require_profile_store)):
+    """
+    Lists the stored request profiles, the latest first.
+    """
+    return store.find_all()
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    response_class=FileResponse,
+    summary="Download a request profile",
+)
+def download_profile(profile_id: str, store: ProfileStore = Depends(require_profile_store)):
+    """
+    Downloads a request profile in the collapsed stack format.
+    """
+    path = store.path(profile_id)
+
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    return FileResponse(path, media_type="text/plain", filename=path.name)
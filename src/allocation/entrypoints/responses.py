@@ -0,0 +1,71 @@
+"""JSON Responses.
+
+FastAPI validates the result of an endpoint against its response model, then encodes it with jsonable_encoder,
+which costs tens of microseconds per object. Endpoints returning results built by the service layer render them
+instead, their response model only documenting them.
+"""
+import importlib.util
+from typing import Any, Iterable
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from allocation.app.config.settings import settings
+from allocation.domain.schemas import CamelCaseModel
+
+# Response classes rendering the endpoints' results, by JSON_RESPONSE setting.
+JSON_RESPONSES = {
+    "json": JSONResponse,
+    "orjson": ORJSONResponse,
+}
+
+
+def json_response_class(encoder: str) -> type[JSONResponse]:
+    """
+    Selects the response class of the endpoints returning JSON.
+
+    Args:
+        encoder (str): json or orjson.
+
+    Returns:
+        type[JSONResponse]: The response class.
+
+    Raises:
+        ValueError: When the encoder is not supported, or orjson is selected without being installed.
+    """
+    if encoder not in JSON_RESPONSES:
+        raise ValueError(f"Unsupported JSON encoder: {encoder}")
+
+    if encoder == "orjson" and importlib.util.find_spec("orjson") is None:
+        raise ValueError("The orjson JSON encoder needs the orjson package")
+
+    return JSON_RESPONSES[encoder]
+
+
+def render(model: type[CamelCaseModel], item: Any, status_code: int = 200) -> JSONResponse:
+    """
+    Renders a result of the service layer as a JSON object, without validating it, see CamelCaseModel.serialize.
+
+    Args:
+        model: The schema of the result.
+        item: The result.
+        status_code: The response status.
+
+    Returns:
+        JSONResponse: The response, of the class selected by the JSON_RESPONSE setting.
+    """
+    return JSON_RESPONSES[settings.JSON_RESPONSE](model.serialize(item), status_code=status_code)
+
+
+def render_all(model: type[CamelCaseModel], items: Iterable, status_code: int = 200) -> JSONResponse:
+    """
+    Renders results of the service layer as a JSON list, without validating them, see CamelCaseModel.serialize.
+
+    Args:
+        model: The schema of the items.
+        items: The results.
+        status_code: The response status.
+
+    Returns:
+        JSONResponse: The response, of the class selected by the JSON_RESPONSE setting.
+    """
+    return JSON_RESPONSES[settings.JSON_RESPONSE]([model.serialize(item) for item in items], status_code=status_code)
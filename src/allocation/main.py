@@ -1,5 +1,8 @@
 """
 This module contains the main entry point for the allocation service.
+
+Running it serves the application from a single process, for development. In production, it is served by several
+worker processes, see allocation.app.server.
 """
 from allocation.app.asgi import get_application
 
@@ -8,4 +11,4 @@ app = get_application()
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("main:app")
+    uvicorn.run("allocation.main:app")
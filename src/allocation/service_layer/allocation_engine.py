@@ -0,0 +1,527 @@
+"""In-Memory Allocation Engine
+
+Keeps, for each SKU, its batches ordered by ETA together with their available quantity, so an order line is
+allocated to the first batch it fits in without a database round trip. The allocated lines are indexed by order ID
+as well, so an order is cancelled without scanning every SKU.
+
+Allocations and deallocations are persisted asynchronously: they are put in a bounded write-behind queue, drained by
+a background thread which applies them in order through a unit of work in groups. When the queue is full, allocating
+waits for room for a while and then fails, so a slow database slows down allocations instead of growing the backlog
+without bounds. On the event loop, the wait happens in a thread instead, see run_async. Producers take turns to queue,
+so the queue keeps the order of the in-memory changes, but the in-memory state is not locked while they wait: a line is
+reserved first, queued next, and its reservation is undone when it cannot be queued.
+
+A group which fails to persist is retried with backoff, and then persisted one allocation at a time, so a single bad
+allocation does not take the rest of its group down. Allocations which still fail are kept, rather than dropped, and
+queued again whenever the writer has been idle for a while, or on demand with replay_failed. An allocation which no
+longer fits its batch is given back instead, as replaying it would never succeed.
+
+The engine assumes it is the only writer of allocations: it is rebuilt from the database when started, and batches
+added through the service layer are registered with it once committed.
+"""
+import asyncio
+import contextlib
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Iterator, TypeVar
+
+from allocation.domain.models import Allocation, Batch, OrderLine
+from allocation.service_layer.allocation_service import InvalidSku, NoBatchesAvailable, NotAllocated, OutOfStock
+from allocation.service_layer.unit_of_work import AbstractUnitOfWork
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Batch reference, order line, and whether it is allocated or deallocated.
+WriteItem = tuple[str, OrderLine, bool]
+
+
+class WriteBehindBacklog(Exception):
+    """
+    Raised when allocations cannot be queued for persistence quickly enough.
+    """
+
+    def __init__(self):
+        self.message = "Too many allocations waiting to be persisted"
+        super().__init__(self.message)
+
+
+@dataclass
+class _Slot:
+    sort_key: tuple
+    reference: str
+    available: int
+
+
+@dataclass
+class _SkuStock:
+    slots: list[_Slot] = field(default_factory=list)
+    allocations: dict[OrderLine, str] = field(default_factory=dict)
+
+    def upsert(self, reference: str, eta: date | None, available: int):
+        self.slots = [slot for slot in self.slots if slot.reference != reference]
+        # Same order as sorting batches: warehouse stock first, then by ETA, ties in arrival order.
+        self.slots.append(_Slot((eta is not None, eta or date.min), reference, available))
+        self.slots.sort(key=lambda slot: slot.sort_key)
+
+
+class InMemoryAllocationEngine:
+    """
+    Allocates order lines against an in-memory copy of the batches, persisting them behind the scenes.
+
+    Args:
+        uow_factory: Builds the unit of work used to load the batches and persist the allocations.
+        queue_size: How many allocations may wait to be persisted.
+        flush_size: How many queued allocations are persisted per transaction at most.
+        put_timeout: Seconds an allocation waits for room in a full queue before failing.
+        write_retries: How many times a group which failed to persist is retried, before persisting its allocations
+            one at a time.
+        write_backoff: Seconds waited before the first retry, doubled on every following one.
+        replay_interval: Seconds without allocations to persist after which the failed ones are replayed.
+
+    Attributes:
+        failed_writes (int): The number of allocations which failed to persist, replayed or not.
+        rejected_writes (int): The number of allocations given back as they no longer fit their batch.
+    """
+
+    def __init__(
+        self,
+        uow_factory: Callable[[], AbstractUnitOfWork],
+        queue_size: int = 10000,
+        flush_size: int = 100,
+        put_timeout: float = 1.0,
+        write_retries: int = 3,
+        write_backoff: float = 0.1,
+        replay_interval: float = 30.0,
+    ):
+        self.uow_factory = uow_factory
+        self.flush_size = flush_size
+        self.put_timeout = put_timeout
+        self.write_retries = write_retries
+        self.write_backoff = write_backoff
+        self.replay_interval = replay_interval
+        self.failed_writes = 0
+        self.rejected_writes = 0
+        self._failed: list[WriteItem] = []
+        self._failed_lock = threading.Lock()
+        self._stocks: dict[str, _SkuStock] = {}
+        self._orders: dict[str, set[OrderLine]] = {}
+        self._lock = threading.Lock()
+        self._put_lock = threading.Lock()
+        self._queue: queue.Queue[WriteItem | None] = queue.Queue(maxsize=queue_size)
+        self._writer: threading.Thread | None = None
+
+    def load(self):
+        """
+        Rebuilds the in-memory state from the database.
+        """
+        stocks: dict[str, _SkuStock] = {}
+        orders: dict[str, set[OrderLine]] = {}
+
+        with self.uow_factory() as uow:
+            for batch in uow.batches.find_all():
+                stock = stocks.setdefault(batch.sku, _SkuStock())
+                stock.upsert(batch.reference, batch.eta, batch.available_quantity)
+
+                for line in batch._allocations:  # pylint: disable=protected-access
+                    stock.allocations[line] = batch.reference
+                    orders.setdefault(line.order_id, set()).add(line)
+
+        with self._lock:
+            self._stocks = stocks
+            self._orders = orders
+
+        log.info("Allocation engine loaded %d SKUs.", len(stocks))
+
+    def start(self):
+        """
+        Loads the state and starts persisting allocations in the background.
+        """
+        self.load()
+        self._writer = threading.Thread(target=self._write_behind, name="allocation-write-behind", daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        """
+        Persists the queued allocations and stops the background writer.
+        """
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+        failed = self.failed
+
+        if failed:
+            log.error("Allocation engine stopped with %d allocations not persisted: %s", len(failed), failed)
+
+    def flush(self):
+        """
+        Waits until every queued allocation is persisted.
+        """
+        self._queue.join()
+
+    @property
+    def backlog(self) -> int:
+        """
+        The number of allocations waiting to be persisted.
+        """
+        return self._queue.qsize()
+
+    @property
+    def failed(self) -> list[WriteItem]:
+        """
+        The allocations and deallocations which failed to persist, waiting to be replayed, in order.
+        """
+        with self._failed_lock:
+            return list(self._failed)
+
+    def replay_failed(self) -> int:
+        """
+        Queues the allocations which failed to persist again, e.g. once the database is back.
+
+        Those which do not fit in the queue are kept for the next replay, as the writer itself replays them.
+
+        Returns:
+            int: The number of allocations queued.
+        """
+        with self._failed_lock:
+            failed, self._failed = self._failed, []
+
+        for queued, item in enumerate(failed):
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                with self._failed_lock:
+                    self._failed[:0] = failed[queued:]
+
+                return queued
+
+        return len(failed)
+
+    async def run_async(self, operation: Callable[..., T], *args) -> T:
+        """
+        Runs allocate, deallocate or cancel from the event loop without blocking it.
+
+        The operation is first run without waiting for room in the write-behind queue. When the queue is full, it is
+        run again in a thread, which waits for room instead of the event loop.
+
+        Args:
+            operation: The operation, which takes a wait keyword argument.
+            args: Its arguments.
+
+        Returns:
+            T: The result of the operation.
+        """
+        try:
+            return operation(*args, wait=False)
+        except WriteBehindBacklog:
+            return await asyncio.to_thread(operation, *args)
+
+    def add_batch(self, reference: str, sku: str, qty: int, eta: date | None = None):
+        """
+        Registers a committed batch, or updates the purchased quantity and ETA of a known one.
+
+        Like when ingesting batches, a known batch is kept as is rather than shrunk below its allocated quantity.
+
+        Args:
+            reference: The batch reference.
+            sku: The Stock Keeping Unit
+            qty: The purchased quantity of the batch
+            eta: Estimated time of arrival
+        """
+        with self._lock:
+            stock = self._stocks.setdefault(sku, _SkuStock())
+            allocated = sum(line.qty for line, ref in stock.allocations.items() if ref == reference)
+
+            if allocated > qty and any(slot.reference == reference for slot in stock.slots):
+                log.warning("Batch %s keeps its quantity, as %d are allocated from it.", reference, allocated)
+                return
+
+            stock.upsert(reference, eta, qty - allocated)
+
+    def allocate(self, order_id: str, sku: str, qty: int, wait: bool = True) -> str:
+        """
+        Allocates an order line to the earliest batch it fits in, and queues it for persistence.
+
+        Args:
+            order_id: Identifier of an order line
+            sku: The Stock Keeping Unit
+            qty: Quantity of the order line
+            wait: Whether to wait for room in a full queue, for up to put_timeout, before failing.
+
+        Returns:
+            str: The reference of the batch allocated.
+
+        Raises:
+            NoBatchesAvailable: Raised when there are no batches available.
+            InvalidSku: Raised when the SKU is invalid.
+            OutOfStock: Raised when there is no stock available.
+            WriteBehindBacklog: Raised when the allocation cannot be queued for persistence.
+        """
+        line = OrderLine(order_id=order_id, sku=sku, qty=qty)
+
+        with self._producing(wait) as deadline:
+            with self._lock:
+                stock = self._stocks.get(sku)
+
+                if stock is None:
+                    raise InvalidSku(sku) if self._stocks else NoBatchesAvailable()
+
+                if line in stock.allocations:
+                    return stock.allocations[line]
+
+                slot = next((slot for slot in stock.slots if slot.available >= qty), None)
+
+                if slot is None:
+                    raise OutOfStock()
+
+                self._take(line, slot.reference)
+
+            try:
+                self._enqueue(slot.reference, line, True, deadline)
+            except WriteBehindBacklog:
+                with self._lock:
+                    self._give_back(line)
+                raise
+
+        return slot.reference
+
+    def deallocate(self, line: OrderLine, wait: bool = True) -> str:
+        """
+        Deallocates an order line from the batch holding it, and queues it for persistence.
+
+        Args:
+            line: The order line.
+            wait: Whether to wait for room in a full queue, see allocate.
+
+        Returns:
+            str: The reference of the batch deallocated.
+
+        Raises:
+            NotAllocated: Raised when the order line is not allocated.
+            WriteBehindBacklog: Raised when the deallocation cannot be queued for persistence.
+        """
+        with self._producing(wait) as deadline:
+            with self._lock:
+                if line not in self._orders.get(line.order_id, ()):
+                    raise NotAllocated(line.order_id)
+
+                allocation = self._give_back(line)
+
+            try:
+                self._enqueue(allocation.reference, line, False, deadline)
+            except WriteBehindBacklog:
+                with self._lock:
+                    self._take(line, allocation.reference)
+                raise
+
+        return allocation.reference
+
+    def cancel(self, order_ids: list[str], wait: bool = True) -> list[Allocation]:
+        """
+        Deallocates every line of some orders, and queues them for persistence.
+
+        Args:
+            order_ids: The order IDs. Those without allocations are ignored.
+            wait: Whether to wait for room in a full queue, see allocate. When not waiting, nothing is deallocated
+                unless every line can be queued.
+
+        Returns:
+            list[Allocation]: The allocations removed.
+
+        Raises:
+            WriteBehindBacklog: Raised when a deallocation cannot be queued for persistence, the previous ones
+                being applied when waiting.
+        """
+        with self._producing(wait) as deadline:
+            with self._lock:
+                lines = [line for order_id in order_ids for line in self._orders.get(order_id, ())]
+
+                # Producers take turns, so the room left can only grow until the lines are queued.
+                if not wait and self._queue.maxsize and self._queue.maxsize - self._queue.qsize() < len(lines):
+                    raise WriteBehindBacklog()
+
+                lines.sort(key=lambda line: (line.order_id, line.sku, line.qty))
+                allocations = [self._give_back(line) for line in lines]
+
+            for queued, line in enumerate(lines):
+                try:
+                    self._enqueue(allocations[queued].reference, line, False, deadline)
+                except WriteBehindBacklog:
+                    with self._lock:
+                        for allocation, kept in zip(allocations[queued:], lines[queued:]):
+                            self._take(kept, allocation.reference)
+                    raise
+
+        return allocations
+
+    @contextlib.contextmanager
+    def _producing(self, wait: bool) -> Iterator[float | None]:
+        """
+        Takes the turn to queue allocations, waiting for it like for room in the queue.
+
+        Yields:
+            float | None: The monotonic time after which queueing gives up, None when not waiting.
+        """
+        deadline = time.monotonic() + self.put_timeout if wait else None
+
+        if not (self._put_lock.acquire(timeout=self.put_timeout) if wait else self._put_lock.acquire(blocking=False)):
+            raise WriteBehindBacklog()
+
+        try:
+            yield deadline
+        finally:
+            self._put_lock.release()
+
+    def _enqueue(self, reference: str, line: OrderLine, allocated: bool, deadline: float | None):
+        try:
+            if deadline is None:
+                self._queue.put_nowait((reference, line, allocated))
+            else:
+                self._queue.put((reference, line, allocated), timeout=max(deadline - time.monotonic(), 0))
+        except queue.Full as e:
+            raise WriteBehindBacklog() from e
+
+    def _take(self, line: OrderLine, reference: str):
+        stock = self._stocks[line.sku]
+        next(slot for slot in stock.slots if slot.reference == reference).available -= line.qty
+        stock.allocations[line] = reference
+        self._orders.setdefault(line.order_id, set()).add(line)
+
+    def _give_back(self, line: OrderLine) -> Allocation:
+        stock = self._stocks[line.sku]
+        reference = stock.allocations.pop(line)
+        next(slot for slot in stock.slots if slot.reference == reference).available += line.qty
+        self._orders[line.order_id].discard(line)
+
+        if not self._orders[line.order_id]:
+            del self._orders[line.order_id]
+
+        return Allocation(line.order_id, line.sku, line.qty, reference)
+
+    def _write_behind(self):
+        stopping = False
+
+        while not stopping:
+            try:
+                items = [self._queue.get(timeout=self.replay_interval)]
+            except queue.Empty:
+                if self.replay_failed():
+                    log.info("Replaying allocations which failed to persist.")
+                continue
+
+            while len(items) < self.flush_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = None in items
+            self._persist([item for item in items if item is not None])
+
+            for _ in items:
+                self._queue.task_done()
+
+    def _persist(self, items: list[WriteItem]):
+        if not items:
+            return
+
+        rejected = self._write_with_retries(items)
+
+        if rejected is not None:
+            self._reject(rejected)
+        elif len(items) == 1:
+            self._keep_failed(items)
+        else:
+            # Isolates the allocations which cannot be persisted from the rest of the group, keeping their order.
+            for item in items:
+                self._persist([item])
+
+    def _write_with_retries(self, items: list[WriteItem]) -> list[WriteItem] | None:
+        """
+        Persists a group of allocations, retrying with backoff.
+
+        Returns:
+            list[WriteItem] | None: The allocations left out, see _write, None when the group could not be persisted.
+        """
+        for attempt in range(self.write_retries + 1):
+            if attempt:
+                time.sleep(self.write_backoff * 2 ** (attempt - 1))
+
+            try:
+                return self._write(items)
+            except Exception:  # pylint: disable=broad-except
+                log.warning("Could not persist %d allocations, attempt %d.", len(items), attempt + 1, exc_info=True)
+
+        log.error("Could not persist %d allocations after %d retries.", len(items), self.write_retries)
+        return None
+
+    def _write(self, items: list[WriteItem]) -> list[WriteItem]:
+        """
+        Persists a group of allocations in a single transaction.
+
+        Returns:
+            list[WriteItem]: The allocations which no longer fit their batch, and were left out.
+        """
+        rejected = []
+
+        with self.uow_factory() as uow:
+            batches: dict[str, Batch] = {}
+
+            for item in items:
+                reference, line, allocated = item
+
+                if reference not in batches:
+                    batch = uow.batches.find_by(reference=reference)
+
+                    if batch is None:
+                        raise LookupError(f"Batch {reference} does not exist")
+
+                    batches[reference] = batch
+
+                batch = batches[reference]
+
+                if not allocated:
+                    batch.deallocate(line)
+                    continue
+
+                if not batch.can_allocate(line):
+                    log.error("Batch %s cannot take the allocation of %s anymore.", reference, line)
+                    rejected.append(item)
+                    continue
+
+                batch.allocate(line)
+
+            uow.commit()
+
+        return rejected
+
+    def _reject(self, items: list[WriteItem]):
+        if not items:
+            return
+
+        with self._lock:
+            self.rejected_writes += len(items)
+
+            for reference, line, _ in items:
+                stock = self._stocks.get(line.sku)
+
+                # Unless deallocated in the meantime.
+                if stock is not None and stock.allocations.get(line) == reference:
+                    self._give_back(line)
+
+        log.error("Gave back %d allocations which no longer fit their batch.", len(items))
+
+    def _keep_failed(self, items: list[WriteItem]):
+        if not items:
+            return
+
+        with self._failed_lock:
+            self.failed_writes += len(items)
+            self._failed.extend(items)
@@ -1,10 +1,23 @@
 """
 This module describes the service responsible for allocating orders.
 """
+import asyncio
+import functools
+import random
+import time
+from dataclasses import dataclass
 from datetime import date
+from typing import TYPE_CHECKING, Awaitable, Callable, Iterable, TypeVar
 
-from allocation.domain.models import Batch, OrderLine
-from allocation.service_layer.unit_of_work import AbstractUnitOfWork
+from sqlalchemy.exc import IntegrityError
+
+from allocation.adapters.metrics import REGISTRY
+from allocation.domain.models import Allocation, Batch, OrderLine, Product
+from allocation.service_layer.unit_of_work import AbstractAsyncUnitOfWork, AbstractUnitOfWork, ConcurrentUpdate
+
+if TYPE_CHECKING:
+    from allocation.service_layer.allocation_engine import InMemoryAllocationEngine
+    from allocation.service_layer.sku_catalog import SkuCatalog
 
 
 class InvalidSku(Exception):
@@ -42,14 +55,144 @@ class NoBatchesAvailable(Exception):
         super().__init__(self.message)
 
 
+class DuplicateBatch(Exception):
+    """
+    Raised when adding a batch whose reference is already taken.
+    """
+
+    def __init__(self, reference: str):
+        self.message = f"Batch {reference} already exists"
+        self.reference = reference
+        super().__init__(self.message)
+
+
+class NotAllocated(Exception):
+    """
+    Raised when an order line, or every line of an order, is not allocated.
+    """
+
+    def __init__(self, order_id: str):
+        self.message = "Not allocated"
+        self.order_id = order_id
+        super().__init__(self.message)
+
+
+@dataclass(frozen=True)
+class AllocationResult:
+    """
+    The outcome of allocating one of many order lines.
+
+    Attributes:
+        order_id (str): The order ID.
+        sku (str): The SKU.
+        qty (int): The quantity.
+        reference (str | None): The reference of the batch allocated, None if the line could not be allocated.
+        error (str | None): The name of the error which prevented the allocation, e.g. OutOfStock.
+    """
+
+    order_id: str
+    sku: str
+    qty: int
+    reference: str | None = None
+    error: str | None = None
+
+
+ALLOCATIONS = REGISTRY.counter(
+    "allocations_total", "Order lines allocated, or the error which prevented it.", labels=("outcome",)
+)
+
+ALLOCATION_ERRORS = (InvalidSku, OutOfStock, NoBatchesAvailable)
+
+
+def counted(allocate_line: Callable) -> Callable:
+    """
+    Counts the outcome of a method allocating an order line in ALLOCATIONS.
+
+    Args:
+        allocate_line: The method, either synchronous or a coroutine function.
+
+    Returns:
+        Callable: The counted method.
+    """
+    if asyncio.iscoroutinefunction(allocate_line):
+
+        @functools.wraps(allocate_line)
+        async def counted_coroutine(*args, **kwargs):
+            try:
+                reference = await allocate_line(*args, **kwargs)
+            except ALLOCATION_ERRORS as e:
+                ALLOCATIONS.labels(type(e).__name__).inc()
+                raise
+
+            ALLOCATIONS.labels("allocated").inc()
+            return reference
+
+        return counted_coroutine
+
+    @functools.wraps(allocate_line)
+    def counted_method(*args, **kwargs):
+        try:
+            reference = allocate_line(*args, **kwargs)
+        except ALLOCATION_ERRORS as e:
+            ALLOCATIONS.labels(type(e).__name__).inc()
+            raise
+
+        ALLOCATIONS.labels("allocated").inc()
+        return reference
+
+    return counted_method
+
+
+def count_outcomes(results: list[AllocationResult]) -> list[AllocationResult]:
+    """
+    Counts the outcome of many order lines in ALLOCATIONS.
+
+    Returns:
+        list[AllocationResult]: The results, unchanged.
+    """
+    for result in results:
+        ALLOCATIONS.labels(result.error or "allocated").inc()
+
+    return results
+
+
+# Batch attributes overwritten when ingesting a batch whose reference already exists.
+UPSERTED_BATCH_FIELDS = ("_purchased_quantity", "eta")
+# An existing batch is never shrunk below the quantity already allocated from it.
+UPSERTED_BATCH_FLOOR = {"_purchased_quantity": "_allocated_quantity"}
+
+T = TypeVar("T")
+
+
 class AllocationService:
     """
     Abstraction responsible for allocating orders.
+
+    Args:
+        uow: The unit of work.
+        engine: When given, order lines are allocated by this in-memory engine instead of the database, and the
+            batches added are registered with it.
+        catalog: When given, order lines of SKUs unknown to this catalog are rejected without querying the
+            database, and the SKUs of the batches added are registered with it.
+        retries: How many times allocations are retried when a product was changed concurrently.
+        backoff: Seconds waited before the first retry, doubled on every following one.
     """
 
-    def __init__(self, uow: AbstractUnitOfWork):
+    def __init__(
+        self,
+        uow: AbstractUnitOfWork,
+        engine: "InMemoryAllocationEngine | None" = None,
+        catalog: "SkuCatalog | None" = None,
+        retries: int = 3,
+        backoff: float = 0.01,
+    ):
         self.uow = uow
+        self.engine = engine
+        self.catalog = catalog
+        self.retries = retries
+        self.backoff = backoff
 
+    @counted
     def allocate(self, order_id: str, sku: str, qty: int) -> str:
         """
         Allocates an order line.
@@ -66,19 +209,37 @@ class AllocationService:
             NoBatchesAvailable: Raised when there are no batches available.
             InvalidSku: Raised when the SKU is invalid.
             OutOfStock: Raised when there is no stock available.
+            ConcurrentUpdate: Raised when the product kept being changed concurrently after every retry.
         """
+        reject_unknown_sku(self.catalog, sku)
+
+        if self.engine is not None:
+            return self.engine.allocate(order_id, sku, qty)
+
         line = OrderLine(order_id=order_id, sku=sku, qty=qty)
 
+        return retry_on_conflict(lambda: self._allocate(line), self.retries, self.backoff)
+
+    def _allocate(self, line: OrderLine) -> str:
         with self.uow:
-            batches: list[Batch] = self.uow.batches.find_all()
+            allocated = allocated_lines(self.uow.allocations.find_by_orders([line.order_id]))
+
+            if line in allocated:
+                return allocated[line]
 
-            if not batches:
-                raise NoBatchesAvailable()
+            product: Product | None = self.uow.products.find_by(sku=line.sku)
 
-            if not is_valid_sku(sku, batches):
-                raise InvalidSku(sku)
+            if product is None:
+                # Only the SKU's product is loaded, so tell an unknown SKU from an empty store apart.
+                if not self.uow.products.exists():
+                    raise NoBatchesAvailable()
 
-            batch_ref = allocate(line, batches)
+                if self.catalog is not None:
+                    self.catalog.record_false_positive()
+
+                raise InvalidSku(line.sku)
+
+            batch_ref = product.allocate(line)
 
             if batch_ref is None:
                 raise OutOfStock()
@@ -87,6 +248,77 @@ class AllocationService:
 
         return batch_ref
 
+    def deallocate(self, order_id: str, sku: str, qty: int) -> str:
+        """
+        Deallocates an order line from the batch holding it.
+
+        Args:
+            order_id: Identifier of an order line
+            sku: The Stock Keeping Unit
+            qty: Quantity of the order line
+
+        Returns:
+            str: The reference of the batch deallocated.
+
+        Raises:
+            NotAllocated: Raised when the order line is not allocated.
+        """
+        line = OrderLine(order_id=order_id, sku=sku, qty=qty)
+
+        if self.engine is not None:
+            return self.engine.deallocate(line)
+
+        with self.uow:
+            removed = self.uow.allocations.remove([order_id], lines=[line])
+
+            if not removed:
+                raise NotAllocated(order_id)
+
+            self.uow.commit()
+
+        return removed[0].reference
+
+    def cancel_order(self, order_id: str) -> list[Allocation]:
+        """
+        Deallocates every line of an order.
+
+        Args:
+            order_id: The order ID.
+
+        Returns:
+            list[Allocation]: The allocations removed.
+
+        Raises:
+            NotAllocated: Raised when no line of the order is allocated.
+        """
+        removed = self.cancel_orders([order_id])
+
+        if not removed:
+            raise NotAllocated(order_id)
+
+        return removed
+
+    def cancel_orders(self, order_ids: Iterable[str]) -> list[Allocation]:
+        """
+        Deallocates every line of many orders in a single unit of work, with set-based statements.
+
+        Args:
+            order_ids: The order IDs. Those without allocations are ignored.
+
+        Returns:
+            list[Allocation]: The allocations removed.
+        """
+        order_ids = list(dict.fromkeys(order_ids))
+
+        if self.engine is not None:
+            return self.engine.cancel(order_ids)
+
+        with self.uow:
+            removed = self.uow.allocations.remove(order_ids)
+            self.uow.commit()
+
+        return removed
+
     def add_batch(self, ref: str, sku: str, qty: int, eta: date | None = None):
         """
         Adds a batch.
@@ -96,11 +328,336 @@ class AllocationService:
             sku: The Stock Keeping Unit
             qty: Quantity of the batch
             eta: Estimated time of arrival
+
+        Raises:
+            DuplicateBatch: Raised when the reference is already taken.
         """
         with self.uow:
+            self.uow.products.upsert_many([Product(sku)], key="sku", update=())
             self.uow.batches.save(Batch(ref=ref, sku=sku, qty=qty, eta=eta))
+
+            try:
+                self.uow.commit()
+            except IntegrityError as e:
+                raise DuplicateBatch(ref) from e
+
+        register_batch(ref, sku, qty, eta, self.engine, self.catalog)
+
+    def add_batches(self, batches: Iterable[dict]) -> int:
+        """
+        Adds many batches in a single unit of work, updating the quantity and ETA of those already known.
+
+        A known batch whose new quantity is below the quantity already allocated from it is kept as is. The products
+        of the batches get a new version, so allocations which read them concurrently are retried.
+
+        Args:
+            batches: The batches, as mappings of ref, sku, qty and eta.
+
+        Returns:
+            int: The number of batches added or updated.
+        """
+        entities = [Batch(**batch) for batch in batches]
+
+        with self.uow:
+            self.uow.products.upsert_many(products_of(entities), key="sku", update=(), increment=("version_number",))
+            self.uow.batches.upsert_many(
+                entities, key="reference", update=UPSERTED_BATCH_FIELDS, floor=UPSERTED_BATCH_FLOOR
+            )
             self.uow.commit()
 
+        register_batches(entities, self.engine, self.catalog)
+
+        return len(entities)
+
+    def allocate_many(self, lines: Iterable[dict]) -> list[AllocationResult]:
+        """
+        Allocates many order lines in a single unit of work.
+
+        Lines are grouped by SKU, so the product of each SKU is loaded once. A line which cannot be allocated
+        does not prevent the others from being allocated. When any of the products is changed concurrently, every
+        line is allocated again.
+
+        Args:
+            lines: The order lines, as mappings of order_id, sku and qty.
+
+        Returns:
+            list[AllocationResult]: The outcome of each line, in the given order.
+
+        Raises:
+            ConcurrentUpdate: Raised when the products kept being changed concurrently after every retry.
+        """
+        if self.engine is not None:
+            return count_outcomes(allocate_with_engine(self.engine, lines))
+
+        lines_by_sku = group_by_sku(lines)
+
+        return count_outcomes(retry_on_conflict(lambda: self._allocate_many(lines_by_sku), self.retries, self.backoff))
+
+    def _allocate_many(self, lines_by_sku: dict[str, list[tuple[int, OrderLine]]]) -> list[AllocationResult]:
+        results: dict[int, AllocationResult] = {}
+
+        with self.uow:
+            allocated = allocated_lines(self.uow.allocations.find_by_orders(order_ids_of(lines_by_sku)))
+            store_is_empty: bool | None = None
+
+            for sku, indexed_lines in lines_by_sku.items():
+                known = self.catalog is None or self.catalog.might_contain(sku)
+                product: Product | None = self.uow.products.find_by(sku=sku) if known else None
+
+                if product is None and store_is_empty is None:
+                    store_is_empty = not self.uow.products.exists()
+
+                results.update(allocate_group(indexed_lines, product, bool(store_is_empty), allocated))
+
+            self.uow.commit()
+
+        return [results[i] for i in sorted(results)]
+
+
+class AsyncAllocationService:
+    """
+    Asynchronous counterpart of AllocationService, which does not block while waiting on the database.
+
+    Args:
+        uow: The asynchronous unit of work.
+        engine: An optional in-memory allocation engine, see AllocationService.
+        catalog: An optional SKU catalog, see AllocationService.
+        retries: How many times allocations are retried on concurrent changes, see AllocationService.
+        backoff: Seconds waited before the first retry, see AllocationService.
+    """
+
+    def __init__(
+        self,
+        uow: AbstractAsyncUnitOfWork,
+        engine: "InMemoryAllocationEngine | None" = None,
+        catalog: "SkuCatalog | None" = None,
+        retries: int = 3,
+        backoff: float = 0.01,
+    ):
+        self.uow = uow
+        self.engine = engine
+        self.catalog = catalog
+        self.retries = retries
+        self.backoff = backoff
+
+    @counted
+    async def allocate(self, order_id: str, sku: str, qty: int) -> str:
+        """
+        Allocates an order line.
+
+        Args:
+            order_id: Identifier of an order line
+            sku: The Stock Keeping Unit
+            qty: Quantity of the order line
+
+        Returns:
+            str: The reference of the batch allocated.
+
+        Raises:
+            NoBatchesAvailable: Raised when there are no batches available.
+            InvalidSku: Raised when the SKU is invalid.
+            OutOfStock: Raised when there is no stock available.
+            ConcurrentUpdate: Raised when the product kept being changed concurrently after every retry.
+        """
+        reject_unknown_sku(self.catalog, sku)
+
+        if self.engine is not None:
+            return await self.engine.run_async(self.engine.allocate, order_id, sku, qty)
+
+        line = OrderLine(order_id=order_id, sku=sku, qty=qty)
+
+        return await retry_on_conflict_async(lambda: self._allocate(line), self.retries, self.backoff)
+
+    async def _allocate(self, line: OrderLine) -> str:
+        async with self.uow:
+            allocated = allocated_lines(await self.uow.allocations.find_by_orders([line.order_id]))
+
+            if line in allocated:
+                return allocated[line]
+
+            product: Product | None = await self.uow.products.find_by(sku=line.sku)
+
+            if product is None:
+                if not await self.uow.products.exists():
+                    raise NoBatchesAvailable()
+
+                if self.catalog is not None:
+                    self.catalog.record_false_positive()
+
+                raise InvalidSku(line.sku)
+
+            batch_ref = product.allocate(line)
+
+            if batch_ref is None:
+                raise OutOfStock()
+
+            await self.uow.commit()
+
+        return batch_ref
+
+    async def deallocate(self, order_id: str, sku: str, qty: int) -> str:
+        """
+        Deallocates an order line from the batch holding it.
+
+        Args:
+            order_id: Identifier of an order line
+            sku: The Stock Keeping Unit
+            qty: Quantity of the order line
+
+        Returns:
+            str: The reference of the batch deallocated.
+
+        Raises:
+            NotAllocated: Raised when the order line is not allocated.
+        """
+        line = OrderLine(order_id=order_id, sku=sku, qty=qty)
+
+        if self.engine is not None:
+            return await self.engine.run_async(self.engine.deallocate, line)
+
+        async with self.uow:
+            removed = await self.uow.allocations.remove([order_id], lines=[line])
+
+            if not removed:
+                raise NotAllocated(order_id)
+
+            await self.uow.commit()
+
+        return removed[0].reference
+
+    async def cancel_order(self, order_id: str) -> list[Allocation]:
+        """
+        Deallocates every line of an order.
+
+        Args:
+            order_id: The order ID.
+
+        Returns:
+            list[Allocation]: The allocations removed.
+
+        Raises:
+            NotAllocated: Raised when no line of the order is allocated.
+        """
+        removed = await self.cancel_orders([order_id])
+
+        if not removed:
+            raise NotAllocated(order_id)
+
+        return removed
+
+    async def cancel_orders(self, order_ids: Iterable[str]) -> list[Allocation]:
+        """
+        Deallocates every line of many orders in a single unit of work, see AllocationService.cancel_orders.
+
+        Args:
+            order_ids: The order IDs. Those without allocations are ignored.
+
+        Returns:
+            list[Allocation]: The allocations removed.
+        """
+        order_ids = list(dict.fromkeys(order_ids))
+
+        if self.engine is not None:
+            return await self.engine.run_async(self.engine.cancel, order_ids)
+
+        async with self.uow:
+            removed = await self.uow.allocations.remove(order_ids)
+            await self.uow.commit()
+
+        return removed
+
+    async def add_batch(self, ref: str, sku: str, qty: int, eta: date | None = None):
+        """
+        Adds a batch.
+
+        Args:
+            ref: The batch reference.
+            sku: The Stock Keeping Unit
+            qty: Quantity of the batch
+            eta: Estimated time of arrival
+
+        Raises:
+            DuplicateBatch: Raised when the reference is already taken.
+        """
+        async with self.uow:
+            await self.uow.products.upsert_many([Product(sku)], key="sku", update=())
+            await self.uow.batches.save(Batch(ref=ref, sku=sku, qty=qty, eta=eta))
+
+            try:
+                await self.uow.commit()
+            except IntegrityError as e:
+                raise DuplicateBatch(ref) from e
+
+        register_batch(ref, sku, qty, eta, self.engine, self.catalog)
+
+    async def add_batches(self, batches: Iterable[dict]) -> int:
+        """
+        Adds many batches in a single unit of work, see AllocationService.add_batches.
+
+        Args:
+            batches: The batches, as mappings of ref, sku, qty and eta.
+
+        Returns:
+            int: The number of batches added or updated.
+        """
+        entities = [Batch(**batch) for batch in batches]
+
+        async with self.uow:
+            await self.uow.products.upsert_many(
+                products_of(entities), key="sku", update=(), increment=("version_number",)
+            )
+            await self.uow.batches.upsert_many(
+                entities, key="reference", update=UPSERTED_BATCH_FIELDS, floor=UPSERTED_BATCH_FLOOR
+            )
+            await self.uow.commit()
+
+        register_batches(entities, self.engine, self.catalog)
+
+        return len(entities)
+
+    async def allocate_many(self, lines: Iterable[dict]) -> list[AllocationResult]:
+        """
+        Allocates many order lines in a single unit of work, see AllocationService.allocate_many.
+
+        Args:
+            lines: The order lines, as mappings of order_id, sku and qty.
+
+        Returns:
+            list[AllocationResult]: The outcome of each line, in the given order.
+
+        Raises:
+            ConcurrentUpdate: Raised when the products kept being changed concurrently after every retry.
+        """
+        if self.engine is not None:
+            # Allocating a line again returns its batch, so lines allocated before the queue filled up are kept.
+            results = await self.engine.run_async(functools.partial(allocate_with_engine, self.engine), list(lines))
+            return count_outcomes(results)
+
+        lines_by_sku = group_by_sku(lines)
+        results = await retry_on_conflict_async(lambda: self._allocate_many(lines_by_sku), self.retries, self.backoff)
+
+        return count_outcomes(results)
+
+    async def _allocate_many(self, lines_by_sku: dict[str, list[tuple[int, OrderLine]]]) -> list[AllocationResult]:
+        results: dict[int, AllocationResult] = {}
+
+        async with self.uow:
+            allocated = allocated_lines(await self.uow.allocations.find_by_orders(order_ids_of(lines_by_sku)))
+            store_is_empty: bool | None = None
+
+            for sku, indexed_lines in lines_by_sku.items():
+                known = self.catalog is None or self.catalog.might_contain(sku)
+                product: Product | None = await self.uow.products.find_by(sku=sku) if known else None
+
+                if product is None and store_is_empty is None:
+                    store_is_empty = not await self.uow.products.exists()
+
+                results.update(allocate_group(indexed_lines, product, bool(store_is_empty), allocated))
+
+            await self.uow.commit()
+
+        return [results[i] for i in sorted(results)]
+
 
 def allocate(order: OrderLine, batches: list[Batch]) -> str | None:
     """
@@ -125,15 +682,238 @@ def allocate(order: OrderLine, batches: list[Batch]) -> str | None:
     return None
 
 
-def is_valid_sku(sku: str, batches: list[Batch]) -> bool:
+def reject_unknown_sku(catalog: "SkuCatalog | None", sku: str):
     """
-    Checks if the SKU is valid.
+    Rejects an SKU which is certainly unknown to a SKU catalog, if any, without querying the database.
 
     Args:
+        catalog: The SKU catalog.
         sku: The SKU to check.
-        batches: a set of batches.
+
+    Raises:
+        InvalidSku: Raised when the catalog does not know the SKU.
+        NoBatchesAvailable: Raised when the catalog does not know any SKU.
+    """
+    if catalog is not None and not catalog.might_contain(sku):
+        raise InvalidSku(sku) if catalog.size else NoBatchesAvailable()
+
+
+def group_by_sku(lines: Iterable[dict]) -> dict[str, list[tuple[int, OrderLine]]]:
+    """
+    Groups order lines by SKU, keeping their position.
+
+    Args:
+        lines: The order lines, as mappings of order_id, sku and qty.
+
+    Returns:
+        dict[str, list[tuple[int, OrderLine]]]: The indexed order lines of each SKU.
+    """
+    groups: dict[str, list[tuple[int, OrderLine]]] = {}
+
+    for i, line in enumerate(lines):
+        order_line = OrderLine(**line)
+        groups.setdefault(order_line.sku, []).append((i, order_line))
+
+    return groups
+
+
+def allocate_group(
+    lines: list[tuple[int, OrderLine]],
+    product: Product | None,
+    store_is_empty: bool,
+    allocated: dict[OrderLine, str] | None = None,
+) -> Iterable[tuple[int, AllocationResult]]:
+    """
+    Allocates the lines of a SKU to its batches, one at a time and in order.
+
+    Args:
+        lines: The indexed order lines of a SKU.
+        product: The product of that SKU, None if it is unknown.
+        store_is_empty: Whether there are no batches at all, to tell NoBatchesAvailable from InvalidSku.
+        allocated: The batch of the lines already allocated, see allocated_lines. Updated with the lines allocated.
+
+    Returns:
+        Iterable[tuple[int, AllocationResult]]: The indexed outcome of each line.
+    """
+    allocated = {} if allocated is None else allocated
+
+    for i, line in lines:
+        if line in allocated:
+            yield i, AllocationResult(line.order_id, line.sku, line.qty, reference=allocated[line])
+            continue
+
+        if product is None:
+            error = NoBatchesAvailable if store_is_empty else InvalidSku
+            yield i, AllocationResult(line.order_id, line.sku, line.qty, error=error.__name__)
+            continue
+
+        batch_ref = product.allocate(line)
+        error_name = None if batch_ref is not None else OutOfStock.__name__
+
+        if batch_ref is not None:
+            allocated[line] = batch_ref
+
+        yield i, AllocationResult(line.order_id, line.sku, line.qty, reference=batch_ref, error=error_name)
+
+
+def allocated_lines(allocations: Iterable[Allocation]) -> dict[OrderLine, str]:
+    """
+    Maps allocated lines to the reference of their batch.
+
+    The allocations of the batches of a product are not loaded, so lines allocated before are looked up by their
+    order instead, and allocating one again returns its batch rather than allocating it twice.
+
+    Args:
+        allocations: The allocations of some orders.
+
+    Returns:
+        dict[OrderLine, str]: The batch reference of every allocated line.
+    """
+    return {OrderLine(a.order_id, a.sku, a.qty): a.reference for a in allocations}
+
+
+def order_ids_of(lines_by_sku: dict[str, list[tuple[int, OrderLine]]]) -> list[str]:
+    """
+    Lists the distinct order IDs of grouped order lines.
+    """
+    return sorted({line.order_id for indexed_lines in lines_by_sku.values() for _, line in indexed_lines})
+
+
+def allocate_with_engine(
+    engine: "InMemoryAllocationEngine", lines: Iterable[dict], wait: bool = True
+) -> list[AllocationResult]:
+    """
+    Allocates many order lines with an in-memory allocation engine.
+
+    Args:
+        engine: The in-memory allocation engine.
+        lines: The order lines, as mappings of order_id, sku and qty.
+        wait: Whether to wait for room in the write-behind queue, see InMemoryAllocationEngine.allocate.
 
     Returns:
-        bool: True if the SKU is valid, False otherwise.
+        list[AllocationResult]: The outcome of each line, in the given order.
     """
-    return sku in {b.sku for b in batches}
+    results = []
+
+    for line in lines:
+        try:
+            results.append(AllocationResult(**line, reference=engine.allocate(**line, wait=wait)))
+        except (InvalidSku, OutOfStock, NoBatchesAvailable) as e:
+            results.append(AllocationResult(**line, error=type(e).__name__))
+
+    return results
+
+
+def products_of(batches: Iterable[Batch]) -> list[Product]:
+    """
+    Lists the products of some batches, ordered by SKU so concurrent writers lock them in the same order.
+
+    Args:
+        batches: The batches.
+
+    Returns:
+        list[Product]: A new product for each SKU.
+    """
+    return [Product(sku) for sku in sorted({batch.sku for batch in batches})]
+
+
+def retry_on_conflict(operation: Callable[[], T], retries: int, backoff: float) -> T:
+    """
+    Runs an operation, running it again when it conflicts with a concurrent one.
+
+    Retries wait for an exponentially growing and randomized delay, so contending operations spread out.
+
+    Args:
+        operation: The operation, which must run in its own unit of work.
+        retries: How many times the operation is retried at most.
+        backoff: Seconds waited before the first retry, at most.
+
+    Returns:
+        T: The result of the operation.
+
+    Raises:
+        ConcurrentUpdate: Raised when the last retry conflicts as well.
+    """
+    attempt = 0
+
+    while True:
+        try:
+            return operation()
+        except ConcurrentUpdate:
+            if attempt >= retries:
+                raise
+
+        time.sleep(random.uniform(0, backoff * 2**attempt))
+        attempt += 1
+
+
+async def retry_on_conflict_async(operation: Callable[[], Awaitable[T]], retries: int, backoff: float) -> T:
+    """
+    Awaits an operation, awaiting it again when it conflicts with a concurrent one, see retry_on_conflict.
+
+    Args:
+        operation: The operation, which must run in its own unit of work.
+        retries: How many times the operation is retried at most.
+        backoff: Seconds waited before the first retry, at most.
+
+    Returns:
+        T: The result of the operation.
+
+    Raises:
+        ConcurrentUpdate: Raised when the last retry conflicts as well.
+    """
+    attempt = 0
+
+    while True:
+        try:
+            return await operation()
+        except ConcurrentUpdate:
+            if attempt >= retries:
+                raise
+
+        await asyncio.sleep(random.uniform(0, backoff * 2**attempt))
+        attempt += 1
+
+
+def register_batch(
+    ref: str,
+    sku: str,
+    qty: int,
+    eta: date | None,
+    engine: "InMemoryAllocationEngine | None" = None,
+    catalog: "SkuCatalog | None" = None,
+):
+    """
+    Registers a committed batch with an in-memory allocation engine and a SKU catalog, if any.
+
+    Args:
+        ref: The batch reference.
+        sku: The Stock Keeping Unit
+        qty: Quantity of the batch
+        eta: Estimated time of arrival
+        engine: The in-memory allocation engine.
+        catalog: The SKU catalog.
+    """
+    if engine is not None:
+        engine.add_batch(ref, sku, qty, eta)
+
+    if catalog is not None:
+        catalog.add(sku)
+
+
+def register_batches(
+    batches: Iterable[Batch],
+    engine: "InMemoryAllocationEngine | None" = None,
+    catalog: "SkuCatalog | None" = None,
+):
+    """
+    Registers committed batches with an in-memory allocation engine and a SKU catalog, if any.
+
+    Args:
+        batches: The committed batches.
+        engine: The in-memory allocation engine.
+        catalog: The SKU catalog.
+    """
+    for batch in batches:
+        # pylint: disable=protected-access
+        register_batch(batch.reference, batch.sku, batch._purchased_quantity, batch.eta, engine, catalog)
@@ -0,0 +1,172 @@
+"""Allocation Batcher
+
+Groups the allocations submitted concurrently, and applies each group with a single unit of work and a single
+commit. A group is closed once its window has elapsed since its first allocation, or once it is full. While a group
+is being applied, the following allocations wait for the next one, so groups grow with the load.
+
+Every caller gets the outcome of its own order line. When the group as a whole fails, e.g. on a database error,
+every caller gets that error.
+"""
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from allocation.adapters.metrics import SIZE_BUCKETS, Histogram
+from allocation.service_layer.allocation_service import (
+    AllocationResult,
+    AllocationService,
+    AsyncAllocationService,
+    InvalidSku,
+    NoBatchesAvailable,
+    OutOfStock,
+)
+
+ERRORS = {
+    InvalidSku.__name__: lambda result: InvalidSku(result.sku),
+    OutOfStock.__name__: lambda result: OutOfStock(),
+    NoBatchesAvailable.__name__: lambda result: NoBatchesAvailable(),
+}
+
+
+@dataclass
+class _Request:
+    line: dict
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class AllocationBatcher:
+    """
+    Applies concurrent allocations in groups.
+
+    Attributes:
+        batch_sizes (Histogram): The number of allocations applied together.
+        wait_seconds (Histogram): The seconds allocations waited for their group to be applied.
+
+    Args:
+        service_factory: Builds the allocation service applying a group.
+        window: Seconds a group stays open after its first allocation.
+        max_size: How many allocations a group holds at most.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable[[], AllocationService | AsyncAllocationService],
+        window: float = 0.002,
+        max_size: int = 100,
+    ):
+        self.service_factory = service_factory
+        self.window = window
+        self.max_size = max_size
+        self.batch_sizes = Histogram("allocation_batch_size", "Allocations applied together", SIZE_BUCKETS)
+        self.wait_seconds = Histogram("allocation_batch_wait_seconds", "Seconds waited for the group to be applied")
+        self._queue: asyncio.Queue[_Request | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        """
+        Starts grouping allocations on the running event loop.
+        """
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._collect(), name="allocation-batcher")
+
+    async def stop(self):
+        """
+        Applies the pending allocations and stops grouping them.
+        """
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+
+    async def allocate(self, order_id: str, sku: str, qty: int) -> str:
+        """
+        Submits an allocation to the next group, and waits for it.
+
+        Args:
+            order_id: Identifier of an order line
+            sku: The Stock Keeping Unit
+            qty: Quantity of the order line
+
+        Returns:
+            str: The reference of the batch allocated.
+
+        Raises:
+            NoBatchesAvailable: Raised when there are no batches available.
+            InvalidSku: Raised when the SKU is invalid.
+            OutOfStock: Raised when there is no stock available.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Request({"order_id": order_id, "sku": sku, "qty": qty}, future))
+        return await future
+
+    def stats(self) -> dict:
+        """
+        Returns the batch size and wait time histograms.
+        """
+        return {"batch_size": self.batch_sizes.snapshot(), "wait_seconds": self.wait_seconds.snapshot()}
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            first = await self._queue.get()
+
+            if first is None:
+                break
+
+            group, deadline = [first], loop.time() + self.window
+
+            while len(group) < self.max_size:
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+
+                if request is None:
+                    stopping = True
+                    break
+
+                group.append(request)
+
+            await self._apply(group)
+
+    async def _apply(self, group: list[_Request]):
+        started = time.perf_counter()
+        self.batch_sizes.observe(len(group))
+
+        for request in group:
+            self.wait_seconds.observe(started - request.enqueued_at)
+
+        lines = [request.line for request in group]
+
+        try:
+            service = self.service_factory()
+
+            if inspect.iscoroutinefunction(service.allocate_many):
+                results = await service.allocate_many(lines)
+            else:
+                results = await asyncio.to_thread(service.allocate_many, lines)
+        except Exception as e:  # pylint: disable=broad-except
+            for request in group:
+                _resolve(request.future, error=e)
+            return
+
+        for request, result in zip(group, results):
+            _resolve(request.future, result=result)
+
+
+def _resolve(future: asyncio.Future, result: AllocationResult | None = None, error: Exception | None = None):
+    if future.done():
+        return
+
+    if error is None and result.error is not None:
+        error = ERRORS[result.error](result)
+
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result.reference)
@@ -1,34 +1,278 @@
 """
 This module contains the FastAPI router dependencies which are injected.
 """
-from sqlalchemy.orm import clear_mappers
+from typing import Iterator
+
+from fastapi import Depends
+from sqlalchemy.orm import Session
 
 from allocation.adapters import database
-from allocation.adapters.orm import start_mappers
+from allocation.adapters.profiling import ProfileStore
 from allocation.adapters.repository import SqlAlchemyRepository
+from allocation.app.config.settings import settings
 from allocation.domain import models
-from allocation.service_layer.unit_of_work import AbstractUnitOfWork, SqlAlchemyUnitOfWork
+from allocation.service_layer.allocation_engine import InMemoryAllocationEngine
+from allocation.service_layer.allocation_service import AllocationService, AsyncAllocationService
+from allocation.service_layer.batcher import AllocationBatcher
+from allocation.service_layer.dispatcher import AllocationDispatcher
+from allocation.service_layer.idempotency import IdempotencyCache
+from allocation.service_layer.sku_catalog import SkuCatalog
+from allocation.service_layer.unit_of_work import (
+    AbstractAsyncUnitOfWork,
+    AbstractUnitOfWork,
+    AsyncSqlAlchemyUnitOfWork,
+    SqlAlchemyUnitOfWork,
+)
+
+# Process-wide in-memory allocation engine, when enabled.
+_allocation_engine: InMemoryAllocationEngine | None = None
+
+# Process-wide SKU catalog, when enabled.
+_sku_catalog: SkuCatalog | None = None
+
+# Process-wide allocation dispatcher, when enabled.
+_allocation_dispatcher: AllocationDispatcher | None = None
+
+# Process-wide allocation batcher, when enabled.
+_allocation_batcher: AllocationBatcher | None = None
+
+# Process-wide idempotency cache, when enabled.
+_idempotency_cache: IdempotencyCache | None = None
+
+# Process-wide store of request profiles, when profiling is enabled.
+_profile_store: ProfileStore | None = None
 
 
-def get_session():
+def get_session() -> Iterator[Session]:
     """
-    Obtains a session for the used database.
+    Obtains a session for the used database, closed once the request is done.
     """
-    start_mappers()
-    yield database.SessionLocal()
-    clear_mappers()
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
 
 
-def get_batch_repository() -> SqlAlchemyRepository:
+def get_batch_repository(session: Session = Depends(get_session)) -> SqlAlchemyRepository:
     """
     Returns the SqlAlchemy repository instance for batches.
     """
-    session = next(get_session())
     return SqlAlchemyRepository(session=session, kind=models.Batch)
 
 
 def get_uow() -> AbstractUnitOfWork:
     """
     Returns the Unit of Work instance.
+
+    Its session is opened when the unit of work is entered and closed when it exits, so each request gets its own.
+    """
+    return SqlAlchemyUnitOfWork(database.SessionLocal)
+
+
+def get_async_uow() -> AbstractAsyncUnitOfWork:
+    """
+    Returns the asynchronous Unit of Work instance.
+    """
+    return AsyncSqlAlchemyUnitOfWork(database.AsyncSessionLocal)
+
+
+def start_allocation_engine(engine: InMemoryAllocationEngine):
+    """
+    Starts the process-wide in-memory allocation engine, which is then injected into the services.
+
+    Args:
+        engine: The engine to start.
+    """
+    global _allocation_engine  # pylint: disable=global-statement
+    engine.start()
+    _allocation_engine = engine
+
+
+def stop_allocation_engine():
+    """
+    Stops the process-wide in-memory allocation engine, persisting its queued allocations.
+    """
+    global _allocation_engine  # pylint: disable=global-statement
+    if _allocation_engine is not None:
+        _allocation_engine.stop()
+        _allocation_engine = None
+
+
+def get_allocation_engine() -> InMemoryAllocationEngine | None:
+    """
+    Returns the in-memory allocation engine, None when allocations are made against the database.
+    """
+    return _allocation_engine
+
+
+def start_sku_catalog(catalog: SkuCatalog):
+    """
+    Loads the process-wide SKU catalog, which is then injected into the services.
+
+    Args:
+        catalog: The catalog to load.
+    """
+    global _sku_catalog  # pylint: disable=global-statement
+    catalog.refresh()
+    _sku_catalog = catalog
+
+
+def stop_sku_catalog():
+    """
+    Discards the process-wide SKU catalog.
+    """
+    global _sku_catalog  # pylint: disable=global-statement
+    _sku_catalog = None
+
+
+def get_sku_catalog() -> SkuCatalog | None:
+    """
+    Returns the SKU catalog, None when every SKU is looked up in the database.
+    """
+    return _sku_catalog
+
+
+async def start_allocation_dispatcher(dispatcher: AllocationDispatcher):
+    """
+    Starts the process-wide allocation dispatcher, which then allocates the order lines of the endpoints.
+
+    Args:
+        dispatcher: The dispatcher to start.
+    """
+    global _allocation_dispatcher  # pylint: disable=global-statement
+    await dispatcher.start()
+    _allocation_dispatcher = dispatcher
+
+
+async def stop_allocation_dispatcher():
+    """
+    Stops the process-wide allocation dispatcher, allocating its queued order lines.
+    """
+    global _allocation_dispatcher  # pylint: disable=global-statement
+    if _allocation_dispatcher is not None:
+        await _allocation_dispatcher.stop()
+        _allocation_dispatcher = None
+
+
+def get_allocation_dispatcher() -> AllocationDispatcher | None:
+    """
+    Returns the allocation dispatcher, None when every request allocates on its own.
+    """
+    return _allocation_dispatcher
+
+
+async def start_allocation_batcher(batcher: AllocationBatcher):
+    """
+    Starts the process-wide allocation batcher, which then allocates the order lines of the endpoints in groups.
+
+    Args:
+        batcher: The batcher to start.
+    """
+    global _allocation_batcher  # pylint: disable=global-statement
+    await batcher.start()
+    _allocation_batcher = batcher
+
+
+async def stop_allocation_batcher():
+    """
+    Stops the process-wide allocation batcher, applying its pending order lines.
+    """
+    global _allocation_batcher  # pylint: disable=global-statement
+    if _allocation_batcher is not None:
+        await _allocation_batcher.stop()
+        _allocation_batcher = None
+
+
+def get_allocation_batcher() -> AllocationBatcher | None:
+    """
+    Returns the allocation batcher, None when every request commits on its own.
+    """
+    return _allocation_batcher
+
+
+def start_idempotency_cache(cache: IdempotencyCache):
+    """
+    Purges the expired outcomes of the process-wide idempotency cache, which is then injected into the endpoints.
+
+    Args:
+        cache: The cache to start.
+    """
+    global _idempotency_cache  # pylint: disable=global-statement
+    cache.purge()
+    _idempotency_cache = cache
+
+
+def stop_idempotency_cache():
+    """
+    Discards the process-wide idempotency cache.
+    """
+    global _idempotency_cache  # pylint: disable=global-statement
+    _idempotency_cache = None
+
+
+def get_idempotency_cache() -> IdempotencyCache | None:
+    """
+    Returns the idempotency cache, None when retried allocations run again.
+    """
+    return _idempotency_cache
+
+
+def start_profile_store(store: ProfileStore):
+    """
+    Sets the process-wide store of request profiles, which is then used by the profiling middleware and endpoints.
+
+    Args:
+        store: The store to start.
+    """
+    global _profile_store  # pylint: disable=global-statement
+    _profile_store = store
+
+
+def stop_profile_store():
+    """
+    Discards the process-wide store of request profiles, the profiles stored are kept.
+    """
+    global _profile_store  # pylint: disable=global-statement
+    _profile_store = None
+
+
+def get_profile_store() -> ProfileStore | None:
+    """
+    Returns the store of request profiles, None when profiling is disabled.
+    """
+    return _profile_store
+
+
+def get_allocation_service(
+    uow: AbstractUnitOfWork = Depends(get_uow),
+    engine: InMemoryAllocationEngine | None = Depends(get_allocation_engine),
+    catalog: SkuCatalog | None = Depends(get_sku_catalog),
+) -> AllocationService:
+    """
+    Returns the Allocation Service instance.
+    """
+    return AllocationService(
+        uow,
+        engine=engine,
+        catalog=catalog,
+        retries=settings.ALLOCATION_RETRIES,
+        backoff=settings.ALLOCATION_RETRY_BACKOFF,
+    )
+
+
+def get_async_allocation_service(
+    uow: AbstractAsyncUnitOfWork = Depends(get_async_uow),
+    engine: InMemoryAllocationEngine | None = Depends(get_allocation_engine),
+    catalog: SkuCatalog | None = Depends(get_sku_catalog),
+) -> AsyncAllocationService:
+    """
+    Returns the asynchronous Allocation Service instance.
     """
-    return SqlAlchemyUnitOfWork()
+    return AsyncAllocationService(
+        uow,
+        engine=engine,
+        catalog=catalog,
+        retries=settings.ALLOCATION_RETRIES,
+        backoff=settings.ALLOCATION_RETRY_BACKOFF,
+    )
@@ -0,0 +1,145 @@
+"""Allocation Dispatcher
+
+Routes every allocation to one of a fixed number of asyncio workers, chosen by the hash of its SKU. Each worker
+owns its SKUs and allocates them one at a time, so allocations of the same SKU never conflict with each other, while
+those of different SKUs run in parallel on the other workers.
+
+Workers wait on the blocking service in a thread, or on the asynchronous one on the event loop.
+"""
+import asyncio
+import inspect
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable
+
+from allocation.service_layer.allocation_service import AllocationService, AsyncAllocationService
+
+
+@dataclass
+class _Request:
+    order_id: str
+    sku: str
+    qty: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class _Worker:
+    queue: asyncio.Queue
+    task: asyncio.Task | None = None
+    processed: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class AllocationDispatcher:
+    """
+    Dispatches allocations to SKU-affine workers.
+
+    Args:
+        service_factory: Builds the allocation service of a worker, used for one allocation at a time.
+        workers: The number of workers.
+        queue_size: How many allocations may wait for each worker before submitting waits as well.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable[[], AllocationService | AsyncAllocationService],
+        workers: int = 4,
+        queue_size: int = 1000,
+    ):
+        self.service_factory = service_factory
+        self.workers = workers
+        self.queue_size = queue_size
+        self._workers: list[_Worker] = []
+
+    async def start(self):
+        """
+        Starts the workers on the running event loop.
+        """
+        self._workers = [_Worker(asyncio.Queue(maxsize=self.queue_size)) for _ in range(self.workers)]
+
+        for i, worker in enumerate(self._workers):
+            worker.task = asyncio.create_task(self._work(worker), name=f"allocation-worker-{i}")
+
+    async def stop(self):
+        """
+        Allocates the queued order lines and stops the workers.
+        """
+        for worker in self._workers:
+            await worker.queue.put(None)
+
+        await asyncio.gather(*(worker.task for worker in self._workers if worker.task is not None))
+        self._workers = []
+
+    def worker_of(self, sku: str) -> int:
+        """
+        Chooses the worker owning a SKU, the same one across processes and restarts.
+
+        Args:
+            sku: The Stock Keeping Unit
+
+        Returns:
+            int: The index of the worker.
+        """
+        return zlib.crc32(sku.encode()) % self.workers
+
+    async def allocate(self, order_id: str, sku: str, qty: int) -> str:
+        """
+        Submits an allocation to the worker owning its SKU, and waits for it.
+
+        Args:
+            order_id: Identifier of an order line
+            sku: The Stock Keeping Unit
+            qty: Quantity of the order line
+
+        Returns:
+            str: The reference of the batch allocated.
+
+        Raises:
+            NoBatchesAvailable: Raised when there are no batches available.
+            InvalidSku: Raised when the SKU is invalid.
+            OutOfStock: Raised when there is no stock available.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._workers[self.worker_of(sku)].queue.put(_Request(order_id, sku, qty, future))
+        return await future
+
+    def stats(self) -> list[dict]:
+        """
+        Returns the queue depth and latency of every worker, latencies including the time spent queued.
+        """
+        return [
+            {
+                "worker": i,
+                "queue_depth": worker.queue.qsize(),
+                "processed": worker.processed,
+                "mean_latency": worker.total_seconds / worker.processed if worker.processed else 0.0,
+                "max_latency": worker.max_seconds,
+            }
+            for i, worker in enumerate(self._workers)
+        ]
+
+    async def _work(self, worker: _Worker):
+        service = self.service_factory()
+        blocking = not inspect.iscoroutinefunction(service.allocate)
+
+        while (request := await worker.queue.get()) is not None:
+            try:
+                if blocking:
+                    result = await asyncio.to_thread(service.allocate, request.order_id, request.sku, request.qty)
+                else:
+                    result = await service.allocate(request.order_id, request.sku, request.qty)
+            except Exception as e:  # pylint: disable=broad-except
+                if not request.future.done():
+                    request.future.set_exception(e)
+            else:
+                if not request.future.done():
+                    request.future.set_result(result)
+
+            elapsed = time.perf_counter() - request.enqueued_at
+            worker.processed += 1
+            worker.total_seconds += elapsed
+            worker.max_seconds = max(worker.max_seconds, elapsed)
@@ -0,0 +1,177 @@
+"""Idempotency
+
+Replays the outcome of a request retried with the same idempotency key, instead of running it again.
+
+Outcomes are kept in a bounded least recently used cache, and written through to a store, so replays are answered
+from memory without a unit of work, and from the store after a restart or by another process. While a request runs,
+its duplicates wait for its outcome instead of running in parallel.
+
+Only successful outcomes are kept: a failed request did not change anything, so running it again is safe.
+"""
+import asyncio
+import datetime
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Sequence
+
+from allocation.adapters.idempotency import AbstractIdempotencyStore
+
+
+class IdempotencyKeyReused(Exception):
+    """
+    Raised when an idempotency key is sent again with another request.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.message = "Idempotency key already used for another request"
+        super().__init__(self.message)
+
+
+class IdempotencyCache:
+    """
+    Runs requests at most once per idempotency key.
+
+    Attributes:
+        hits (int): Requests answered with a stored outcome.
+        misses (int): Requests which ran.
+        joined (int): Requests which waited for a duplicate in flight.
+
+    Args:
+        store: Where outcomes are written through, None to only keep them in memory.
+        max_size: How many outcomes are kept in memory at most.
+        ttl: Seconds after which an outcome expires.
+    """
+
+    def __init__(self, store: AbstractIdempotencyStore | None = None, max_size: int = 10000, ttl: float = 86400):
+        self.store = store
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self._outcomes: OrderedDict[str, tuple[str, str, float]] = OrderedDict()
+        self._in_flight: dict[str, tuple[str, asyncio.Future]] = {}
+
+    async def run(self, key: str, fingerprint: str, operation: Callable[[], Awaitable[str]]) -> str:
+        """
+        Runs a request, unless it already ran or is running with the same key.
+
+        Args:
+            key: The idempotency key.
+            fingerprint: Identifies the request, to detect keys reused for another one.
+            operation: Runs the request.
+
+        Returns:
+            str: The outcome of the request.
+
+        Raises:
+            IdempotencyKeyReused: Raised when the key was used for another request.
+        """
+        cached = self._recall(key)
+
+        if cached is not None:
+            return self._replay(key, fingerprint, cached)
+
+        if key in self._in_flight:
+            running, future = self._in_flight[key]
+            self._check(key, fingerprint, running)
+            self.joined += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, future)
+
+        try:
+            stored = await self._load(key)
+
+            if stored is not None:
+                self._remember(key, *stored)
+                outcome = self._replay(key, fingerprint, stored)
+            else:
+                self.misses += 1
+                outcome = await operation()
+                self._remember(key, fingerprint, outcome)
+
+                if self.store is not None:
+                    await asyncio.to_thread(self.store.put, key, fingerprint, outcome)
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody may be waiting for it, which is not worth a warning.
+            future.exception()
+            raise
+        else:
+            future.set_result(outcome)
+            return outcome
+        finally:
+            del self._in_flight[key]
+
+    async def forget(self, keys: Sequence[str]):
+        """
+        Forgets the outcomes of some keys, e.g. once what they allocated is deallocated, so retries run again.
+
+        Args:
+            keys: The idempotency keys.
+        """
+        for key in keys:
+            self._outcomes.pop(key, None)
+
+        if self.store is not None and keys:
+            await asyncio.to_thread(self.store.delete, keys)
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+        """
+        return {"size": len(self._outcomes), "hits": self.hits, "misses": self.misses, "joined": self.joined}
+
+    def purge(self) -> int:
+        """
+        Deletes the expired outcomes from the store.
+
+        Returns:
+            int: The number of outcomes deleted.
+        """
+        if self.store is None:
+            return 0
+
+        return self.store.purge(datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl))
+
+    def _recall(self, key: str) -> tuple[str, str] | None:
+        entry = self._outcomes.get(key)
+
+        if entry is None:
+            return None
+
+        fingerprint, outcome, stored_at = entry
+
+        if time.monotonic() - stored_at > self.ttl:
+            del self._outcomes[key]
+            return None
+
+        self._outcomes.move_to_end(key)
+        return fingerprint, outcome
+
+    def _remember(self, key: str, fingerprint: str, outcome: str):
+        self._outcomes[key] = (fingerprint, outcome, time.monotonic())
+        self._outcomes.move_to_end(key)
+
+        while len(self._outcomes) > self.max_size:
+            self._outcomes.popitem(last=False)
+
+    async def _load(self, key: str) -> tuple[str, str] | None:
+        if self.store is None:
+            return None
+
+        newer_than = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl)
+        return await asyncio.to_thread(self.store.get, key, newer_than)
+
+    def _replay(self, key: str, fingerprint: str, stored: tuple[str, str]) -> str:
+        self._check(key, fingerprint, stored[0])
+        self.hits += 1
+        return stored[1]
+
+    @staticmethod
+    def _check(key: str, fingerprint: str, expected: str):
+        if fingerprint != expected:
+            raise IdempotencyKeyReused(key)
@@ -0,0 +1,220 @@
+"""Allocation Planner
+
+Plans the allocation of many pending order lines to the current batches at once, for what-if scenarios and offline
+planning, without changing the batches.
+
+The plan makes the same decisions as allocating the lines one at a time, in order, with allocate: every line goes to
+the earliest batch of its SKU, by ETA, with enough stock left. Rather than trying every batch for every line, each
+batch is filled in turn, earliest first, from the lines the previous batches left: the run of lines whose cumulative
+quantity fits is taken at once, the line which overflows is skipped along with every later line larger than the stock
+left, and the rest are scanned again. Lines are scanned in doubling windows, until no line can fit the stock left, so
+a million lines are planned in seconds. The few lines of the quieter SKUs are planned one at a time instead.
+
+Lines are assumed to be distinct, with positive quantities, and not allocated yet.
+
+Needs numpy, see the planner extra.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable, Sequence
+
+try:
+    import numpy as np
+except ImportError as e:  # pragma: no cover
+    raise ImportError("The allocation planner needs numpy, install the planner extra") from e
+
+from allocation.domain.models import Batch, OrderLine
+from allocation.service_layer.allocation_service import AllocationResult, InvalidSku, OutOfStock
+
+# Assignment of a line which fits in no batch of its SKU.
+OUT_OF_STOCK = -1
+
+# Assignment of a line whose SKU has no batches.
+INVALID_SKU = -2
+
+# Lines a batch is first filled from.
+WINDOW = 4096
+
+# Lines of a SKU planned one at a time, which is cheaper than calling numpy for every batch of a few lines.
+SMALL_GROUP = 256
+
+
+@dataclass(frozen=True)
+class AllocationPlan:
+    """
+    The batch planned for every order line.
+
+    Attributes:
+        references (list[str]): The references of the batches, earliest first.
+        assignments (np.ndarray): The index in references of the batch of every line, in the given order, or
+            OUT_OF_STOCK or INVALID_SKU.
+        allocated (np.ndarray): The quantity the plan allocates to every batch, indexed as references.
+    """
+
+    references: list[str]
+    assignments: np.ndarray
+    allocated: np.ndarray
+
+    def reference(self, line: int) -> str | None:
+        """
+        Returns the reference of the batch planned for a line, None if it cannot be allocated.
+
+        Args:
+            line: The position of the line.
+        """
+        assignment = int(self.assignments[line])
+        return self.references[assignment] if assignment >= 0 else None
+
+    def results(self, lines: Sequence[OrderLine]) -> list[AllocationResult]:
+        """
+        Describes the plan as allocate_many outcomes.
+
+        Args:
+            lines: The order lines planned, in the same order.
+
+        Returns:
+            list[AllocationResult]: The outcome of each line.
+        """
+        errors = {OUT_OF_STOCK: OutOfStock.__name__, INVALID_SKU: InvalidSku.__name__}
+        references = [self.references[assignment] if assignment >= 0 else None for assignment in self.assignments]
+
+        return [
+            AllocationResult(line.order_id, line.sku, line.qty, reference=reference, error=errors.get(assignment))
+            for line, assignment, reference in zip(lines, self.assignments.tolist(), references)
+        ]
+
+
+def plan_allocations(skus: Sequence[str], quantities: Sequence[int], batches: Iterable[Batch]) -> AllocationPlan:
+    """
+    Plans the allocation of order lines, given as columns, to batches.
+
+    Args:
+        skus: The SKU of every line.
+        quantities: The quantity of every line.
+        batches: The batches, of any SKU, with their current allocations. They are left unchanged.
+
+    Returns:
+        AllocationPlan: The batch planned for every line.
+    """
+    # Sorted as allocate sorts them, without calling Batch.__gt__: warehouse stock first, then by ETA, ties in order.
+    ordered = sorted(batches, key=lambda batch: (batch.eta is not None, batch.eta or date.min))
+    references = [batch.reference for batch in ordered]
+    available = np.array([batch.available_quantity for batch in ordered], dtype=np.int64)
+    batches_by_sku: dict[str, list[int]] = {}
+
+    for index, batch in enumerate(ordered):
+        batches_by_sku.setdefault(batch.sku, []).append(index)
+
+    sku_codes = {sku: code for code, sku in enumerate(batches_by_sku)}
+    codes = np.fromiter((sku_codes.get(sku, -1) for sku in skus), dtype=np.int64, count=len(skus))
+    quantities = np.asarray(quantities, dtype=np.int64)
+
+    assignments = np.where(codes >= 0, OUT_OF_STOCK, INVALID_SKU)
+    allocated = np.zeros(len(ordered), dtype=np.int64)
+
+    # The lines of every SKU, kept in order.
+    by_sku = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[by_sku], np.arange(len(sku_codes) + 1))
+
+    for code, sku_batches in enumerate(batches_by_sku.values()):
+        pending = by_sku[starts[code]:starts[code + 1]]
+        smallest = int(quantities[pending].min()) if pending.size else 0
+
+        if pending.size <= SMALL_GROUP:
+            plan_group(pending, sku_batches, quantities, available, assignments, allocated)
+            continue
+
+        for index in sku_batches:
+            if pending.size == 0:
+                break
+
+            if available[index] < smallest:
+                continue
+
+            taken = fill(quantities[pending], int(available[index]), smallest)
+            assignments[pending[taken]] = index
+            allocated[index] = quantities[pending[taken]].sum()
+            pending = np.delete(pending, taken)
+
+    return AllocationPlan(references, assignments, allocated)
+
+
+def plan_group(
+    lines: np.ndarray,
+    batches: list[int],
+    quantities: np.ndarray,
+    available: np.ndarray,
+    assignments: np.ndarray,
+    allocated: np.ndarray,
+):
+    """
+    Plans the lines of a SKU one at a time, as allocate does, updating the assignments and allocated quantities.
+
+    Args:
+        lines: The positions of the lines, in order.
+        batches: The indexes of the batches of the SKU, earliest first.
+        quantities: The quantity of every line.
+        available: The quantity available in every batch.
+        assignments: The assignment of every line.
+        allocated: The quantity allocated to every batch.
+    """
+    capacities = available[batches].tolist()
+
+    for line, quantity in zip(lines.tolist(), quantities[lines].tolist()):
+        for position, capacity in enumerate(capacities):
+            if capacity >= quantity:
+                capacities[position] -= quantity
+                assignments[line] = batches[position]
+                allocated[batches[position]] += quantity
+                break
+
+
+def plan_order_lines(lines: Sequence[OrderLine], batches: Iterable[Batch]) -> AllocationPlan:
+    """
+    Plans the allocation of order lines to batches, see plan_allocations.
+
+    Args:
+        lines: The order lines.
+        batches: The batches, left unchanged.
+
+    Returns:
+        AllocationPlan: The batch planned for every line.
+    """
+    return plan_allocations([line.sku for line in lines], [line.qty for line in lines], batches)
+
+
+def fill(quantities: np.ndarray, capacity: int, smallest: int = 1) -> np.ndarray:
+    """
+    Fills a batch with the lines which fit in it, one at a time and in order.
+
+    Args:
+        quantities: The quantities of the lines.
+        capacity: The quantity available in the batch.
+        smallest: The smallest quantity of the lines, or less, to stop once no line fits.
+
+    Returns:
+        np.ndarray: The positions of the lines taken, in order.
+    """
+    taken = []
+    start, size = 0, WINDOW
+
+    # Windows double, so a batch filled early is not scanned to the end.
+    while start < quantities.size and capacity >= smallest:
+        window = quantities[start:start + size]
+        # A line larger than the stock left never fits later, as it only decreases.
+        candidates = np.flatnonzero(window <= capacity)
+
+        while candidates.size:
+            totals = np.cumsum(window[candidates])
+            count = int(np.searchsorted(totals, capacity, side="right"))
+            taken.append(candidates[:count] + start)
+            capacity -= int(totals[count - 1])
+
+            # The line at count overflows, and the first candidate always fits, so every pass takes and skips a line.
+            rest = candidates[count + 1:]
+            candidates = rest[window[rest] <= capacity]
+
+        start += size
+        size *= 2
+
+    return np.concatenate(taken) if taken else np.empty(0, dtype=np.int64)
@@ -0,0 +1,219 @@
+"""SKU Catalog
+
+An in-process cache of the known SKUs, so order lines of unknown SKUs are rejected without a database round trip.
+
+The SKUs are kept either in a set, or in a Bloom filter which takes a fraction of the memory at the cost of some
+false positives. Either way, an SKU reported as unknown is certainly unknown to this process, while a known one
+still goes through the database.
+
+SKUs added through the service layer are registered once committed. Batches added by other processes are only seen
+after the next refresh, when a time to live is configured.
+
+A Bloom filter cannot grow, nor forget an SKU, so it is rebuilt from the database, sized from the number of SKUs, on
+every refresh, and as soon as the SKUs registered since outgrow it, which keeps its false positive rate bounded.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Callable
+
+from allocation.service_layer.unit_of_work import AbstractUnitOfWork
+
+log = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    A set membership filter, which may report false positives but never false negatives.
+
+    Args:
+        capacity: The number of items expected.
+        error_rate: The false positive rate once the capacity is reached, between 0 and 1 exclusive.
+
+    Attributes:
+        capacity (int): The number of items expected.
+
+    Raises:
+        ValueError: If the error rate is out of range.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        if not 0 < error_rate < 1:
+            raise ValueError(f"The error rate of a Bloom filter must be between 0 and 1 exclusive, not {error_rate}")
+
+        self.capacity = capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray(math.ceil(self.size / 8))
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        """
+        Adds an item to the filter.
+        """
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class SkuCatalog:
+    """
+    Caches the SKUs which have batches.
+
+    Attributes:
+        hits (int): Lookups answered by the catalog alone, i.e. rejected SKUs.
+        misses (int): Lookups of possibly known SKUs, which go on to the database.
+        false_positives (int): Misses for which the database did not know the SKU either.
+        refreshes (int): How many times the catalog was loaded from the database.
+
+    Args:
+        uow_factory: Builds the unit of work used to load the SKUs.
+        bloom: Whether to keep the SKUs in a Bloom filter rather than a set.
+        error_rate: The false positive rate of the Bloom filter, between 0 and 1 exclusive.
+        ttl: Seconds after which the catalog is reloaded in the background, None to keep it.
+
+    Raises:
+        ValueError: If the error rate of a Bloom filter is out of range.
+    """
+
+    def __init__(
+        self,
+        uow_factory: Callable[[], AbstractUnitOfWork],
+        bloom: bool = False,
+        error_rate: float = 0.01,
+        ttl: float | None = None,
+    ):
+        if bloom and not 0 < error_rate < 1:
+            raise ValueError(f"The error rate of a Bloom filter must be between 0 and 1 exclusive, not {error_rate}")
+
+        self.uow_factory = uow_factory
+        self.bloom = bloom
+        self.error_rate = error_rate
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.false_positives = 0
+        self.refreshes = 0
+        self.size = 0
+        self._members: set[str] | BloomFilter = set()
+        self._loaded_at: float | None = None
+        # The SKUs added while each running refresh loads, which it may have missed.
+        self._added_during: list[set[str]] = []
+        self._refreshing = threading.Lock()
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Reloads the SKUs from the database, keeping the ones added meanwhile.
+        """
+        added: set[str] = set()
+
+        with self._lock:
+            self._added_during.append(added)
+
+        try:
+            with self.uow_factory() as uow:
+                skus = uow.batches.find_distinct("sku")
+
+            # A Bloom filter cannot grow, so leave room for the SKUs added until the next refresh.
+            members: set[str] | BloomFilter = BloomFilter(2 * len(skus), self.error_rate) if self.bloom else set()
+
+            for sku in skus:
+                members.add(sku)
+
+            with self._lock:
+                # Batches committed while loading may be missing from the SKUs loaded.
+                size = len(skus) + sum(1 for sku in added if sku not in members)
+
+                for sku in added:
+                    members.add(sku)
+
+                self._members, self.size = members, size
+                self._loaded_at = time.monotonic()
+                self.refreshes += 1
+        finally:
+            with self._lock:
+                self._added_during.remove(added)
+
+        log.debug("SKU catalog loaded %d SKUs.", size)
+
+    def add(self, sku: str):
+        """
+        Registers the SKU of a committed batch, rebuilding a Bloom filter it outgrows in the background.
+        """
+        with self._lock:
+            for added in self._added_during:
+                added.add(sku)
+
+            if sku not in self._members:
+                self._members.add(sku)
+                self.size += 1
+
+            outgrown = isinstance(self._members, BloomFilter) and self.size > self._members.capacity
+
+        if outgrown:
+            self._refresh_in_background()
+
+    def might_contain(self, sku: str) -> bool:
+        """
+        Checks whether an SKU may have batches, counting the lookup.
+
+        Args:
+            sku: The SKU to check.
+
+        Returns:
+            bool: False if the SKU is certainly unknown, True if it may be known.
+        """
+        if self._loaded_at is None:
+            self.refresh()
+        elif self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl:
+            self._refresh_in_background()
+
+        found = sku in self._members
+
+        if found:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return found
+
+    def record_false_positive(self):
+        """
+        Counts a possibly known SKU which turned out to be unknown.
+        """
+        self.false_positives += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the catalog counters.
+        """
+        return {
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "false_positives": self.false_positives,
+            "refreshes": self.refreshes,
+        }
+
+    def _refresh_in_background(self):
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def refresh():
+            try:
+                self.refresh()
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Could not refresh the SKU catalog.")
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=refresh, name="sku-catalog-refresh", daemon=True).start()
@@ -6,17 +6,51 @@ us to finally and fully decouple our service layer from the data layer.
 """
 import abc
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-
-from allocation.adapters.database import get_session_factory
-from allocation.adapters.repository import AbstractRepository, SqlAlchemyRepository
-from allocation.domain.models import Batch
+from sqlalchemy.orm.exc import StaleDataError
+
+from allocation.adapters import database
+from allocation.adapters.metrics import REGISTRY
+from allocation.adapters.orm import eager_allocations_loader, product_batches_loader
+from allocation.adapters.repository import (
+    AbstractAllocationRepository,
+    AbstractAsyncAllocationRepository,
+    AbstractAsyncRepository,
+    AbstractRepository,
+    AsyncSqlAlchemyAllocationRepository,
+    AsyncSqlAlchemyRepository,
+    SqlAlchemyAllocationRepository,
+    SqlAlchemyRepository,
+)
+from allocation.domain.models import Batch, Product
+
+UOW_SECONDS = REGISTRY.histogram(
+    "uow_operation_duration_seconds",
+    "Seconds spent entering, committing and rolling back units of work.",
+    labels=("operation",),
+)
+ENTER_SECONDS, COMMIT_SECONDS, ROLLBACK_SECONDS = (
+    UOW_SECONDS.labels(operation) for operation in ("enter", "commit", "rollback")
+)
+
+
+class ConcurrentUpdate(Exception):
+    """
+    Raised when committing changes to an aggregate which was changed by another transaction since it was loaded.
+    """
+
+    def __init__(self):
+        self.message = "Changed concurrently, try again"
+        super().__init__(self.message)
 
 
 class AbstractUnitOfWork(abc.ABC):
     """Abstract Unit of Work"""
 
     batches: AbstractRepository
+    products: AbstractRepository
+    allocations: AbstractAllocationRepository
 
     def __exit__(self, *args):
         self.rollback()
@@ -26,7 +60,11 @@ class AbstractUnitOfWork(abc.ABC):
 
     @abc.abstractmethod
     def commit(self):
-        """Commits the changes to the database."""
+        """Commits the changes to the database.
+
+        Raises:
+            ConcurrentUpdate: When a product was changed by another transaction since it was loaded.
+        """
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -38,21 +76,92 @@ class AbstractUnitOfWork(abc.ABC):
 class SqlAlchemyUnitOfWork(AbstractUnitOfWork):
     """SQLAlchemy Unit of Work Implementation"""
 
-    def __init__(self, session_factory=get_session_factory):
-        self.session_factory = session_factory
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or database.SessionLocal
         self.session: Session | None = None
 
     def __enter__(self):
-        self.session = self.session_factory()
-        self.batches = SqlAlchemyRepository(session=self.session, kind=Batch)
+        with ENTER_SECONDS.time():
+            self.session = self.session_factory()
+            self.batches = SqlAlchemyRepository(session=self.session, kind=Batch)
+            self.products = SqlAlchemyRepository(session=self.session, kind=Product, options=[product_batches_loader()])
+            self.allocations = SqlAlchemyAllocationRepository(session=self.session)
         return self
 
     def commit(self):
-        self.session.commit()
+        try:
+            with COMMIT_SECONDS.time():
+                self.session.commit()
+        except StaleDataError as e:
+            raise ConcurrentUpdate() from e
 
     def rollback(self):
-        self.session.rollback()
+        with ROLLBACK_SECONDS.time():
+            self.session.rollback()
 
     def __exit__(self, *args):
         super().__exit__(*args)
         self.session.close()
+
+
+class AbstractAsyncUnitOfWork(abc.ABC):
+    """Abstract asynchronous Unit of Work, used as an async context manager."""
+
+    batches: AbstractAsyncRepository
+    products: AbstractAsyncRepository
+    allocations: AbstractAsyncAllocationRepository
+
+    async def __aexit__(self, *args):
+        await self.rollback()
+
+    async def __aenter__(self):
+        return self
+
+    @abc.abstractmethod
+    async def commit(self):
+        """Commits the changes to the database.
+
+        Raises:
+            ConcurrentUpdate: When a product was changed by another transaction since it was loaded.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def rollback(self):
+        """Rolls back the changes to the database."""
+        raise NotImplementedError
+
+
+class AsyncSqlAlchemyUnitOfWork(AbstractAsyncUnitOfWork):
+    """SQLAlchemy asyncio Unit of Work Implementation"""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or database.AsyncSessionLocal
+        self.session: AsyncSession | None = None
+
+    async def __aenter__(self):
+        with ENTER_SECONDS.time():
+            self.session = self.session_factory()
+            self.batches = AsyncSqlAlchemyRepository(
+                session=self.session, kind=Batch, options=[eager_allocations_loader()]
+            )
+            self.products = AsyncSqlAlchemyRepository(
+                session=self.session, kind=Product, options=[product_batches_loader()]
+            )
+            self.allocations = AsyncSqlAlchemyAllocationRepository(session=self.session)
+        return self
+
+    async def commit(self):
+        try:
+            with COMMIT_SECONDS.time():
+                await self.session.commit()
+        except StaleDataError as e:
+            raise ConcurrentUpdate() from e
+
+    async def rollback(self):
+        with ROLLBACK_SECONDS.time():
+            await self.session.rollback()
+
+    async def __aexit__(self, *args):
+        await super().__aexit__(*args)
+        await self.session.close()
@@ -1,34 +1,163 @@
 """
 Logging configuration
+
+Records are put on a bounded queue by the thread which logs them, and written by a single listener thread, so a
+slow stdout pipe never stalls the request threads or the event loop. Records logged while the queue is full are
+dropped and counted, rather than waited for.
+
+The per-request lines of the allocation endpoints, logged by LOGGER_NAME, may be sampled, keeping warnings and
+errors. Records are written as text, or as JSON objects, one per line, for log collectors.
 """
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import TextIO
+
+from uvicorn.logging import DefaultFormatter
+
+# Logs the lines of every allocation request.
+LOGGER_NAME = "allocation_service"
+
+# Logs everything else, from the modules of the package.
+PACKAGE_LOGGER_NAME = "allocation"
+
+LOG_FORMAT = "[%(asctime)s] %(levelprefix)s %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_listener: QueueListener | None = None
+_handler: "DroppingQueueHandler | None" = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as JSON objects, with their UTC time, level, logger and message, and their exception if any.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        # Cheaper than formatTime, which goes through strftime with the local time zone.
+        seconds = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        document = {
+            "time": f"{seconds}.{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(document, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the records below WARNING, and every other one.
+
+    Args:
+        rate: Fraction of the records below WARNING kept.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded queue without waiting, dropping them once it is full.
+
+    Attributes:
+        dropped (int): The number of records dropped.
+    """
+
+    def __init__(self, queue_: queue.Queue):
+        super().__init__(queue_)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def start_logging(
+    level: str = "INFO",
+    request_level: str = "INFO",
+    request_sample_rate: float = 1.0,
+    json_format: bool = False,
+    queue_size: int = 10000,
+    stream: TextIO | None = None,
+) -> DroppingQueueHandler:
+    """
+    Routes the records of the package loggers through a queue to a listener thread writing them, once per process.
+
+    Args:
+        level: Level of the package loggers.
+        request_level: Level of the per-request logger.
+        request_sample_rate: Fraction of the per-request records below WARNING logged.
+        json_format: Whether records are written as JSON objects rather than text.
+        queue_size: Records which may wait to be written, 0 for no limit.
+        stream: Where records are written, stdout by default.
+
+    Returns:
+        DroppingQueueHandler: The handler of the package loggers.
+    """
+    global _listener, _handler  # pylint: disable=global-statement
+
+    if _handler is not None:
+        return _handler
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if json_format else DefaultFormatter(LOG_FORMAT, DATE_FORMAT))
+
+    _handler = DroppingQueueHandler(queue.Queue(queue_size))
+    _listener = QueueListener(_handler.queue, output)
+
+    package_logger = logging.getLogger(PACKAGE_LOGGER_NAME)
+    package_logger.setLevel(level)
+    package_logger.addHandler(_handler)
+
+    request_logger = logging.getLogger(LOGGER_NAME)
+    request_logger.setLevel(request_level)
+    request_logger.addHandler(_handler)
+    request_logger.addFilter(SamplingFilter(request_sample_rate))
+
+    _listener.start()
+    return _handler
+
+
+def stop_logging():
+    """
+    Writes the records still queued, then detaches the queue from the package loggers.
+    """
+    global _listener, _handler  # pylint: disable=global-statement
+
+    if _handler is None:
+        return
+
+    _listener.stop()
+
+    request_logger = logging.getLogger(LOGGER_NAME)
+
+    for log_filter in [log_filter for log_filter in request_logger.filters if isinstance(log_filter, SamplingFilter)]:
+        request_logger.removeFilter(log_filter)
+
+    for logger in (logging.getLogger(PACKAGE_LOGGER_NAME), request_logger):
+        logger.removeHandler(_handler)
+
+    _listener = _handler = None
+
 
-from pydantic import BaseModel
-
-
-class LogConfig(BaseModel):
-    """Logging configuration to be set for the server"""
-
-    LOGGER_NAME: str = "allocation_service"
-    LOG_FORMAT: str = "[%(asctime)s] %(levelprefix)s %(message)s"
-    LOG_LEVEL: str = "DEBUG"
-
-    # Logging config
-    version = 1
-    disable_existing_loggers = False
-    formatters = {
-        "default": {
-            "()": "uvicorn.logging.DefaultFormatter",
-            "fmt": LOG_FORMAT,
-            "datefmt": "%Y-%m-%d %H:%M:%S",
-        },
-    }
-    handlers = {
-        "default": {
-            "formatter": "default",
-            "class": "logging.StreamHandler",
-            "stream": "ext://sys.stdout",
-        },
-    }
-    loggers = {
-        LOGGER_NAME: {"handlers": ["default"], "level": LOG_LEVEL},
-    }
+def get_log_handler() -> DroppingQueueHandler | None:
+    """
+    Returns the queue handler of the package loggers, None until logging is started.
+    """
+    return _handler
@@ -1,19 +1,22 @@
 """
 This module contains pytest fixtures.
 """
+from contextlib import contextmanager
 from functools import partial
-from typing import Callable
+from typing import Callable, Iterator
 
 import pytest
 import sqlalchemy.engine
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import clear_mappers, sessionmaker
 from sqlalchemy.pool import StaticPool
 from starlette.testclient import TestClient
 
 from allocation.adapters.orm import metadata, start_mappers
+from allocation.adapters.query_stats import QueryStats, instrument, track_queries
 from allocation.main import app
-from allocation.service_layer.unit_of_work import SqlAlchemyUnitOfWork
+from allocation.service_layer.unit_of_work import AsyncSqlAlchemyUnitOfWork, SqlAlchemyUnitOfWork
 
 
 @pytest.fixture(name="test_client")
@@ -84,3 +87,73 @@ def uow(session_factory) -> SqlAlchemyUnitOfWork:
         SqlAlchemyUnitOfWork: A unit of work for the in-memory SQLite database.
     """
     return SqlAlchemyUnitOfWork(session_factory=session_factory)
+
+
+@pytest.fixture(name="query_budget")
+def fixture_query_budget(in_memory_db) -> Callable:
+    """
+    Asserts the SQL statements a block executes on the in-memory SQLite database stay within a budget.
+
+    Used as `with query_budget(statements=7): ...`, it catches queries added by a change, e.g. relationships lazy
+    loaded once per entity, which also shows as the same statement repeated.
+
+    Parameters:
+        in_memory_db (sqlalchemy.engine.Engine): The in-memory SQLite database.
+
+    Returns:
+        Callable: Builds the context manager from the statements allowed, and the times any of them may repeat.
+    """
+    instrument(in_memory_db)
+
+    @contextmanager
+    def query_budget(statements: int, repeats: int = 1) -> Iterator[QueryStats]:
+        with track_queries() as stats:
+            yield stats
+
+        assert stats.statements <= statements, f"Over a budget of {statements} statements: {stats.report()}"
+        assert stats.most_repeated()[1] <= repeats, f"Statement repeated over {repeats} times: {stats.report()}"
+
+    return query_budget
+
+
+@pytest.fixture(name="async_session_factory")
+def fixture_async_session_factory(tmp_path) -> Callable:
+    """
+    Creates an asynchronous session factory for a temporary SQLite database file.
+
+    A file is used instead of an in-memory database, so that no connection is shared between event loops.
+
+    Parameters:
+        tmp_path: A temporary directory.
+
+    Returns:
+        Callable: An AsyncSession factory.
+    """
+    database = tmp_path / "test.db"
+    metadata.create_all(create_engine(f"sqlite:///{database}"))
+    start_mappers()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+    yield sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    clear_mappers()
+
+
+@pytest.fixture
+def async_uow(async_session_factory) -> AsyncSqlAlchemyUnitOfWork:
+    """
+    Provides an asynchronous unit of work for a temporary SQLite database.
+
+    Args:
+        async_session_factory: An AsyncSession factory.
+
+    Returns:
+        AsyncSqlAlchemyUnitOfWork: An asynchronous unit of work.
+    """
+    return AsyncSqlAlchemyUnitOfWork(session_factory=async_session_factory)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    """
+    Runs the asynchronous tests on asyncio only.
+    """
+    return "asyncio"
@@ -1,9 +1,25 @@
 """
 This module test the FastAPI API.
 """
+import json
 import uuid
 
-from allocation.service_layer.allocation_service import InvalidSku, NoBatchesAvailable, OutOfStock
+import pytest
+
+from allocation.adapters.profiling import ProfileStore
+from allocation.app.config.settings import settings
+from allocation.entrypoints.responses import json_response_class
+from allocation.main import app
+from allocation.service_layer.allocation_service import DuplicateBatch, InvalidSku, NoBatchesAvailable, OutOfStock
+from allocation.service_layer.dependencies import (
+    get_idempotency_cache,
+    get_sku_catalog,
+    start_profile_store,
+    stop_profile_store,
+)
+from allocation.service_layer.idempotency import IdempotencyCache
+from allocation.service_layer.sku_catalog import SkuCatalog
+from allocation.service_layer.unit_of_work import SqlAlchemyUnitOfWork
 from tests.mocks import override_uow
 
 
@@ -92,6 +108,19 @@ class TestAPI:
         assert r.status_code == 201
         assert r.json() == {"reference": early_batch}
 
+    def test_api_rejects_existing_batch_references(self, test_client, uow):
+        """
+        Tests that the API answers a conflict, rather than failing, when a batch reference is taken.
+        """
+        self.override_dependencies(uow)
+        batch_ref = random_batch_ref(1)
+        post_to_add_batch(test_client, batch_ref, random_sku(), 100)
+
+        r = test_client.post("/api/v1/batches", json={"ref": batch_ref, "sku": random_sku(), "qty": 10})
+
+        assert r.status_code == 409
+        assert r.json()["detail"] == DuplicateBatch(batch_ref).message
+
     def test_api_no_batches(self, test_client, uow):
         """
         Tests that the API returns a 404 when there are no batches.
@@ -136,9 +165,318 @@ class TestAPI:
         assert r.status_code == 400
         assert r.json()["detail"] == OutOfStock().message
 
+    def test_api_allocates_in_bulk(self, test_client, uow):
+        """
+        Tests that the bulk API allocates every line it can and reports the others.
+        """
+        self.override_dependencies(uow)
+        sku, unknown_sku = random_sku(), random_sku()
+        batch_ref = random_batch_ref(None)
+
+        post_to_add_batch(test_client, batch_ref, sku, 10, None)
+
+        lines = [
+            {"orderId": "o1", "sku": sku, "qty": 6},
+            {"orderId": "o2", "sku": sku, "qty": 6},
+            {"orderId": "o3", "sku": unknown_sku, "qty": 1},
+        ]
+        r = test_client.post("/api/v1/allocations/bulk", json=lines)
+
+        assert r.status_code == 200
+        assert [(line["reference"], line["error"]) for line in r.json()] == [
+            (batch_ref, None),
+            (None, "OutOfStock"),
+            (None, "InvalidSku"),
+        ]
+
+    def test_api_renders_responses_with_orjson(self, test_client, uow, monkeypatch):
+        """
+        Tests that responses rendered with orjson follow the response models, as with the standard library.
+        """
+        self.override_dependencies(uow)
+        monkeypatch.setattr(settings, "JSON_RESPONSE", "orjson")
+        sku, batch_ref, order_id = random_sku(), random_batch_ref(None), random_orderid()
+
+        r = test_client.post("/api/v1/batches", json={"ref": batch_ref, "sku": sku, "qty": 10, "eta": "2011-01-02"})
+        assert r.json() == {"ref": batch_ref, "sku": sku, "qty": 10, "eta": "2011-01-02"}
+
+        r = test_client.post("/api/v1/allocations", json={"orderId": order_id, "sku": sku, "qty": 1})
+        assert r.status_code == 201
+        assert r.json() == {"reference": batch_ref}
+
+        r = test_client.post("/api/v1/allocations/bulk", json=[{"orderId": "o2", "sku": sku, "qty": 20}])
+        assert r.json() == [{"orderId": "o2", "sku": sku, "qty": 20, "reference": None, "error": "OutOfStock"}]
+
+        r = test_client.delete(f"/api/v1/orders/{order_id}")
+        assert r.json() == [{"orderId": order_id, "sku": sku, "qty": 1, "reference": batch_ref}]
+
+        with pytest.raises(ValueError):
+            json_response_class("yaml")
+
+    def test_api_rejects_unknown_skus_from_the_catalog(self, test_client, uow, session_factory):
+        """
+        Tests that unknown SKUs are rejected by the SKU catalog, whose counters are exposed.
+        """
+        self.override_dependencies(uow)
+        catalog = SkuCatalog(lambda: SqlAlchemyUnitOfWork(session_factory))
+        app.dependency_overrides[get_sku_catalog] = lambda: catalog
+
+        try:
+            post_to_add_batch(test_client, random_batch_ref(None), random_sku(), 100, None)
+
+            r = test_client.post("/api/v1/allocations", json={"order_id": random_orderid(), "sku": "X", "qty": 1})
+            assert r.status_code == 400
+
+            r = test_client.get("/api/v1/catalog/stats")
+            assert r.status_code == 200
+            assert r.json() | {"refreshes": 0} == {
+                "size": 1,
+                "hits": 1,
+                "misses": 0,
+                "falsePositives": 0,
+                "refreshes": 0,
+            }
+        finally:
+            app.dependency_overrides.pop(get_sku_catalog)
+
+    def test_api_catalog_stats_when_disabled(self, test_client):
+        """
+        Tests that the catalog counters are not found when the catalog is disabled.
+        """
+        assert test_client.get("/api/v1/catalog/stats").status_code == 404
+
+    def test_api_replays_retried_allocations(self, test_client, uow):
+        """
+        Tests that an allocation retried with the same idempotency key is replayed, and that the key cannot be reused.
+        """
+        self.override_dependencies(uow)
+        cache = IdempotencyCache()
+        app.dependency_overrides[get_idempotency_cache] = lambda: cache
+        sku, batch_ref = random_sku(), random_batch_ref(None)
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+        try:
+            post_to_add_batch(test_client, batch_ref, sku, 10, None)
+            data = {"order_id": random_orderid(), "sku": sku, "qty": 10}
+
+            for _ in range(2):
+                r = test_client.post("/api/v1/allocations", json=data, headers=headers)
+                assert r.status_code == 201
+                assert r.json()["reference"] == batch_ref
+
+            r = test_client.post("/api/v1/allocations", json=data | {"qty": 1}, headers=headers)
+            assert r.status_code == 422
+        finally:
+            app.dependency_overrides.pop(get_idempotency_cache)
+
+    def test_api_allocates_a_retried_line_once_without_the_cache(self, test_client, uow):
+        """
+        Tests that, with the idempotency cache disabled, a retried allocation returns its batch without taking stock.
+        """
+        self.override_dependencies(uow)
+        sku, batch_ref = random_sku(), random_batch_ref(None)
+        post_to_add_batch(test_client, batch_ref, sku, 10, None)
+        data = {"order_id": random_orderid(), "sku": sku, "qty": 6}
+
+        for _ in range(2):
+            r = test_client.post("/api/v1/allocations", json=data)
+            assert r.status_code == 201
+            assert r.json()["reference"] == batch_ref
+
+        with uow:
+            assert uow.batches.find_by(reference=batch_ref).available_quantity == 4
+
+    def test_api_cancels_orders(self, test_client, uow):
+        """
+        Tests that cancelled orders can be allocated again, although retried allocations are replayed.
+        """
+        self.override_dependencies(uow)
+        cache = IdempotencyCache()
+        app.dependency_overrides[get_idempotency_cache] = lambda: cache
+        sku, batch_ref, order_id = random_sku(), random_batch_ref(None), random_orderid()
+        data = {"order_id": order_id, "sku": sku, "qty": 10}
+
+        try:
+            post_to_add_batch(test_client, batch_ref, sku, 10, None)
+            assert test_client.post("/api/v1/allocations", json=data).status_code == 201
+
+            r = test_client.delete(f"/api/v1/orders/{order_id}")
+            assert r.status_code == 200
+            assert r.json() == [{"orderId": order_id, "sku": sku, "qty": 10, "reference": batch_ref}]
+            assert test_client.delete(f"/api/v1/orders/{order_id}").status_code == 404
+
+            assert test_client.post("/api/v1/allocations", json=data).status_code == 201
+            r = test_client.post("/api/v1/deallocations", json=data)
+            assert r.json() == {"reference": batch_ref}
+
+            r = test_client.post("/api/v1/orders/cancellations", json=[order_id, random_orderid()])
+            assert r.status_code == 200
+            assert r.json() == []
+        finally:
+            app.dependency_overrides.pop(get_idempotency_cache)
+
+    def test_api_exposes_metrics(self, test_client, uow):
+        """
+        Tests that requests and allocation outcomes are measured, and exposed in the Prometheus text format.
+        """
+        self.override_dependencies(uow)
+        sku = random_sku()
+        post_to_add_batch(test_client, random_batch_ref(None), sku, 10, None)
+        test_client.post("/api/v1/allocations", json={"order_id": random_orderid(), "sku": sku, "qty": 20})
+
+        r = test_client.get("/metrics")
+
+        assert r.status_code == 200
+        assert r.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+        assert "# TYPE http_request_duration_seconds histogram" in r.text
+        assert 'http_request_duration_seconds_count{method="POST",route="/api/v1/allocations"}' in r.text
+        assert 'http_requests_total{method="POST",route="/api/v1/allocations",status="400"}' in r.text
+        assert 'allocations_total{outcome="OutOfStock"}' in r.text
+        assert 'uow_operation_duration_seconds_count{operation="commit"}' in r.text
+        assert 'repository_query_duration_seconds_count{entity="Product",method="find_by"}' in r.text
+
+    def test_api_returns_query_stats_in_debug_mode(self, test_client, uow, query_budget):
+        """
+        Tests that the statements executed by a request, and the time spent on them, are returned as headers.
+        """
+        self.override_dependencies(uow)
+
+        data = {"ref": random_batch_ref(None), "sku": random_sku(), "qty": 10, "eta": None}
+
+        with query_budget(statements=2):
+            r = test_client.post("/api/v1/batches", json=data)
+
+        assert r.headers["X-DB-Statements"] == "2"
+        assert float(r.headers["X-DB-Time-Ms"]) > 0
+
+    def test_api_profiles_requests_on_demand(self, test_client, uow, tmp_path, monkeypatch):
+        """
+        Tests that an admin request sent with an X-Profile header is profiled, and its profile listed and downloaded.
+        """
+        self.override_dependencies(uow)
+        monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+        admin = {"X-Admin-Token": "secret"}
+        start_profile_store(ProfileStore(tmp_path))
+
+        try:
+            r = test_client.get("/api/v1/catalog/stats", headers={"X-Profile": "1", **admin})
+            profile_id = r.headers["X-Profile-Id"]
+
+            r = test_client.get("/api/v1/profiles", headers=admin)
+            assert [(p["id"], p["path"], p["status"]) for p in r.json()] == [(profile_id, "/api/v1/catalog/stats", 404)]
+
+            r = test_client.get(f"/api/v1/profiles/{profile_id}", headers=admin)
+            assert r.status_code == 200
+            assert r.headers["content-type"].startswith("text/plain")
+            assert test_client.get("/api/v1/profiles/0-00000000", headers=admin).status_code == 404
+        finally:
+            stop_profile_store()
+
+        assert "X-Profile-Id" not in test_client.get("/", headers={"X-Profile": "1", **admin}).headers
+        assert test_client.get("/api/v1/profiles", headers=admin).status_code == 404
+
+    def test_api_profiles_only_admin_requests(self, test_client, tmp_path, monkeypatch):
+        """
+        Tests that requests without the admin token are neither profiled on demand nor shown the profiles.
+        """
+        start_profile_store(ProfileStore(tmp_path))
+
+        try:
+            for token in ("", "secret"):
+                monkeypatch.setattr(settings, "ADMIN_TOKEN", token)
+
+                for headers in ({}, {"X-Admin-Token": "wrong"}, {"X-Admin-Token": ""}):
+                    r = test_client.get("/api/v1/catalog/stats", headers={"X-Profile": "1", **headers})
+                    assert "X-Profile-Id" not in r.headers
+                    assert test_client.get("/api/v1/profiles", headers=headers).status_code == 403
+        finally:
+            stop_profile_store()
+
     @staticmethod
     def override_dependencies(uow):
         """
         Overrides the Fast API dependencies.
         """
         override_uow(uow)
+
+
+class TestBatchIngestion:
+    """
+    Batch feed ingestion end-to-end test cases.
+    """
+
+    def test_ingests_ndjson_in_chunks_and_upserts_on_reference(self, test_client, uow, monkeypatch):
+        """
+        Tests that an NDJSON feed is written in chunks, and re-sent batches are updated instead of duplicated.
+        """
+        override_uow(uow)
+        monkeypatch.setattr(settings, "INGESTION_CHUNK_SIZE", 2)
+        sku = random_sku()
+        feed = "\n".join(
+            [
+                json.dumps({"ref": "b1", "sku": sku, "qty": 10, "eta": None}),
+                json.dumps({"ref": "b2", "sku": sku, "qty": 10, "eta": "2011-01-02"}),
+                "not json",
+                json.dumps({"ref": "b3", "sku": sku, "qty": -1}),
+                json.dumps({"ref": "b1", "sku": sku, "qty": 20, "eta": None}),
+            ]
+        )
+
+        r = test_client.post("/api/v1/batches/ingest", content=feed, headers={"content-type": "application/x-ndjson"})
+
+        assert r.status_code == 200
+        assert r.json()["accepted"] == 3
+        assert r.json()["rejected"] == 2
+        assert [error["line"] for error in r.json()["errors"]] == [3, 4]
+
+        with uow:
+            batches = {b.reference: b for b in uow.batches.find_all_by(sku=sku)}
+            assert set(batches) == {"b1", "b2"}
+            assert batches["b1"].available_quantity == 20
+
+    def test_rejects_undecodable_and_overlong_lines(self, test_client, uow, monkeypatch):
+        """
+        Tests that lines which are not UTF-8, or too long, are reported while the rest of the feed is ingested.
+        """
+        override_uow(uow)
+        monkeypatch.setattr(settings, "INGESTION_MAX_LINE_LENGTH", 100)
+        sku = random_sku()
+        feed = b"\n".join(
+            [
+                json.dumps({"ref": "b1", "sku": sku, "qty": 10}).encode(),
+                b'{"ref": "b2", "sku": "\xff"}',
+                json.dumps({"ref": "b3", "sku": sku, "qty": 10, "eta": "2011-01-02" + " " * 100}).encode(),
+                json.dumps({"ref": "b4", "sku": sku, "qty": 10}).encode(),
+            ]
+        )
+
+        r = test_client.post("/api/v1/batches/ingest", content=feed, headers={"content-type": "application/x-ndjson"})
+
+        assert r.status_code == 200
+        assert r.json()["accepted"] == 2
+        assert [(error["line"], error["detail"].split(",")[0]) for error in r.json()["errors"]] == [
+            (2, "Line is not valid UTF-8"),
+            (3, "Line longer than 100 bytes"),
+        ]
+
+    def test_ingests_csv(self, test_client, uow):
+        """
+        Tests that a CSV feed is ingested, empty values being read as missing.
+        """
+        override_uow(uow)
+        sku = random_sku()
+        feed = f"ref,sku,qty,eta\nb1,{sku},10,\nb2,{sku},5,2011-01-02\n"
+
+        r = test_client.post("/api/v1/batches/ingest", content=feed, headers={"content-type": "text/csv"})
+
+        assert r.json() == {"accepted": 2, "rejected": 0, "errors": []}
+
+    def test_rejects_unsupported_formats(self, test_client, uow):
+        """
+        Tests that a feed in an unsupported format is rejected.
+        """
+        override_uow(uow)
+
+        r = test_client.post("/api/v1/batches/ingest", content="<batches/>", headers={"content-type": "text/xml"})
+
+        assert r.status_code == 415
@@ -0,0 +1,105 @@
+"""
+This module tests the asynchronous FastAPI endpoints.
+"""
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from allocation.entrypoints import allocation, batch
+from allocation.service_layer.allocation_service import InvalidSku
+from allocation.service_layer.dependencies import get_async_uow
+from tests.e2e.test_api import post_to_add_batch, random_batch_ref, random_orderid, random_sku
+
+
+@pytest.fixture(name="async_client")
+def fixture_async_client(async_uow) -> TestClient:
+    """
+    Creates a test client for an application serving the asynchronous endpoints.
+
+    Args:
+        async_uow: An asynchronous unit of work.
+
+    Returns:
+        TestClient: A test client for the app.
+    """
+    app = FastAPI()
+    app.include_router(batch.async_router, prefix="/api")
+    app.include_router(allocation.async_router, prefix="/api")
+    app.dependency_overrides[get_async_uow] = lambda: async_uow
+    return TestClient(app)
+
+
+class TestAsyncAPI:
+    """
+    Asynchronous API end-to-end test cases.
+    """
+
+    def test_adds_batch_and_allocates(self, async_client):
+        """
+        Tests that the asynchronous API adds batches and allocates correctly returns an allocation.
+        """
+        sku = random_sku()
+        early_batch, later_batch = random_batch_ref(None), random_batch_ref(None)
+
+        post_to_add_batch(async_client, later_batch, sku, 100, "2011-01-02")
+        post_to_add_batch(async_client, early_batch, sku, 100, "2011-01-01")
+
+        r = async_client.post("/api/v1/allocations", json={"order_id": random_orderid(), "sku": sku, "qty": 3})
+
+        assert r.status_code == 201
+        assert r.json() == {"reference": early_batch}
+
+    def test_api_invalid_sku(self, async_client):
+        """
+        Tests that the asynchronous API returns a 400 when there is an invalid SKU.
+        """
+        post_to_add_batch(async_client, random_batch_ref(None), random_sku(), 100, None)
+
+        unknown_sku = random_sku()
+        r = async_client.post("/api/v1/allocations", json={"order_id": random_orderid(), "sku": unknown_sku, "qty": 3})
+
+        assert r.status_code == 400
+        assert r.json()["detail"] == InvalidSku(unknown_sku).message
+
+    def test_api_allocates_in_bulk(self, async_client):
+        """
+        Tests that the asynchronous bulk API allocates every line it can and reports the others.
+        """
+        sku, batch_ref = random_sku(), random_batch_ref(None)
+        post_to_add_batch(async_client, batch_ref, sku, 10, None)
+
+        lines = [{"orderId": "o1", "sku": sku, "qty": 6}, {"orderId": "o2", "sku": sku, "qty": 6}]
+        r = async_client.post("/api/v1/allocations/bulk", json=lines)
+
+        assert r.status_code == 200
+        assert [line["error"] for line in r.json()] == [None, "OutOfStock"]
+
+    def test_api_cancels_orders(self, async_client):
+        """
+        Tests that the asynchronous API cancels orders in bulk, freeing their batches.
+        """
+        sku, batch_ref = random_sku(), random_batch_ref(None)
+        post_to_add_batch(async_client, batch_ref, sku, 10, None)
+        async_client.post("/api/v1/allocations", json={"order_id": "o1", "sku": sku, "qty": 10})
+
+        r = async_client.post("/api/v1/orders/cancellations", json=["o1"])
+
+        assert r.status_code == 200
+        assert [line["reference"] for line in r.json()] == [batch_ref]
+
+        r = async_client.post("/api/v1/allocations", json={"order_id": "o2", "sku": sku, "qty": 10})
+        assert r.status_code == 201
+
+    def test_api_ingests_batches(self, async_client):
+        """
+        Tests that the asynchronous API ingests a feed, upserting batches on their reference.
+        """
+        sku = random_sku()
+        feed = f"ref,sku,qty,eta\nb1,{sku},10,\nb1,{sku},20,\n"
+
+        r = async_client.post("/api/v1/batches/ingest", content=feed, headers={"content-type": "text/csv"})
+
+        assert r.json() == {"accepted": 2, "rejected": 0, "errors": []}
+
+        r = async_client.post("/api/v1/allocations", json={"order_id": random_orderid(), "sku": sku, "qty": 15})
+        assert r.json() == {"reference": "b1"}
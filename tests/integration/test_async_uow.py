@@ -0,0 +1,101 @@
+"""
+Test Integration Suite for the asynchronous Unit of Work.
+"""
+import pytest
+from sqlalchemy.orm import clear_mappers
+
+from allocation.adapters.orm import start_mappers
+from allocation.domain.models import Batch, OrderLine
+from allocation.service_layer.allocation_service import (
+    AsyncAllocationService,
+    InvalidSku,
+    NoBatchesAvailable,
+    NotAllocated,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class TestAsyncUnitOfWork:
+    """
+    Asynchronous Unit of Work test cases.
+    """
+
+    async def test_uow_can_retrieve_a_batch_and_allocate_to_it(self, async_uow):
+        """
+        Test that a batch can be saved, retrieved with its allocations and allocated to.
+        """
+        async with async_uow:
+            await async_uow.batches.save(Batch("batch1", "HIPSTER-WORKBENCH", 100))
+            await async_uow.commit()
+
+        async with async_uow:
+            batch = await async_uow.batches.find_by(reference="batch1")
+            batch.allocate(OrderLine("o1", "HIPSTER-WORKBENCH", 10))
+            await async_uow.commit()
+
+        async with async_uow:
+            [batch] = await async_uow.batches.find_all_by(sku="HIPSTER-WORKBENCH")
+
+            assert batch.available_quantity == 90
+            assert batch._allocations == {OrderLine("o1", "HIPSTER-WORKBENCH", 10)}
+
+    async def test_loads_allocations_eagerly_when_configured_to_lazy_load_them(self, async_uow):
+        """
+        Test that the "select" loading strategy, which an asynchronous session cannot run, does not fail batches.
+        """
+        clear_mappers()
+        start_mappers("select")
+
+        async with async_uow:
+            batch = Batch("batch1", "HIPSTER-WORKBENCH", 100)
+            batch.allocate(OrderLine("o1", "HIPSTER-WORKBENCH", 10))
+            await async_uow.batches.save(batch)
+            await async_uow.commit()
+
+        async with async_uow:
+            batch = await async_uow.batches.find_by(reference="batch1")
+            batch.deallocate(OrderLine("o1", "HIPSTER-WORKBENCH", 10))
+
+            assert batch.available_quantity == 100
+
+    async def test_rolls_back_uncommitted_work_by_default(self, async_uow):
+        """
+        Test that uncommitted work is rolled back by default.
+        """
+        async with async_uow:
+            await async_uow.batches.save(Batch("batch1", "GENERIC-SOFA", 100))
+
+        async with async_uow:
+            assert await async_uow.batches.exists() is False
+
+    async def test_service_allocates(self, async_uow):
+        """
+        Test that the asynchronous service allocates and reports the same errors as the blocking one.
+        """
+        service = AsyncAllocationService(async_uow)
+
+        with pytest.raises(NoBatchesAvailable):
+            await service.allocate("o1", "COMPLICATED-LAMP", 10)
+
+        await service.add_batch("b1", "COMPLICATED-LAMP", 100)
+
+        assert await service.allocate("o1", "COMPLICATED-LAMP", 10) == "b1"
+
+        with pytest.raises(InvalidSku):
+            await service.allocate("o2", "NON-EXISTENT-SKU", 10)
+
+    async def test_service_deallocates(self, async_uow):
+        """
+        Test that the asynchronous service deallocates lines and cancels orders.
+        """
+        service = AsyncAllocationService(async_uow)
+        await service.add_batch("b1", "COMPLICATED-LAMP", 10)
+        await service.allocate("o1", "COMPLICATED-LAMP", 10)
+
+        assert await service.deallocate("o1", "COMPLICATED-LAMP", 10) == "b1"
+        assert await service.allocate("o2", "COMPLICATED-LAMP", 10) == "b1"
+        assert [allocation.order_id for allocation in await service.cancel_order("o2")] == ["o2"]
+
+        with pytest.raises(NotAllocated):
+            await service.cancel_order("o1")
@@ -0,0 +1,35 @@
+"""
+Test Suites for the allocated quantity consistency checks.
+"""
+from allocation.adapters import consistency, repository
+from allocation.domain import models
+from tests.integration.test_repostiroy import insert_allocation, insert_batch, insert_order_line
+
+
+class TestConsistency:
+    def test_allocated_quantity_survives_a_round_trip(self, session):
+        batch = models.Batch("batch1", "GENERIC-SOFA", 100)
+        batch.allocate(models.OrderLine("order1", "GENERIC-SOFA", 12))
+        session.add(batch)
+        session.commit()
+        session.expunge_all()
+
+        repo = repository.SqlAlchemyRepository(session, kind=models.Batch)
+        retrieved: models.Batch = repo.find_by(reference="batch1")
+
+        assert retrieved.allocated_quantity == 12
+        assert consistency.find_inconsistent_batches(session) == []
+
+    def test_detects_and_rebuilds_allocated_quantities(self, session):
+        order_line_id = insert_order_line(session)
+        batch1_id = insert_batch(session, "batch1")
+        insert_batch(session, "batch2")
+        insert_allocation(session, order_line_id, batch1_id)
+
+        assert consistency.find_inconsistent_batches(session) == [("batch1", 0, 12)]
+
+        assert consistency.rebuild_allocated_quantities(session) == 1
+
+        assert consistency.find_inconsistent_batches(session) == []
+        [[allocated]] = session.execute("SELECT _allocated_quantity FROM batches WHERE reference = 'batch1'")
+        assert allocated == 12
@@ -0,0 +1,68 @@
+"""
+Test Suites for the database engine factory.
+"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from allocation.adapters import database
+from allocation.app.config.settings import Application
+
+
+@pytest.fixture(name="file_settings")
+def fixture_file_settings(tmp_path) -> Application:
+    """
+    Application settings pointing to a temporary SQLite database file.
+    """
+    return Application(
+        DATABASE_URL=f"sqlite:///{tmp_path / 'test.db'}",
+        ASYNC_DATABASE_URL=f"sqlite+aiosqlite:///{tmp_path / 'test.db'}",
+        DB_POOL_SIZE=3,
+        SQLITE_PRAGMAS={"temp_store": "MEMORY"},
+    )
+
+
+def pragma(connection, name: str):
+    """
+    Reads the value of a SQLite pragma.
+    """
+    return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+class TestDatabase:
+    def test_sqlite_pragmas_are_applied_on_connect(self, file_settings):
+        engine = database.create_db_engine(file_settings)
+
+        with engine.connect() as connection:
+            assert pragma(connection, "journal_mode") == "wal"
+            assert pragma(connection, "synchronous") == 1
+            assert pragma(connection, "busy_timeout") == 5000
+            assert pragma(connection, "cache_size") == -20000
+            assert pragma(connection, "temp_store") == 2
+
+    def test_sqlite_file_databases_are_pooled_and_warmed_up(self, file_settings):
+        engine = database.create_db_engine(file_settings)
+
+        assert isinstance(engine.pool, QueuePool)
+        assert engine.pool.size() == 3
+
+        database.warm_up(engine, 2)
+
+        assert engine.pool.checkedin() == 2
+
+    def test_in_memory_databases_share_a_single_connection(self):
+        engine = database.create_db_engine(Application(DATABASE_URL="sqlite://"))
+
+        assert isinstance(engine.pool, StaticPool)
+
+    @pytest.mark.anyio
+    async def test_async_engine_applies_pragmas(self, file_settings):
+        engine = database.create_async_db_engine(file_settings)
+
+        await database.warm_up_async(engine, 2)
+
+        async with engine.connect() as connection:
+            assert (await connection.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+
+        assert engine.pool.checkedin() == 2
+        await engine.dispose()
@@ -0,0 +1,46 @@
+"""
+Test Suites for the SQLAlchemy idempotency key store.
+"""
+import datetime
+
+import pytest
+from sqlalchemy import create_mock_engine
+
+from allocation.adapters.idempotency import SqlAlchemyIdempotencyStore
+
+
+def test_stores_the_first_outcome_of_a_key(in_memory_db):
+    """
+    Tests that the first outcome stored for a key is kept.
+    """
+    store = SqlAlchemyIdempotencyStore(in_memory_db)
+    an_hour_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+
+    store.put("k1", "o1:LAMP:1", "batch-001")
+    store.put("k1", "o1:LAMP:1", "batch-002")
+
+    assert store.get("k1", an_hour_ago) == ("o1:LAMP:1", "batch-001")
+    assert store.get("k2", an_hour_ago) is None
+
+
+def test_expires_and_purges_old_outcomes(in_memory_db):
+    """
+    Tests that outcomes stored before a date are neither found nor kept once purged.
+    """
+    store = SqlAlchemyIdempotencyStore(in_memory_db)
+    store.put("k1", "o1:LAMP:1", "batch-001")
+    in_an_hour = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    assert store.get("k1", in_an_hour) is None
+    assert store.purge(in_an_hour) == 1
+    assert store.purge(in_an_hour) == 0
+
+
+def test_rejects_databases_without_upserts():
+    """
+    Tests that the store fails when created, rather than on the first key, on a database it cannot store keys on.
+    """
+    engine = create_mock_engine("mysql://", executor=lambda *args, **kwargs: None)
+
+    with pytest.raises(NotImplementedError, match="mysql"):
+        SqlAlchemyIdempotencyStore(engine)
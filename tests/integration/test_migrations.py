@@ -0,0 +1,99 @@
+"""
+Test Suites for the schema migrations.
+"""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import StaticPool
+
+from allocation.adapters import migrations
+
+LEGACY_SCHEMA = (
+    """CREATE TABLE order_lines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, sku VARCHAR(255), qty INTEGER NOT NULL, order_id VARCHAR(255)
+    )""",
+    """CREATE TABLE batches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, reference VARCHAR(255), sku VARCHAR(255),
+        _purchased_quantity INTEGER NOT NULL, eta DATE
+    )""",
+    """CREATE TABLE allocations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        orderline_id INTEGER REFERENCES order_lines (id), batch_id INTEGER REFERENCES batches (id)
+    )""",
+    "INSERT INTO order_lines (order_id, sku, qty) VALUES ('order1', 'GENERIC-SOFA', 12)",
+    "INSERT INTO batches (reference, sku, _purchased_quantity) VALUES ('batch1', 'GENERIC-SOFA', 100)",
+    "INSERT INTO allocations (orderline_id, batch_id) VALUES (1, 1)",
+)
+
+
+@pytest.fixture(name="empty_db")
+def fixture_empty_db():
+    """
+    Creates an empty in-memory SQLite engine.
+    """
+    return create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+
+def index_names(engine, table: str) -> set[str]:
+    """
+    Lists the indexes of a table.
+    """
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+
+class TestMigrations:
+    def test_fresh_database_is_created_at_head(self, empty_db):
+        assert migrations.upgrade(empty_db) == []
+
+        migrations.check(empty_db)
+        assert "ix_batches_sku" in index_names(empty_db, "batches")
+
+    def test_check_fails_on_outdated_database(self, empty_db):
+        with pytest.raises(migrations.SchemaVersionMismatch):
+            migrations.check(empty_db)
+
+    def test_legacy_database_is_upgraded_in_place(self, empty_db):
+        with empty_db.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+
+        applied = migrations.upgrade(empty_db)
+
+        assert [m.version for m in applied] == [m.version for m in migrations.MIGRATIONS]
+        migrations.check(empty_db)
+        assert index_names(empty_db, "batches") == {"uq_batches_reference", "ix_batches_sku"}
+        assert index_names(empty_db, "order_lines") == {"ix_order_lines_order_id_sku"}
+        assert index_names(empty_db, "allocations") == {
+            "ix_allocations_batch_id_orderline_id",
+            "ix_allocations_orderline_id",
+        }
+
+        with empty_db.connect() as connection:
+            [[allocated]] = connection.execute(text("SELECT _allocated_quantity FROM batches"))
+            products = list(connection.execute(text("SELECT sku, version_number FROM products")))
+        assert allocated == 12
+        assert products == [("GENERIC-SOFA", 0)]
+
+        assert migrations.upgrade(empty_db) == []
+
+    def test_batch_references_are_unique(self, empty_db):
+        migrations.upgrade(empty_db)
+        insert = text("INSERT INTO batches (reference, sku, _purchased_quantity) VALUES ('batch1', 'SOFA', 1)")
+
+        with pytest.raises(IntegrityError):
+            with empty_db.begin() as connection:
+                connection.execute(insert)
+                connection.execute(insert)
+
+    def test_duplicated_batch_references_are_reported_before_indexing(self, empty_db):
+        with empty_db.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+            connection.execute(text(LEGACY_SCHEMA[4]))
+
+        with pytest.raises(migrations.DuplicateBatchReferences) as e:
+            migrations.upgrade(empty_db)
+
+        assert e.value.references == ["batch1"]
+        with empty_db.connect() as connection:
+            assert migrations.current_version(connection) == 1
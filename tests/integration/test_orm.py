@@ -1,7 +1,35 @@
 """
 Test cases for the ORM  module.
 """
+from contextlib import contextmanager
+
+from sqlalchemy import event, inspect
+
 import allocation.domain.models as model
+from allocation.adapters.orm import allocations_loader, ensure_mappers, product_batches_loader
+
+
+@contextmanager
+def count_queries(engine):
+    """
+    Records the statements executed by an engine while the context is active.
+
+    Args:
+        engine: The SQLAlchemy engine to listen to.
+
+    Yields:
+        list[str]: The executed statements.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
 
 
 class TestORM:
@@ -35,3 +63,59 @@ class TestORM:
 
         rows = list(session.execute('SELECT order_id, sku, qty FROM "order_lines"'))
         assert rows == [("order1", "DECORATIVE-WIDGET", 12)]
+
+    def test_batch_allocations_are_loaded_in_a_fixed_number_of_queries(self, session, in_memory_db):
+        for i in range(5):
+            batch = model.Batch(f"batch{i}", "GENERIC-SOFA", 100)
+            batch.allocate(model.OrderLine(f"order{i}", "GENERIC-SOFA", 10))
+            batch.allocate(model.OrderLine(f"order{i}-bis", "GENERIC-SOFA", 5))
+            session.add(batch)
+        session.commit()
+        session.expunge_all()
+
+        with count_queries(in_memory_db) as statements:
+            batches = session.query(model.Batch).all()
+            assert [b.available_quantity for b in batches] == [85] * 5
+
+        assert len(statements) == 2
+
+    def test_batch_allocations_loading_can_be_chosen_per_query(self, session, in_memory_db):
+        for i in range(5):
+            batch = model.Batch(f"batch{i}", "GENERIC-SOFA", 100)
+            batch.allocate(model.OrderLine(f"order{i}", "GENERIC-SOFA", 10))
+            session.add(batch)
+        session.commit()
+        session.expunge_all()
+
+        with count_queries(in_memory_db) as statements:
+            batches = session.query(model.Batch).options(allocations_loader("joined")).all()
+            assert [b.available_quantity for b in batches] == [90] * 5
+
+        assert len(statements) == 1
+
+    def test_product_batches_are_loaded_without_their_allocations(self, session, in_memory_db):
+        batch = model.Batch("batch1", "GENERIC-SOFA", 100)
+        batch.allocate(model.OrderLine("order1", "GENERIC-SOFA", 10))
+        session.add_all([model.Product("GENERIC-SOFA"), batch])
+        session.commit()
+        session.expunge_all()
+
+        with count_queries(in_memory_db) as statements:
+            product = session.query(model.Product).options(product_batches_loader()).one()
+            assert product.allocate(model.OrderLine("order2", "GENERIC-SOFA", 5)) == "batch1"
+
+        assert len(statements) == 2
+        session.commit()
+        session.expunge_all()
+
+        batch = session.query(model.Batch).one()
+        assert {line.order_id for line in batch._allocations} == {"order1", "order2"}
+        assert batch.available_quantity == 85
+
+    def test_mappers_are_started_once_per_process(self, session):
+        mappers = {kind: inspect(kind) for kind in (model.OrderLine, model.Batch, model.Product)}
+
+        assert ensure_mappers("joined") is False
+
+        assert {kind: inspect(kind) for kind in mappers} == mappers
+        assert inspect(model.Batch).relationships["_allocations"].lazy == "selectin"
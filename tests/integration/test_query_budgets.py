@@ -0,0 +1,61 @@
+"""
+Test Suites for the number of SQL statements the allocation service executes.
+"""
+import pytest
+from sqlalchemy.orm import clear_mappers, defaultload
+
+from allocation.adapters.orm import start_mappers
+from allocation.domain.models import Batch, Product
+from allocation.service_layer import unit_of_work
+from allocation.service_layer.allocation_service import AllocationService
+from allocation.service_layer.unit_of_work import SqlAlchemyUnitOfWork
+
+
+@pytest.fixture(name="service")
+def fixture_service(session_factory) -> AllocationService:
+    """
+    An allocation service whose SKU has many batches, every one of them holding allocations.
+    """
+    service = AllocationService(SqlAlchemyUnitOfWork(session_factory))
+
+    for i in range(20):
+        service.add_batch(f"batch-{i}", "LAMP", 10)
+        service.allocate(f"order-{i}", "LAMP", 5)
+
+    return service
+
+
+def test_adds_a_batch_within_budget(session_factory, query_budget):
+    """
+    Tests that adding a batch upserts its product and inserts it, without reading anything.
+    """
+    service = AllocationService(SqlAlchemyUnitOfWork(session_factory))
+
+    with query_budget(statements=2):
+        service.add_batch("batch-001", "LAMP", 10)
+
+
+def test_allocates_within_budget_whatever_the_number_of_batches(service, query_budget):
+    """
+    Tests that allocating looks the line up, loads the product and its batches without their allocations, then writes.
+    """
+    with query_budget(statements=7):
+        service.allocate("new-order", "LAMP", 1)
+
+
+def test_budget_catches_allocations_lazy_loaded_per_batch(service, query_budget, monkeypatch):
+    """
+    Tests that a regression lazy loading the allocations of every batch checked goes over the budget.
+    """
+    clear_mappers()
+    start_mappers("select")
+    # The allocations of the batches of a product loaded as configured, as they were before being skipped.
+    monkeypatch.setattr(unit_of_work, "product_batches_loader", lambda: defaultload(Product.batches))
+    # The available quantity summed from the allocations, as it was before being kept in a column.
+    monkeypatch.setattr(
+        Batch, "can_allocate", lambda batch, line: sum(other.qty for other in batch._allocations) + line.qty <= 10
+    )
+
+    with pytest.raises(AssertionError, match="Statement repeated"):
+        with query_budget(statements=50):
+            service.allocate("new-order", "LAMP", 1)
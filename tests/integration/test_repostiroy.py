@@ -1,6 +1,8 @@
 """
 Test Suites for the SQLAlchemy Repository.
 """
+from sqlalchemy.dialects import postgresql
+
 from allocation.adapters import repository
 from allocation.domain import models
 
@@ -98,3 +100,43 @@ class TestRepository:
         assert retrieved._allocations == {
             models.OrderLine("order1", "GENERIC-SOFA", 12),
         }
+
+    def test_repository_finds_all_batches_of_a_sku(self, session):
+        insert_batch(session, "batch1")
+        insert_batch(session, "batch2")
+        session.execute(
+            "INSERT INTO batches (reference, sku, _purchased_quantity) VALUES (:reference, :sku, :qty)",
+            dict(reference="batch3", sku="OTHER-SOFA", qty=10),
+        )
+
+        repo = repository.SqlAlchemyRepository(session, kind=models.Batch)
+
+        assert {b.reference for b in repo.find_all_by(sku="GENERIC-SOFA")} == {"batch1", "batch2"}
+        assert repo.find_all_by(sku="MISSING-SOFA") == []
+
+    def test_repository_checks_existence(self, session):
+        repo = repository.SqlAlchemyRepository(session, kind=models.Batch)
+
+        assert repo.exists() is False
+
+        insert_batch(session, "batch1")
+
+        assert repo.exists() is True
+        assert repo.exists(sku="GENERIC-SOFA") is True
+        assert repo.exists(sku="MISSING-SOFA") is False
+
+    def test_allocation_repository_locks_the_allocations_it_removes(self):
+        statements = []
+
+        class RecordingSession:
+            def execute(self, statement, params=None):
+                statements.append(statement)
+                return []
+
+        allocations = repository.SqlAlchemyAllocationRepository(RecordingSession())
+        allocations.find_by_orders(["order1"])
+        allocations.remove(["order1"])
+
+        find, remove = (str(statement.compile(dialect=postgresql.dialect())) for statement in statements)
+        assert "FOR UPDATE" not in find
+        assert "FOR UPDATE" in remove
@@ -1,10 +1,13 @@
 """
 Test Integration Suite for Unit of Work.
 """
+from datetime import date
+
 import pytest
 
-from allocation.domain.models import OrderLine
-from allocation.service_layer.unit_of_work import SqlAlchemyUnitOfWork
+from allocation.domain.models import Allocation, Batch, OrderLine, Product
+from allocation.service_layer.allocation_service import AllocationService
+from allocation.service_layer.unit_of_work import ConcurrentUpdate, SqlAlchemyUnitOfWork
 
 
 def insert_batch(session, reference, sku: str, qty: int, eta: str | None):
@@ -116,3 +119,125 @@ class TestUnitOfWork:
         rows = list(uow.session.execute("SELECT * FROM batches"))
 
         assert rows == []
+
+    def test_concurrent_updates_to_a_product_conflict(self, session_factory):
+        """
+        Test that, of two transactions allocating the same product, the last one to commit fails.
+        """
+        setup = SqlAlchemyUnitOfWork(session_factory)
+
+        with setup:
+            setup.products.save(Product("ASYMMETRICAL-DESK"))
+            setup.batches.save(Batch("batch1", "ASYMMETRICAL-DESK", 100))
+            setup.commit()
+
+        first, second = SqlAlchemyUnitOfWork(session_factory), SqlAlchemyUnitOfWork(session_factory)
+
+        with first, second:
+            first.products.find_by(sku="ASYMMETRICAL-DESK").allocate(OrderLine("o1", "ASYMMETRICAL-DESK", 10))
+            second.products.find_by(sku="ASYMMETRICAL-DESK").allocate(OrderLine("o2", "ASYMMETRICAL-DESK", 10))
+
+            first.commit()
+
+            with pytest.raises(ConcurrentUpdate):
+                second.commit()
+
+        with setup:
+            product = setup.products.find_by(sku="ASYMMETRICAL-DESK")
+
+            assert product.version_number == 1
+            assert product.batches[0].available_quantity == 90
+
+    def test_cancels_orders_in_place(self, session_factory):
+        """
+        Test that cancelled orders free their batches, bump their products and delete their lines.
+        """
+        service = AllocationService(SqlAlchemyUnitOfWork(session_factory))
+        service.add_batch("batch1", "ASYMMETRICAL-DESK", 100)
+        service.add_batch("batch2", "GENERIC-SOFA", 100)
+        service.allocate("o1", "ASYMMETRICAL-DESK", 10)
+        service.allocate("o1", "GENERIC-SOFA", 5)
+        service.allocate("o2", "ASYMMETRICAL-DESK", 20)
+
+        assert len(service.cancel_orders(["o1", "o3"])) == 2
+
+        uow = SqlAlchemyUnitOfWork(session_factory)
+
+        with uow:
+            desk = uow.products.find_by(sku="ASYMMETRICAL-DESK")
+
+            assert desk.version_number == 3
+            assert desk.batches[0].available_quantity == 80
+            assert uow.products.find_by(sku="GENERIC-SOFA").batches[0].available_quantity == 100
+            assert uow.allocations.find_by_orders(["o1", "o2"]) == [Allocation("o2", "ASYMMETRICAL-DESK", 20, "batch1")]
+            assert list(uow.session.execute("SELECT order_id FROM order_lines")) == [("o2",)]
+
+    def test_allocating_a_line_again_returns_its_batch(self, session_factory):
+        """
+        Test that a line allocated again, alone or in bulk, is stored and counted once.
+        """
+        service = AllocationService(SqlAlchemyUnitOfWork(session_factory))
+        service.add_batch("batch1", "ASYMMETRICAL-DESK", 100, date(2011, 1, 2))
+
+        assert service.allocate("o1", "ASYMMETRICAL-DESK", 3) == "batch1"
+        service.add_batch("batch0", "ASYMMETRICAL-DESK", 100, date(2011, 1, 1))
+        assert service.allocate("o1", "ASYMMETRICAL-DESK", 3) == "batch1"
+
+        line = {"order_id": "o1", "sku": "ASYMMETRICAL-DESK", "qty": 3}
+        assert [result.reference for result in service.allocate_many([line, line])] == ["batch1", "batch1"]
+
+        uow = SqlAlchemyUnitOfWork(session_factory)
+
+        with uow:
+            batches = {batch.reference: batch for batch in uow.batches.find_all()}
+
+            assert batches["batch1"].allocated_quantity == 3
+            assert batches["batch0"].allocated_quantity == 0
+            assert list(uow.session.execute("SELECT count(*) FROM allocations")) == [(1,)]
+            assert list(uow.session.execute("SELECT count(*) FROM order_lines")) == [(1,)]
+
+    def test_deallocation_conflicts_with_a_concurrent_allocation(self, session_factory):
+        """
+        Test that an allocation of a product deallocated since it was loaded fails instead of overwriting it.
+        """
+        service = AllocationService(SqlAlchemyUnitOfWork(session_factory))
+        service.add_batch("batch1", "ASYMMETRICAL-DESK", 100)
+        service.allocate("o1", "ASYMMETRICAL-DESK", 10)
+        uow = SqlAlchemyUnitOfWork(session_factory)
+
+        with uow:
+            uow.products.find_by(sku="ASYMMETRICAL-DESK").allocate(OrderLine("o2", "ASYMMETRICAL-DESK", 10))
+
+            assert service.deallocate("o1", "ASYMMETRICAL-DESK", 10) == "batch1"
+
+            with pytest.raises(ConcurrentUpdate):
+                uow.commit()
+
+    def test_ingestion_keeps_allocated_stock_and_conflicts_with_allocations(self, session_factory):
+        """
+        Test that ingesting batches again never shrinks them below their allocations, and bumps their products.
+        """
+        service = AllocationService(SqlAlchemyUnitOfWork(session_factory))
+        desk = {"ref": "batch1", "sku": "ASYMMETRICAL-DESK", "qty": 100, "eta": None}
+        sofa = {"ref": "batch2", "sku": "GENERIC-SOFA", "qty": 100, "eta": None}
+        service.add_batches([desk, sofa])
+        service.allocate("o1", "ASYMMETRICAL-DESK", 10)
+        uow = SqlAlchemyUnitOfWork(session_factory)
+
+        with uow:
+            uow.products.find_by(sku="GENERIC-SOFA").allocate(OrderLine("o2", "GENERIC-SOFA", 10))
+
+            assert service.add_batches([{**desk, "qty": 5}, {**sofa, "qty": 50}]) == 2
+
+            with pytest.raises(ConcurrentUpdate):
+                uow.commit()
+
+        uow = SqlAlchemyUnitOfWork(session_factory)
+
+        with uow:
+            batches = {batch.reference: batch for batch in uow.batches.find_all()}
+
+            assert batches["batch1"].available_quantity == 90
+            assert batches["batch2"].available_quantity == 50
+            assert uow.products.find_by(sku="ASYMMETRICAL-DESK").version_number == 2
+            assert uow.products.find_by(sku="GENERIC-SOFA").version_number == 1
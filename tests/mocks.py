@@ -1,12 +1,14 @@
 """
 This module describes all shared mocks.
 """
+import copy
 import datetime
-from typing import Generic, TypeVar
+from typing import Generic, Mapping, Sequence, TypeVar
 
 from sqlalchemy.orm import Session
 
-from allocation.adapters.repository import AbstractRepository
+from allocation.adapters.idempotency import AbstractIdempotencyStore
+from allocation.adapters.repository import AbstractAllocationRepository, AbstractRepository
 from allocation.domain import models
 from allocation.main import app
 from allocation.service_layer.dependencies import get_uow
@@ -41,13 +43,46 @@ class FakeRepository(AbstractRepository, Generic[T]):
         self.data.append(entity)
 
     def find_by_id(self, entity_id: int) -> T:
-        return next((x for x in self.data if x.id == entity_id), None)
+        return next((x for x in self.find_all() if x.id == entity_id), None)
 
     def find_all(self) -> list[T]:
         return self.data
 
     def find_by(self, **kwargs) -> T | None:
-        return next((x for x in self.data if x.__dict__ == kwargs), None)
+        return next(iter(self.find_all_by(**kwargs)), None)
+
+    def find_all_by(self, **kwargs) -> list[T]:
+        return [x for x in self.find_all() if all(getattr(x, k) == v for k, v in kwargs.items())]
+
+    def exists(self, **kwargs) -> bool:
+        return any(all(getattr(x, k) == v for k, v in kwargs.items()) for x in self.find_all())
+
+    def find_distinct(self, attribute: str) -> list:
+        return list({getattr(x, attribute) for x in self.find_all()})
+
+    def upsert_many(
+        self,
+        entities: Sequence[T],
+        key: str,
+        update: Sequence[str],
+        increment: Sequence[str] = (),
+        floor: Mapping[str, str] | None = None,
+    ) -> None:
+        for entity in entities:
+            existing = next((x for x in self.data if getattr(x, key) == getattr(entity, key)), None)
+
+            if existing is None:
+                self.data.append(entity)
+                continue
+
+            if any(getattr(entity, a) < getattr(existing, lowest) for a, lowest in (floor or {}).items()):
+                continue
+
+            for attribute in update:
+                setattr(existing, attribute, getattr(entity, attribute))
+
+            for attribute in increment:
+                setattr(existing, attribute, getattr(existing, attribute) + 1)
 
     def add(self, ref: str, sku: str, qty: int, eta: datetime.date | None = None):
         """
@@ -63,6 +98,106 @@ class FakeRepository(AbstractRepository, Generic[T]):
         self.data.append(models.Batch(ref, sku, qty, eta))
 
 
+class FakeProductRepository(FakeRepository):
+    """
+    A Fake Repository of products, whose batches are those of a fake batch repository.
+    """
+
+    def __init__(self, batches: FakeRepository):
+        self.batches = batches
+        self.products: dict[str, models.Product] = {}
+        super().__init__(models.Product)
+
+    def find_all(self) -> list[models.Product]:
+        for batch in self.batches.data:
+            self.products.setdefault(batch.sku, models.Product(batch.sku))
+
+        for product in self.products.values():
+            product.batches = [batch for batch in self.batches.data if batch.sku == product.sku]
+
+        return list(self.products.values())
+
+    def save(self, entity: models.Product) -> None:
+        self.products.setdefault(entity.sku, entity)
+
+    def upsert_many(
+        self,
+        entities: Sequence[models.Product],
+        key: str,
+        update: Sequence[str],
+        increment: Sequence[str] = (),
+        floor: Mapping[str, str] | None = None,
+    ) -> None:
+        for entity in entities:
+            existing = self.products.setdefault(entity.sku, entity)
+
+            if existing is not entity:
+                for attribute in increment:
+                    setattr(existing, attribute, getattr(existing, attribute) + 1)
+
+
+class FakeAllocationRepository(AbstractAllocationRepository):
+    """
+    A Fake Repository of the allocations held by the batches of a fake product repository.
+    """
+
+    def __init__(self, products: FakeProductRepository):
+        self.products = products
+
+    def find_by_orders(self, order_ids: Sequence[str]) -> list[models.Allocation]:
+        return [
+            models.Allocation(line.order_id, line.sku, line.qty, batch.reference)
+            for product in self.products.find_all()
+            for batch in product.batches
+            for line in batch._allocations  # pylint: disable=protected-access
+            if line.order_id in order_ids
+        ]
+
+    def remove(self, order_ids: Sequence[str], lines: Sequence[models.OrderLine] | None = None) -> list:
+        removed = []
+
+        for allocation in self.find_by_orders(order_ids):
+            line = models.OrderLine(allocation.order_id, allocation.sku, allocation.qty)
+
+            if lines is not None and line not in lines:
+                continue
+
+            product = self.products.find_by(sku=line.sku)
+            next(batch for batch in product.batches if batch.reference == allocation.reference).deallocate(line)
+            product.version_number += 1
+            removed.append(allocation)
+
+        return removed
+
+
+class FakeIdempotencyStore(AbstractIdempotencyStore):
+    """
+    A Fake Idempotency Store keeping outcomes in a dict.
+    """
+
+    def __init__(self):
+        self.outcomes: dict[str, tuple[str, str, datetime.datetime]] = {}
+
+    def get(self, key: str, newer_than: datetime.datetime) -> tuple[str, str] | None:
+        fingerprint, reference, created_at = self.outcomes.get(key, (None, None, datetime.datetime.min))
+        return (fingerprint, reference) if created_at >= newer_than else None
+
+    def put(self, key: str, fingerprint: str, reference: str) -> None:
+        self.outcomes.setdefault(key, (fingerprint, reference, datetime.datetime.utcnow()))
+
+    def delete(self, keys: Sequence[str]) -> None:
+        for key in keys:
+            self.outcomes.pop(key, None)
+
+    def purge(self, older_than: datetime.datetime) -> int:
+        expired = [key for key, (_, _, created_at) in self.outcomes.items() if created_at < older_than]
+
+        for key in expired:
+            del self.outcomes[key]
+
+        return len(expired)
+
+
 class FakeSession(Session):
     """
     A mock session implementation.
@@ -93,6 +228,8 @@ class FakeUoW(AbstractUnitOfWork):
             batches = FakeRepository(models.Batch)
 
         self.batches = batches
+        self.products = FakeProductRepository(batches)
+        self.allocations = FakeAllocationRepository(self.products)
         self.committed = False
 
     def commit(self):
@@ -112,3 +249,22 @@ class FakeUoW(AbstractUnitOfWork):
 
     def __enter__(self):
         return self
+
+
+class TransactionalUoW(FakeUoW):
+    """
+    A fake unit of work which rolls back the changes not committed, as a database would.
+    """
+
+    def __enter__(self):
+        self._snapshot = copy.deepcopy(self.batches.data)
+        self._pending = True
+        return self
+
+    def commit(self):
+        super().commit()
+        self._pending = False
+
+    def __exit__(self, *args):
+        if self._pending:
+            self.batches.data[:] = self._snapshot
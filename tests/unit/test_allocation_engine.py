@@ -0,0 +1,283 @@
+"""
+This module contains the In-Memory Allocation Engine unit test cases.
+"""
+import datetime
+import threading
+import time
+
+import pytest
+
+from allocation.domain import models
+from allocation.service_layer.allocation_engine import InMemoryAllocationEngine, WriteBehindBacklog
+from allocation.service_layer.allocation_service import (
+    AllocationService,
+    InvalidSku,
+    NoBatchesAvailable,
+    NotAllocated,
+    OutOfStock,
+)
+from tests.mocks import FakeRepository, FakeUoW, TransactionalUoW
+
+
+@pytest.fixture(name="fake_uow")
+def fixture_fake_uow() -> FakeUoW:
+    """
+    A fake unit of work with warehouse stock and a shipment of the same SKU.
+    """
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    repository = FakeRepository(models.Batch)
+    repository.add("shipment-batch", "RETRO-CLOCK", 100, tomorrow)
+    repository.add("in-stock-batch", "RETRO-CLOCK", 10, None)
+    return FakeUoW(repository)
+
+
+@pytest.fixture(name="engine")
+def fixture_engine(fake_uow) -> InMemoryAllocationEngine:
+    """
+    A started engine persisting through the fake unit of work.
+    """
+    engine = InMemoryAllocationEngine(lambda: fake_uow)
+    engine.start()
+    yield engine
+    engine.stop()
+
+
+class TestInMemoryAllocationEngine:
+    """
+    Unit test suite for the in-memory allocation engine.
+    """
+
+    def test_allocates_to_the_earliest_batch_that_fits(self, engine):
+        """
+        Test that warehouse stock is preferred, and lines which do not fit go to the next batch.
+        """
+        assert engine.allocate("o1", "RETRO-CLOCK", 8) == "in-stock-batch"
+        assert engine.allocate("o2", "RETRO-CLOCK", 8) == "shipment-batch"
+        assert engine.allocate("o3", "RETRO-CLOCK", 2) == "in-stock-batch"
+
+    def test_persists_allocations_behind_the_scenes(self, engine, fake_uow):
+        """
+        Test that allocations are written through the unit of work.
+        """
+        engine.allocate("o1", "RETRO-CLOCK", 8)
+        engine.flush()
+
+        batch = fake_uow.batches.find_all_by(reference="in-stock-batch")[0]
+        assert batch.available_quantity == 2
+        assert fake_uow.committed is True
+
+    def test_raises_the_service_errors(self, engine):
+        """
+        Test that the engine reports invalid SKUs and missing stock like the service does.
+        """
+        with pytest.raises(InvalidSku):
+            engine.allocate("o1", "NON-EXISTENT-SKU", 1)
+
+        with pytest.raises(OutOfStock):
+            engine.allocate("o1", "RETRO-CLOCK", 1000)
+
+    def test_raises_no_batches_available_when_empty(self):
+        """
+        Test that an engine without batches raises NoBatchesAvailable.
+        """
+        engine = InMemoryAllocationEngine(FakeUoW)
+        engine.load()
+
+        with pytest.raises(NoBatchesAvailable):
+            engine.allocate("o1", "RETRO-CLOCK", 1)
+
+    def test_rebuilds_existing_allocations(self, fake_uow):
+        """
+        Test that loading the engine accounts for the lines already allocated in the database.
+        """
+        batch = fake_uow.batches.find_all_by(reference="in-stock-batch")[0]
+        batch.allocate(models.OrderLine("o1", "RETRO-CLOCK", 8))
+
+        engine = InMemoryAllocationEngine(lambda: fake_uow)
+        engine.load()
+
+        assert engine.allocate("o1", "RETRO-CLOCK", 8) == "in-stock-batch"
+        assert engine.allocate("o2", "RETRO-CLOCK", 8) == "shipment-batch"
+
+    def test_cancels_orders_behind_the_scenes(self, engine, fake_uow):
+        """
+        Test that cancelled lines are available again at once, and deallocated through the unit of work in order.
+        """
+        engine.allocate("o1", "RETRO-CLOCK", 8)
+        engine.allocate("o1", "RETRO-CLOCK", 1)
+
+        assert [allocation.qty for allocation in engine.cancel(["o1", "o2"])] == [1, 8]
+        assert engine.allocate("o3", "RETRO-CLOCK", 10) == "in-stock-batch"
+
+        with pytest.raises(NotAllocated):
+            engine.deallocate(models.OrderLine("o1", "RETRO-CLOCK", 8))
+
+        engine.flush()
+
+        batch = fake_uow.batches.find_by(reference="in-stock-batch")
+        assert batch.available_quantity == 0
+
+    def test_fails_when_the_write_behind_queue_is_full(self, fake_uow):
+        """
+        Test that allocations fail, without being applied, when they cannot be queued.
+        """
+        engine = InMemoryAllocationEngine(lambda: fake_uow, queue_size=1, put_timeout=0)
+        engine.load()
+        engine.allocate("o1", "RETRO-CLOCK", 8)
+
+        with pytest.raises(WriteBehindBacklog):
+            engine.allocate("o2", "RETRO-CLOCK", 2)
+
+        assert engine.backlog == 1
+
+    def test_service_registers_batches_with_the_engine(self, engine, fake_uow):
+        """
+        Test that batches added through the service can be allocated by the engine.
+        """
+        service = AllocationService(fake_uow, engine=engine)
+        service.add_batch("lamp-batch", "COMPLICATED-LAMP", 10, eta=None)
+
+        assert service.allocate("o1", "COMPLICATED-LAMP", 10) == "lamp-batch"
+        assert [r.error for r in service.allocate_many([{"order_id": "o2", "sku": "COMPLICATED-LAMP", "qty": 1}])] == [
+            "OutOfStock"
+        ]
+
+    def test_keeps_batches_which_would_shrink_below_their_allocations(self, engine):
+        """
+        Test that a batch registered again with less than its allocated quantity is kept as is, like in the database.
+        """
+        engine.allocate("o1", "RETRO-CLOCK", 8)
+        engine.add_batch("in-stock-batch", "RETRO-CLOCK", 5)
+
+        assert engine.allocate("o2", "RETRO-CLOCK", 2) == "in-stock-batch"
+
+    def test_keeps_the_allocations_which_fail_to_persist_for_replay(self, fake_uow):
+        """
+        Test that a failing allocation is isolated from the rest of its group, and persisted once replayed.
+        """
+        uow = TransactionalUoW(fake_uow.batches)
+        engine = InMemoryAllocationEngine(lambda: uow, write_retries=1, write_backoff=0)
+        engine.start()
+        # Known to the engine, but not committed yet.
+        engine.add_batch("missing-batch", "LONELY-CHAIR", 5)
+
+        engine.allocate("o1", "RETRO-CLOCK", 8)
+        engine.allocate("o2", "LONELY-CHAIR", 5)
+        engine.flush()
+
+        assert fake_uow.batches.find_by(reference="in-stock-batch").available_quantity == 2
+        assert engine.failed == [("missing-batch", models.OrderLine("o2", "LONELY-CHAIR", 5), True)]
+        assert engine.failed_writes == 1
+
+        fake_uow.batches.add("missing-batch", "LONELY-CHAIR", 5, None)
+        assert engine.replay_failed() == 1
+        engine.stop()
+
+        assert fake_uow.batches.find_by(reference="missing-batch").available_quantity == 0
+        assert engine.failed == []
+
+    def test_gives_back_the_allocations_which_no_longer_fit(self, fake_uow):
+        """
+        Test that an allocation the database turns down is given back instead of being replayed.
+        """
+        engine = InMemoryAllocationEngine(lambda: TransactionalUoW(fake_uow.batches))
+        engine.start()
+        # Allocated behind the engine's back.
+        fake_uow.batches.find_by(reference="in-stock-batch").allocate(models.OrderLine("o0", "RETRO-CLOCK", 8))
+
+        assert engine.allocate("o1", "RETRO-CLOCK", 8) == "in-stock-batch"
+        engine.flush()
+
+        assert engine.failed == []
+        assert engine.rejected_writes == 1
+        assert engine.replay_failed() == 0
+        assert engine.cancel(["o1"]) == []
+        engine.stop()
+
+    def test_does_not_lock_the_allocations_while_waiting_for_room(self, fake_uow):
+        """
+        Test that the allocations are readable while a producer waits, and undone when it gives up.
+        """
+        engine = InMemoryAllocationEngine(lambda: fake_uow, queue_size=1, put_timeout=0.2)
+        engine.load()
+        engine.allocate("o1", "RETRO-CLOCK", 10)
+        failures = []
+
+        def allocate():
+            try:
+                engine.allocate("o2", "RETRO-CLOCK", 5)
+            except WriteBehindBacklog as e:
+                failures.append(e)
+
+        waiting = threading.Thread(target=allocate)
+        waiting.start()
+        time.sleep(0.05)
+
+        start = time.perf_counter()
+        engine.add_batch("lamp-batch", "COMPLICATED-LAMP", 10)
+        assert time.perf_counter() - start < 0.1
+
+        waiting.join()
+        assert len(failures) == 1
+        assert engine._queue.get_nowait()[1].order_id == "o1"  # pylint: disable=protected-access
+        assert engine.allocate("o3", "RETRO-CLOCK", 100) == "shipment-batch"
+
+    def test_retries_groups_which_fail_to_persist(self, fake_uow):
+        """
+        Test that a transient failure does not lose the group being persisted.
+        """
+        failures = [ConnectionError("database restarting")]
+
+        class FlakyUoW(TransactionalUoW):
+            """
+            Fails the first commit.
+            """
+
+            def commit(self):
+                if failures:
+                    raise failures.pop()
+
+                super().commit()
+
+        flaky_uow = FlakyUoW(fake_uow.batches)
+        engine = InMemoryAllocationEngine(lambda: flaky_uow, write_backoff=0)
+        engine.start()
+        engine.allocate("o1", "RETRO-CLOCK", 8)
+        engine.stop()
+
+        assert flaky_uow.committed is True
+        assert engine.failed == []
+
+    def test_does_not_wait_for_room_when_told_not_to(self, fake_uow):
+        """
+        Test that allocating without waiting fails at once, and that cancelling without waiting is all or nothing.
+        """
+        engine = InMemoryAllocationEngine(lambda: fake_uow, queue_size=2, put_timeout=10)
+        engine.load()
+        engine.allocate("o1", "RETRO-CLOCK", 1)
+        engine.allocate("o1", "RETRO-CLOCK", 2)
+
+        start = time.perf_counter()
+
+        with pytest.raises(WriteBehindBacklog):
+            engine.allocate("o2", "RETRO-CLOCK", 1, wait=False)
+
+        with pytest.raises(WriteBehindBacklog):
+            engine.cancel(["o1"], wait=False)
+
+        assert time.perf_counter() - start < 1
+        assert engine.allocate("o1", "RETRO-CLOCK", 1) == "in-stock-batch"
+
+    @pytest.mark.anyio
+    async def test_waits_for_room_off_the_event_loop(self, fake_uow):
+        """
+        Test that run_async waits for room in a thread once the queue is full.
+        """
+        engine = InMemoryAllocationEngine(lambda: fake_uow, queue_size=1, put_timeout=5)
+        engine.load()
+        engine.allocate("o1", "RETRO-CLOCK", 1)
+        # Makes room in a while, as the writer would.
+        threading.Timer(0.05, engine._queue.get_nowait).start()  # pylint: disable=protected-access
+
+        assert await engine.run_async(engine.allocate, "o2", "RETRO-CLOCK", 1) == "in-stock-batch"
+        assert engine.backlog == 1
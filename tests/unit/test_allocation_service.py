@@ -5,9 +5,35 @@ import datetime
 
 import pytest
 
-from allocation.service_layer.allocation_service import AllocationService, InvalidSku, NoBatchesAvailable, OutOfStock
-from allocation.service_layer.unit_of_work import AbstractUnitOfWork
-from tests.mocks import FakeUoW
+from allocation.service_layer.allocation_service import (
+    AllocationResult,
+    AllocationService,
+    InvalidSku,
+    NoBatchesAvailable,
+    NotAllocated,
+    OutOfStock,
+)
+from allocation.service_layer.unit_of_work import AbstractUnitOfWork, ConcurrentUpdate
+from tests.mocks import FakeUoW, TransactionalUoW
+
+
+class ConflictingUoW(TransactionalUoW):
+    """
+    A fake unit of work whose first commits fail as if another transaction changed the product, rolling it back.
+    """
+
+    def __init__(self, conflicts: int):
+        super().__init__()
+        self.conflicts = conflicts
+        self.attempts = 0
+
+    def commit(self):
+        self.attempts += 1
+
+        if self.attempts <= self.conflicts:
+            raise ConcurrentUpdate()
+
+        super().commit()
 
 
 class TestAllocationService:
@@ -46,6 +72,18 @@ class TestAllocationService:
         with pytest.raises(NoBatchesAvailable, match="No batches available"):
             self.get_service().allocate("o1", "A-REAL-SKU", 10)
 
+    def test_only_considers_batches_of_the_requested_sku(self):
+        """
+        Test that the allocation service ignores batches of other SKUs, even when they arrive earlier.
+        """
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+
+        service = self.get_service()
+        service.add_batch("other-sku-batch", "MINIMALIST-SPOON", 100, eta=None)
+        service.add_batch("sku-batch", "FANCY-FORK", 100, eta=tomorrow)
+
+        assert service.allocate("o1", "FANCY-FORK", 10) == "sku-batch"
+
     def test_out_of_stock(self):
         """
         Test that the allocation service raises an error when there is no stock available.
@@ -87,6 +125,101 @@ class TestAllocationService:
 
         assert allocated_ref == in_stock_ref
 
+    def test_allocates_many_lines_reporting_each_outcome(self):
+        """
+        Tests that bulk allocation allocates each line and reports failures without aborting the others.
+        """
+        service = self.get_service()
+        service.add_batch("lamp-batch", "COMPLICATED-LAMP", 10, eta=None)
+        service.add_batch("chair-batch", "UNCOMFORTABLE-CHAIR", 100, eta=None)
+
+        lines = [
+            {"order_id": "o1", "sku": "COMPLICATED-LAMP", "qty": 8},
+            {"order_id": "o1", "sku": "UNCOMFORTABLE-CHAIR", "qty": 10},
+            {"order_id": "o2", "sku": "COMPLICATED-LAMP", "qty": 8},
+            {"order_id": "o2", "sku": "NON-EXISTENT-SKU", "qty": 1},
+            {"order_id": "o3", "sku": "COMPLICATED-LAMP", "qty": 2},
+        ]
+
+        assert service.allocate_many(lines) == [
+            AllocationResult("o1", "COMPLICATED-LAMP", 8, reference="lamp-batch"),
+            AllocationResult("o1", "UNCOMFORTABLE-CHAIR", 10, reference="chair-batch"),
+            AllocationResult("o2", "COMPLICATED-LAMP", 8, error="OutOfStock"),
+            AllocationResult("o2", "NON-EXISTENT-SKU", 1, error="InvalidSku"),
+            AllocationResult("o3", "COMPLICATED-LAMP", 2, reference="lamp-batch"),
+        ]
+        # noinspection PyUnresolvedReferences
+        assert service.uow.committed is True
+
+    def test_allocate_many_without_batches(self):
+        """
+        Tests that bulk allocation reports every line when there are no batches at all.
+        """
+        [result] = self.get_service().allocate_many([{"order_id": "o1", "sku": "A-REAL-SKU", "qty": 1}])
+
+        assert result.error == "NoBatchesAvailable"
+
+    def test_retries_concurrent_updates(self):
+        """
+        Tests that an allocation conflicting with a concurrent one is retried.
+        """
+        uow = ConflictingUoW(conflicts=2)
+        uow.batches.add("b1", "COMPLICATED-LAMP", 100)
+        service = AllocationService(uow, retries=2, backoff=0)
+
+        assert service.allocate("o1", "COMPLICATED-LAMP", 10) == "b1"
+        assert uow.attempts == 3
+
+    def test_gives_up_after_the_last_retry(self):
+        """
+        Tests that the conflict is raised once every retry conflicted as well.
+        """
+        uow = ConflictingUoW(conflicts=3)
+        uow.batches.add("b1", "COMPLICATED-LAMP", 100)
+        service = AllocationService(uow, retries=2, backoff=0)
+
+        with pytest.raises(ConcurrentUpdate):
+            service.allocate_many([{"order_id": "o1", "sku": "COMPLICATED-LAMP", "qty": 10}])
+
+        assert uow.attempts == 3
+
+    def test_deallocates_a_line(self):
+        """
+        Tests that a deallocated line frees its quantity in its batch, and bumps the product version.
+        """
+        uow = FakeUoW()
+        uow.batches.add("b1", "COMPLICATED-LAMP", 10)
+        service = self.get_service(uow)
+        service.allocate("o1", "COMPLICATED-LAMP", 10)
+
+        assert service.deallocate("o1", "COMPLICATED-LAMP", 10) == "b1"
+        assert uow.batches.find_by(reference="b1").available_quantity == 10
+        assert uow.products.find_by(sku="COMPLICATED-LAMP").version_number == 2
+
+        with pytest.raises(NotAllocated):
+            service.deallocate("o1", "COMPLICATED-LAMP", 10)
+
+    def test_cancels_every_line_of_orders(self):
+        """
+        Tests that cancelling orders deallocates all of their lines, and only theirs.
+        """
+        uow = FakeUoW()
+        uow.batches.add("b1", "COMPLICATED-LAMP", 100)
+        uow.batches.add("b2", "UNCOMFORTABLE-CHAIR", 100)
+        service = self.get_service(uow)
+        service.allocate("o1", "COMPLICATED-LAMP", 10)
+        service.allocate("o1", "UNCOMFORTABLE-CHAIR", 5)
+        service.allocate("o2", "COMPLICATED-LAMP", 20)
+
+        removed = service.cancel_order("o1")
+
+        assert sorted(allocation.reference for allocation in removed) == ["b1", "b2"]
+        assert uow.batches.find_by(reference="b1").available_quantity == 80
+        assert uow.batches.find_by(reference="b2").available_quantity == 100
+
+        with pytest.raises(NotAllocated):
+            service.cancel_order("o1")
+
     @staticmethod
     def get_service(uow: AbstractUnitOfWork = None) -> AllocationService:
         """
@@ -5,7 +5,7 @@ Allocation Tests.
 from datetime import date
 from unittest import TestCase
 
-from allocation.domain.models import Batch, OrderLine
+from allocation.domain.models import Batch, OrderLine, Product
 
 
 def make_batch_and_line(sku, batch_qty, line_qty) -> tuple[Batch, OrderLine]:
@@ -94,3 +94,37 @@ class TestAllocationDomain(TestCase):
         batch.allocate(line)
 
         assert batch.available_quantity == 18
+
+    def test_deallocating_restores_the_available_quantity(self):
+        """
+        Deallocating an allocated line restores the available quantity.
+        """
+        batch, line = make_batch_and_line("BLUE-VASE", 20, 2)
+
+        batch.allocate(line)
+        batch.deallocate(line)
+
+        assert batch.allocated_quantity == 0
+        assert batch.available_quantity == 20
+
+    def test_product_allocates_to_the_earliest_batch_and_increments_its_version(self):
+        """
+        Allocating through a product picks the earliest batch that fits and bumps the version number.
+        """
+        shipment = Batch(ref="shipment", sku="RETRO-CLOCK", qty=100, eta=date.today())
+        in_stock = Batch(ref="in-stock", sku="RETRO-CLOCK", qty=5)
+        product = Product("RETRO-CLOCK", [shipment, in_stock], version_number=7)
+
+        assert product.allocate(OrderLine("o1", "RETRO-CLOCK", 10)) == "shipment"
+        assert product.allocate(OrderLine("o2", "RETRO-CLOCK", 5)) == "in-stock"
+        assert product.version_number == 9
+
+    def test_product_version_is_kept_when_out_of_stock(self):
+        """
+        A product which cannot allocate a line is left unchanged.
+        """
+        batch, line = make_batch_and_line("SMALL-FORK", 1, 2)
+        product = Product("SMALL-FORK", [batch])
+
+        assert product.allocate(line) is None
+        assert product.version_number == 0
@@ -0,0 +1,119 @@
+"""
+This module contains the Allocation Batcher unit test cases.
+"""
+import asyncio
+
+import pytest
+
+from allocation.adapters.metrics import Histogram
+from allocation.domain import models
+from allocation.service_layer.allocation_service import AllocationService, InvalidSku, OutOfStock
+from allocation.service_layer.batcher import AllocationBatcher
+from tests.mocks import FakeRepository, FakeUoW
+
+pytestmark = pytest.mark.anyio
+
+
+class CountingUoW(FakeUoW):
+    """
+    A fake unit of work counting its commits.
+    """
+
+    commits = 0
+
+    def commit(self):
+        CountingUoW.commits += 1
+        super().commit()
+
+
+@pytest.fixture(name="repository")
+def fixture_repository() -> FakeRepository:
+    """
+    A fake repository with a batch of a single SKU.
+    """
+    repository = FakeRepository(models.Batch)
+    repository.add("lamp-batch", "COMPLICATED-LAMP", 10)
+    CountingUoW.commits = 0
+    return repository
+
+
+class TestAllocationBatcher:
+    """
+    Unit test suite for the allocation batcher.
+    """
+
+    async def test_applies_concurrent_allocations_with_one_commit(self, repository):
+        """
+        Test that allocations submitted together are committed together, each caller getting its own outcome.
+        """
+        batcher = AllocationBatcher(lambda: AllocationService(CountingUoW(repository)), window=10, max_size=3)
+        await batcher.start()
+
+        results = await asyncio.gather(
+            batcher.allocate("o1", "COMPLICATED-LAMP", 6),
+            batcher.allocate("o2", "COMPLICATED-LAMP", 6),
+            batcher.allocate("o3", "NON-EXISTENT-SKU", 1),
+            return_exceptions=True,
+        )
+        await batcher.stop()
+
+        assert results[0] == "lamp-batch"
+        assert isinstance(results[1], OutOfStock)
+        assert isinstance(results[2], InvalidSku)
+        assert CountingUoW.commits == 1
+        assert batcher.stats()["batch_size"]["count"] == 1
+        assert batcher.stats()["wait_seconds"]["count"] == 3
+
+    async def test_closes_full_groups(self, repository):
+        """
+        Test that a group is applied as soon as it is full.
+        """
+        batcher = AllocationBatcher(lambda: AllocationService(CountingUoW(repository)), window=10, max_size=2)
+        await batcher.start()
+
+        allocations = (batcher.allocate(f"o{i}", "COMPLICATED-LAMP", 1) for i in range(2))
+        await asyncio.wait_for(asyncio.gather(*allocations), timeout=1)
+        await batcher.stop()
+
+        assert CountingUoW.commits == 1
+
+    async def test_fails_every_caller_when_the_group_fails(self, repository):
+        """
+        Test that an error applying the group is raised to every caller.
+        """
+
+        def broken_service():
+            raise RuntimeError("database is gone")
+
+        batcher = AllocationBatcher(broken_service, window=0.01)
+        await batcher.start()
+
+        results = await asyncio.gather(
+            batcher.allocate("o1", "COMPLICATED-LAMP", 1),
+            batcher.allocate("o2", "COMPLICATED-LAMP", 1),
+            return_exceptions=True,
+        )
+        await batcher.stop()
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+
+class TestHistogram:
+    """
+    Unit test suite for the histogram metric.
+    """
+
+    def test_counts_observations_cumulatively(self):
+        """
+        Test that buckets count the observations up to their bound, and larger ones only count in the total.
+        """
+        histogram = Histogram("sizes", "Sizes", buckets=(1, 5, 10))
+
+        for value in (1, 3, 5, 7, 50):
+            histogram.observe(value)
+
+        assert histogram.snapshot() == {
+            "buckets": [{"le": 1, "count": 1}, {"le": 5, "count": 3}, {"le": 10, "count": 4}],
+            "count": 5,
+            "sum": 66,
+        }
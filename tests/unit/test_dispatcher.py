@@ -0,0 +1,75 @@
+"""
+This module contains the Allocation Dispatcher unit test cases.
+"""
+import asyncio
+
+import pytest
+
+from allocation.domain import models
+from allocation.service_layer.allocation_service import AllocationService, InvalidSku, OutOfStock
+from allocation.service_layer.dispatcher import AllocationDispatcher
+from tests.mocks import FakeRepository, FakeUoW
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(name="repository")
+def fixture_repository() -> FakeRepository:
+    """
+    A fake repository with batches of two SKUs.
+    """
+    repository = FakeRepository(models.Batch)
+    repository.add("lamp-batch", "COMPLICATED-LAMP", 10)
+    repository.add("chair-batch", "UNCOMFORTABLE-CHAIR", 10)
+    return repository
+
+
+@pytest.fixture(name="dispatcher")
+async def fixture_dispatcher(repository) -> AllocationDispatcher:
+    """
+    A started dispatcher whose workers allocate with the blocking service.
+    """
+    dispatcher = AllocationDispatcher(lambda: AllocationService(FakeUoW(repository)), workers=2)
+    await dispatcher.start()
+    yield dispatcher
+    await dispatcher.stop()
+
+
+class TestAllocationDispatcher:
+    """
+    Unit test suite for the allocation dispatcher.
+    """
+
+    async def test_allocates_concurrent_requests(self, dispatcher):
+        """
+        Test that concurrent allocations of a SKU are applied one after the other.
+        """
+        results = await asyncio.gather(
+            *(dispatcher.allocate(f"o{i}", "COMPLICATED-LAMP", 4) for i in range(3)),
+            return_exceptions=True,
+        )
+
+        assert [isinstance(result, str) for result in results].count(True) == 2
+        assert [isinstance(result, OutOfStock) for result in results].count(True) == 1
+
+    async def test_propagates_errors(self, dispatcher):
+        """
+        Test that the error of an allocation is raised to its caller.
+        """
+        with pytest.raises(InvalidSku):
+            await dispatcher.allocate("o1", "NON-EXISTENT-SKU", 1)
+
+    async def test_routes_a_sku_to_the_same_worker(self, dispatcher):
+        """
+        Test that a SKU is always handled by the same worker, and its allocations are counted there.
+        """
+        worker = dispatcher.worker_of("UNCOMFORTABLE-CHAIR")
+
+        await dispatcher.allocate("o1", "UNCOMFORTABLE-CHAIR", 1)
+        await dispatcher.allocate("o2", "UNCOMFORTABLE-CHAIR", 1)
+
+        stats = dispatcher.stats()
+        assert dispatcher.worker_of("UNCOMFORTABLE-CHAIR") == worker
+        assert stats[worker]["processed"] == 2
+        assert stats[worker]["queue_depth"] == 0
+        assert stats[worker]["max_latency"] >= stats[worker]["mean_latency"] > 0
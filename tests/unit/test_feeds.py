@@ -0,0 +1,53 @@
+"""
+This module contains the feed parsers unit test cases.
+"""
+import pytest
+
+from allocation.app.utils.feeds import iter_lines
+
+pytestmark = pytest.mark.anyio
+
+
+async def chunked(*chunks: bytes):
+    """
+    Yields body chunks, as received.
+    """
+    for chunk in chunks:
+        yield chunk
+
+
+async def lines_of(*chunks: bytes, max_length: int = 8) -> list:
+    """
+    Splits chunks into lines, describing errors by their message.
+    """
+    return [line if isinstance(line, str) else str(line) async for line in iter_lines(chunked(*chunks), max_length)]
+
+
+class TestIterLines:
+    """
+    Unit test suite for splitting feeds into lines.
+    """
+
+    async def test_splits_lines_across_chunks(self):
+        """
+        Test that lines split across chunks are joined, without their terminators.
+        """
+        assert await lines_of(b"ab\r\nc", b"d\ne", b"f") == ["ab", "cd", "ef"]
+
+    async def test_reports_a_line_too_long_once_without_buffering_it(self):
+        """
+        Test that a line longer than allowed is reported once, however many chunks it spans, and the next one is read.
+        """
+        lines = await lines_of(b"a\n0123456", b"789", b"0123456789", b"0\nb\n")
+
+        assert lines == ["a", "Line longer than 8 bytes", "b"]
+
+    async def test_reports_lines_which_are_not_utf8(self):
+        """
+        Test that a line which cannot be decoded is reported in its place.
+        """
+        lines = await lines_of(b"a\n\xff\nb")
+
+        assert lines[0] == "a"
+        assert lines[1].startswith("Line is not valid UTF-8")
+        assert lines[2] == "b"
@@ -0,0 +1,133 @@
+"""
+This module contains the Idempotency Cache unit test cases.
+"""
+import asyncio
+
+import pytest
+
+from allocation.service_layer.allocation_service import OutOfStock
+from allocation.service_layer.idempotency import IdempotencyCache, IdempotencyKeyReused
+from tests.mocks import FakeIdempotencyStore
+
+pytestmark = pytest.mark.anyio
+
+
+class Operation:
+    """
+    A request counting how many times it ran.
+    """
+
+    def __init__(self, outcome: str = "batch-001", error: Exception | None = None):
+        self.outcome = outcome
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+
+        if self.error is not None:
+            raise self.error
+
+        return self.outcome
+
+
+class TestIdempotencyCache:
+    """
+    Unit test suite for the idempotency cache.
+    """
+
+    async def test_replays_a_retried_request(self):
+        """
+        Test that a request retried with the same key is answered with its first outcome, and stored.
+        """
+        store = FakeIdempotencyStore()
+        cache = IdempotencyCache(store)
+        operation = Operation()
+
+        assert await cache.run("k1", "o1:LAMP:1", operation) == "batch-001"
+        assert await cache.run("k1", "o1:LAMP:1", operation) == "batch-001"
+
+        assert operation.calls == 1
+        assert store.outcomes["k1"][:2] == ("o1:LAMP:1", "batch-001")
+        assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "joined": 0}
+
+    async def test_runs_concurrent_duplicates_once(self):
+        """
+        Test that duplicates of a request in flight wait for its outcome instead of running.
+        """
+        cache = IdempotencyCache()
+        operation = Operation()
+
+        results = await asyncio.gather(*(cache.run("k1", "o1:LAMP:1", operation) for _ in range(3)))
+
+        assert results == ["batch-001"] * 3
+        assert operation.calls == 1
+        assert cache.joined == 2
+
+    async def test_rejects_a_key_reused_for_another_request(self):
+        """
+        Test that a key sent again with another request is an error.
+        """
+        cache = IdempotencyCache()
+        await cache.run("k1", "o1:LAMP:1", Operation())
+
+        with pytest.raises(IdempotencyKeyReused):
+            await cache.run("k1", "o2:LAMP:1", Operation())
+
+    async def test_does_not_keep_failures(self):
+        """
+        Test that a failed request runs again when retried.
+        """
+        cache = IdempotencyCache()
+        operation = Operation(error=OutOfStock())
+
+        for _ in range(2):
+            with pytest.raises(OutOfStock):
+                await cache.run("k1", "o1:LAMP:1", operation)
+
+        assert operation.calls == 2
+        assert cache.stats()["size"] == 0
+
+    async def test_evicts_least_recently_used_outcomes(self):
+        """
+        Test that the memory holds at most max_size outcomes, the least recently used being evicted.
+        """
+        cache = IdempotencyCache(max_size=2)
+
+        await cache.run("k1", "f1", Operation("b1"))
+        await cache.run("k2", "f2", Operation("b2"))
+        await cache.run("k1", "f1", Operation("b1"))
+        await cache.run("k3", "f3", Operation("b3"))
+
+        operation = Operation("b1")
+        await cache.run("k1", "f1", operation)
+        assert operation.calls == 0
+
+        operation = Operation("b2")
+        await cache.run("k2", "f2", operation)
+        assert operation.calls == 1
+
+    async def test_replays_outcomes_from_the_store(self):
+        """
+        Test that outcomes stored by another process or before a restart are replayed.
+        """
+        store = FakeIdempotencyStore()
+        store.put("k1", "o1:LAMP:1", "batch-001")
+        operation = Operation("batch-002")
+
+        assert await IdempotencyCache(store).run("k1", "o1:LAMP:1", operation) == "batch-001"
+        assert operation.calls == 0
+
+    async def test_expires_stored_outcomes(self):
+        """
+        Test that outcomes older than the TTL are no longer replayed, and are purged.
+        """
+        store = FakeIdempotencyStore()
+        store.put("k1", "o1:LAMP:1", "batch-001")
+        cache = IdempotencyCache(store, ttl=-1)
+        operation = Operation("batch-002")
+
+        assert await cache.run("k1", "o1:LAMP:1", operation) == "batch-002"
+        assert operation.calls == 1
+        assert cache.purge() == 1
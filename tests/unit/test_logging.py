@@ -0,0 +1,82 @@
+"""
+This module contains the queue-based logging unit test cases.
+"""
+import io
+import json
+import logging
+import queue
+
+from allocation.settings.config import (
+    LOGGER_NAME,
+    DroppingQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    start_logging,
+    stop_logging,
+)
+
+
+def make_record(level: int = logging.INFO, message: str = "Allocating order (%s)", *args) -> logging.LogRecord:
+    """
+    Builds a record of the per-request logger.
+    """
+    return logging.LogRecord(LOGGER_NAME, level, __file__, 1, message, args or ("o1",), None)
+
+
+class TestLogging:
+    """
+    Unit test suite for the logging configuration.
+    """
+
+    def test_formats_records_as_json(self):
+        """
+        Test that a record is formatted as a single line JSON object.
+        """
+        line = JsonFormatter().format(make_record())
+
+        assert "\n" not in line
+        document = json.loads(line)
+        assert document["level"] == "INFO"
+        assert document["logger"] == LOGGER_NAME
+        assert document["message"] == "Allocating order (o1)"
+        assert document["time"].endswith("Z")
+
+    def test_samples_records_below_warning(self):
+        """
+        Test that sampled out records are dropped, while warnings are always kept.
+        """
+        sampling = SamplingFilter(rate=0)
+
+        assert not sampling.filter(make_record(logging.INFO))
+        assert sampling.filter(make_record(logging.WARNING))
+        assert SamplingFilter(rate=1).filter(make_record(logging.INFO))
+
+    def test_drops_records_once_the_queue_is_full(self):
+        """
+        Test that logging never waits on a full queue.
+        """
+        handler = DroppingQueueHandler(queue.Queue(1))
+
+        handler.handle(make_record())
+        handler.handle(make_record())
+
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 1
+
+    def test_writes_records_from_a_listener_thread(self):
+        """
+        Test that the records of the package loggers are written once the queue is drained.
+        """
+        stream = io.StringIO()
+        start_logging(level="INFO", request_sample_rate=0, json_format=True, stream=stream)
+
+        try:
+            logging.getLogger(LOGGER_NAME).info("Allocating order (%s)", "o1")
+            logging.getLogger(LOGGER_NAME).warning("Allocation backlog is full")
+            logging.getLogger("allocation.adapters.migrations").info("Upgraded")
+        finally:
+            stop_logging()
+
+        messages = [json.loads(line)["message"] for line in stream.getvalue().splitlines()]
+        assert messages == ["Allocation backlog is full", "Upgraded"]
+        assert not logging.getLogger(LOGGER_NAME).handlers
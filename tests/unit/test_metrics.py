@@ -0,0 +1,66 @@
+"""
+This module contains the metrics unit test cases.
+"""
+import pytest
+
+from allocation.adapters.metrics import Registry
+
+
+class TestRegistry:
+    """
+    Unit test suite for the rendering of metrics in the Prometheus text format.
+    """
+
+    def test_renders_labelled_histograms(self):
+        """
+        Test that a histogram renders cumulative buckets, the +Inf bucket, its sum and count per label values.
+        """
+        registry = Registry()
+        latency = registry.histogram("latency_seconds", "Latency.", labels=("route",), buckets=(0.1, 1))
+
+        latency.labels("/a").observe(0.05)
+        latency.labels("/a").observe(2)
+
+        assert registry.render().splitlines() == [
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{route="/a",le="0.1"} 1',
+            'latency_seconds_bucket{route="/a",le="1"} 1',
+            'latency_seconds_bucket{route="/a",le="+Inf"} 2',
+            'latency_seconds_sum{route="/a"} 2.05',
+            'latency_seconds_count{route="/a"} 2',
+        ]
+
+    def test_renders_counters_gauges_and_collected_metrics(self):
+        """
+        Test that counters and gauges render one sample per label values, escaped, followed by collected metrics.
+        """
+        registry = Registry()
+        requests = registry.counter("requests_total", "Requests.", labels=("path",))
+        in_flight = registry.gauge("in_flight", "In flight.")
+
+        @registry.collector
+        def collect():
+            size = Registry().gauge("cache_size", "Cache size.")
+            size.labels().set(3)
+            yield size
+
+        requests.labels('say "hi"\n').inc(2)
+        in_flight.labels().inc()
+        in_flight.labels().dec()
+
+        lines = registry.render().splitlines()
+
+        assert 'requests_total{path="say \\"hi\\"\\n"} 2' in lines
+        assert "in_flight 0" in lines
+        assert lines[-2:] == ["# TYPE cache_size gauge", "cache_size 3"]
+
+    def test_rejects_metrics_registered_twice(self):
+        """
+        Test that a metric name can only be registered once.
+        """
+        registry = Registry()
+        registry.counter("requests_total", "Requests.")
+
+        with pytest.raises(ValueError):
+            registry.gauge("requests_total", "Requests.")
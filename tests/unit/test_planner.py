@@ -0,0 +1,108 @@
+"""
+This module contains the allocation planner unit test cases.
+"""
+import copy
+import random
+from datetime import date, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from allocation.domain.models import Batch, OrderLine  # noqa: E402
+from allocation.service_layer import planner  # noqa: E402
+from allocation.service_layer.allocation_service import allocate  # noqa: E402
+from allocation.service_layer.planner import INVALID_SKU, OUT_OF_STOCK, fill, plan_order_lines  # noqa: E402
+
+today = date.today()
+
+
+def random_scenario(seed: int) -> tuple[list[OrderLine], list[Batch]]:
+    """
+    Builds order lines and partly allocated batches of a few SKUs, some of the lines of an unknown SKU.
+    """
+    rng = random.Random(seed)
+    skus = [f"SKU-{i}" for i in range(3)]
+    batches = []
+
+    for i in range(rng.randint(1, 12)):
+        eta = None if rng.random() < 0.3 else today + timedelta(days=rng.randint(0, 5))
+        batch = Batch(f"batch-{i}", rng.choice(skus), rng.randint(0, 60), eta)
+        batch.allocate(OrderLine(f"existing-{i}", batch.sku, rng.randint(1, 10)))
+        batches.append(batch)
+
+    lines = [
+        OrderLine(f"order-{i}", rng.choice(skus + ["UNKNOWN"]), rng.randint(1, 15)) for i in range(rng.randint(0, 80))
+    ]
+    return lines, batches
+
+
+class TestPlanner:
+    """
+    Unit test suite for the vectorized allocation planner.
+    """
+
+    def test_fills_a_batch_one_line_at_a_time(self):
+        """
+        Test that lines which no longer fit are skipped, while later smaller ones are still taken.
+        """
+        assert fill(np.array([4, 5, 3, 1, 2, 1]), 10).tolist() == [0, 1, 3]
+
+    @pytest.mark.parametrize(
+        "window, small_group", [(planner.WINDOW, planner.SMALL_GROUP), (planner.WINDOW, 0), (2, 0)]
+    )
+    def test_plans_the_same_allocations_as_allocating_line_by_line(self, window, small_group, monkeypatch):
+        """
+        Test that the plan matches allocating every line in order, on random scenarios, however lines are scanned.
+        """
+        monkeypatch.setattr(planner, "WINDOW", window)
+        monkeypatch.setattr(planner, "SMALL_GROUP", small_group)
+
+        for seed in range(200):
+            lines, batches = random_scenario(seed)
+            planned_batches = copy.deepcopy(batches)
+
+            expected = []
+
+            for line in lines:
+                sku_batches = [batch for batch in batches if batch.sku == line.sku]
+                expected.append(allocate(line, sku_batches) if sku_batches else INVALID_SKU)
+
+            plan = plan_order_lines(lines, planned_batches)
+            planned = [plan.reference(i) if a >= 0 else a for i, a in enumerate(plan.assignments.tolist())]
+
+            assert planned == [OUT_OF_STOCK if reference is None else reference for reference in expected], seed
+
+            for reference, allocated in zip(plan.references, plan.allocated.tolist()):
+                before = next(batch for batch in planned_batches if batch.reference == reference)
+                after = next(batch for batch in batches if batch.reference == reference)
+                assert allocated == after.allocated_quantity - before.allocated_quantity, seed
+
+    def test_leaves_the_batches_unchanged(self):
+        """
+        Test that planning is a what-if, which allocates nothing.
+        """
+        batch = Batch("batch-001", "SMALL-TABLE", 10)
+
+        plan = plan_order_lines([OrderLine("order-1", "SMALL-TABLE", 4)], [batch])
+
+        assert plan.reference(0) == "batch-001"
+        assert batch.available_quantity == 10
+
+    def test_describes_the_plan_as_allocation_results(self):
+        """
+        Test that lines which cannot be allocated are described with the error allocate_many would return.
+        """
+        lines = [
+            OrderLine("order-1", "SMALL-TABLE", 4),
+            OrderLine("order-2", "SMALL-TABLE", 20),
+            OrderLine("order-3", "BLUE-VASE", 1),
+        ]
+
+        results = plan_order_lines(lines, [Batch("batch-001", "SMALL-TABLE", 10)]).results(lines)
+
+        assert [(result.reference, result.error) for result in results] == [
+            ("batch-001", None),
+            (None, "OutOfStock"),
+            (None, "InvalidSku"),
+        ]
@@ -0,0 +1,94 @@
+"""
+This module contains the request profiling unit test cases.
+"""
+import time
+
+import pytest
+
+from allocation.adapters.profiling import ProfileStore, SamplingProfiler
+from allocation.app import middleware
+from allocation.service_layer.dependencies import start_profile_store, stop_profile_store
+
+
+def busy(seconds: float):
+    """
+    Keeps the CPU busy for a while.
+    """
+    deadline = time.perf_counter() + seconds
+
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestSamplingProfiler:
+    """
+    Unit test suite for the sampling profiler.
+    """
+
+    def test_samples_the_stacks_of_busy_threads(self):
+        """
+        Test that the stacks of the running code are sampled, root first, in the collapsed stack format.
+        """
+        with SamplingProfiler(interval=0.001) as profiler:
+            busy(0.05)
+
+        assert profiler.samples > 0
+        assert any(stack.startswith("MainThread;") and "busy (test_profiling.py" in stack for stack in profiler.stacks)
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in profiler.collapsed().splitlines())
+
+
+class TestProfileStore:
+    """
+    Unit test suite for the store of request profiles.
+    """
+
+    def test_keeps_the_latest_profiles(self, tmp_path):
+        """
+        Test that the oldest profiles are deleted once there are too many, and the others listed latest first.
+        """
+        store = ProfileStore(tmp_path, max_profiles=2)
+        profiler = SamplingProfiler()
+        profiler.stacks["MainThread;allocate (allocation_service.py:1)"] = 3
+        ids = [store.new_id() for _ in range(3)]
+
+        for profile_id in ids:
+            store.save(profile_id, profiler, "POST", "/api/v1/allocations", 201, 0.1)
+
+        assert [info.id for info in store.find_all()] == [ids[2], ids[1]]
+        assert store.path(ids[0]) is None
+        assert store.path(ids[2]).read_text() == "MainThread;allocate (allocation_service.py:1) 3\n"
+
+    def test_only_finds_profile_ids(self, tmp_path):
+        """
+        Test that paths outside the store cannot be downloaded.
+        """
+        store = ProfileStore(tmp_path)
+
+        assert store.path("../../etc/passwd") is None
+
+
+class TestProfilingMiddleware:
+    """
+    Unit test suite for the request profiling middleware.
+    """
+
+    @pytest.mark.anyio
+    async def test_reports_why_a_profiler_could_not_start(self, tmp_path, monkeypatch):
+        """
+        Test that a profiler which fails to start raises its own error, rather than a missing profiler when saving.
+        """
+
+        def broken_profiler(interval):
+            raise RuntimeError("No sampling thread")
+
+        async def app(scope, receive, send):
+            pass  # pragma: no cover
+
+        monkeypatch.setattr(middleware, "SamplingProfiler", broken_profiler)
+        start_profile_store(ProfileStore(tmp_path))
+
+        try:
+            with pytest.raises(RuntimeError, match="No sampling thread"):
+                await middleware.ProfilingMiddleware(app, sample_rate=1)({"type": "http", "headers": []}, None, None)
+        finally:
+            stop_profile_store()
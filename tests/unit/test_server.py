@@ -0,0 +1,80 @@
+"""
+This module contains the production server configuration unit test cases.
+"""
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from allocation.adapters import database, migrations
+from allocation.app import server
+from allocation.app.config.settings import Application, settings
+
+
+class TestServer:
+    """
+    Unit test suite for the production server configuration.
+    """
+
+    def test_runs_a_worker_per_cpu_by_default(self):
+        """
+        Test that the server uses every CPU available unless told otherwise.
+        """
+        options = server.server_options(Application(SERVER_WORKERS=0))
+
+        assert options["workers"] == server.cpu_count()
+        assert options["worker_class"] == "allocation.app.workers.UvicornWorker"
+        assert server.server_options(Application(SERVER_WORKERS=3))["workers"] == 3
+
+    def test_recycles_workers_with_jitter(self):
+        """
+        Test that workers are not all replaced after the same number of requests.
+        """
+        options = server.server_options(Application(SERVER_MAX_REQUESTS=1000))
+
+        assert options["max_requests"] == 1000
+        assert options["max_requests_jitter"] == 100
+
+    def test_rejects_several_workers_with_the_memory_engine(self):
+        """
+        Test that the memory allocation engine, which must be the only writer, runs in a single worker.
+        """
+        with pytest.raises(ValueError):
+            server.server_options(Application(ALLOCATION_ENGINE="memory", SERVER_WORKERS=2))
+
+        assert server.server_options(Application(ALLOCATION_ENGINE="memory", SERVER_WORKERS=1))["workers"] == 1
+
+    def test_rejects_several_workers_with_a_sku_catalog_which_never_expires(self):
+        """
+        Test that a worker catalog expires, to see the batches added through the other workers.
+        """
+        with pytest.raises(ValueError):
+            server.server_options(Application(SKU_CATALOG="bloom", SKU_CATALOG_TTL=0, SERVER_WORKERS=2))
+
+        assert server.server_options(Application(SKU_CATALOG="bloom", SKU_CATALOG_TTL=60, SERVER_WORKERS=2))
+        assert server.server_options(Application(SKU_CATALOG="set", SKU_CATALOG_TTL=0, SERVER_WORKERS=1))
+
+    def test_replaces_the_connection_pools_after_forking(self):
+        """
+        Test that a forked worker does not reuse the connection pools of the arbiter.
+        """
+        pool, async_pool = database.engine.pool, database.async_engine.sync_engine.pool
+
+        server.post_fork(server=None, worker=None)
+
+        assert database.engine.pool is not pool
+        assert database.async_engine.sync_engine.pool is not async_pool
+
+    def test_upgrades_the_schema_once_before_forking(self, monkeypatch):
+        """
+        Test that the arbiter upgrades a SQLite schema, so the workers it forks only check it.
+        """
+        upgraded = []
+        monkeypatch.setattr(settings, "USE_SQLITE", True)
+        monkeypatch.setattr(migrations, "upgrade", upgraded.append)
+        monkeypatch.setattr(migrations, "_upgraded_before_fork", False)
+
+        server.on_starting(SimpleNamespace(num_workers=2, log=logging.getLogger(__name__)))
+
+        assert upgraded == [database.engine]
+        assert migrations.upgraded_before_fork() is True
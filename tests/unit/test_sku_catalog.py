@@ -0,0 +1,197 @@
+"""
+This module contains the SKU Catalog unit test cases.
+"""
+import time
+
+import pytest
+
+from allocation.domain import models
+from allocation.service_layer.allocation_service import AllocationService, InvalidSku, NoBatchesAvailable
+from allocation.service_layer.sku_catalog import BloomFilter, SkuCatalog
+from tests.mocks import FakeRepository, FakeUoW
+
+
+class CountingRepository(FakeRepository):
+    """
+    A fake repository counting the lookups which would reach the database.
+    """
+
+    lookups = 0
+
+    def find_all_by(self, **kwargs):
+        self.lookups += 1
+        return super().find_all_by(**kwargs)
+
+    def exists(self, **kwargs):
+        self.lookups += 1
+        return super().exists(**kwargs)
+
+
+@pytest.fixture(name="fake_uow")
+def fixture_fake_uow() -> FakeUoW:
+    """
+    A fake unit of work with a batch of a single SKU.
+    """
+    repository = CountingRepository(models.Batch)
+    repository.add("batch-001", "SMALL-TABLE", 20)
+    return FakeUoW(repository)
+
+
+class TestBloomFilter:
+    """
+    Unit test suite for the Bloom filter.
+    """
+
+    def test_has_no_false_negatives(self):
+        """
+        Test that every added item is reported as present.
+        """
+        bloom = BloomFilter(1000)
+        items = [f"SKU-{i}" for i in range(1000)]
+
+        for item in items:
+            bloom.add(item)
+
+        assert all(item in bloom for item in items)
+
+    def test_false_positive_rate_is_bounded(self):
+        """
+        Test that, at capacity, absent items are rarely reported as present.
+        """
+        bloom = BloomFilter(1000, error_rate=0.01)
+
+        for i in range(1000):
+            bloom.add(f"SKU-{i}")
+
+        false_positives = sum(f"OTHER-{i}" in bloom for i in range(10000))
+        assert false_positives < 300
+
+    @pytest.mark.parametrize("error_rate", [0, 1, -0.5, 2])
+    def test_rejects_error_rates_out_of_range(self, error_rate):
+        """
+        Test that an error rate which would size the filter with log(0), or divide by zero, is refused.
+        """
+        with pytest.raises(ValueError):
+            BloomFilter(1000, error_rate=error_rate)
+
+        with pytest.raises(ValueError):
+            SkuCatalog(FakeUoW, bloom=True, error_rate=error_rate)
+
+
+@pytest.mark.parametrize("bloom", [False, True])
+class TestSkuCatalog:
+    """
+    Unit test suite for the SKU catalog.
+    """
+
+    def test_rejects_unknown_skus_without_a_lookup(self, fake_uow, bloom):
+        """
+        Test that an unknown SKU raises InvalidSku without reaching the repository.
+        """
+        catalog = SkuCatalog(lambda: fake_uow, bloom=bloom)
+        catalog.refresh()
+        service = AllocationService(fake_uow, catalog=catalog)
+
+        with pytest.raises(InvalidSku):
+            service.allocate("o1", "NONEXISTENT-SKU", 10)
+
+        assert fake_uow.batches.lookups == 0
+        assert catalog.stats() | {"refreshes": 0} == {
+            "size": 1,
+            "hits": 1,
+            "misses": 0,
+            "false_positives": 0,
+            "refreshes": 0,
+        }
+
+    def test_known_skus_go_through_the_database(self, fake_uow, bloom):
+        """
+        Test that a known SKU is still allocated from the repository, and counted as a miss.
+        """
+        catalog = SkuCatalog(lambda: fake_uow, bloom=bloom)
+        service = AllocationService(fake_uow, catalog=catalog)
+
+        assert service.allocate("o1", "SMALL-TABLE", 10) == "batch-001"
+        assert catalog.misses == 1
+        assert catalog.refreshes == 1
+
+    def test_added_batches_are_registered(self, fake_uow, bloom):
+        """
+        Test that the SKU of a committed batch is known straight away.
+        """
+        catalog = SkuCatalog(lambda: fake_uow, bloom=bloom)
+        catalog.refresh()
+        service = AllocationService(fake_uow, catalog=catalog)
+
+        service.add_batch("batch-002", "BLUE-VASE", 10)
+
+        assert service.allocate("o1", "BLUE-VASE", 5) == "batch-002"
+        assert catalog.size == 2
+
+    def test_batches_added_during_a_refresh_are_kept(self, fake_uow, bloom):
+        """
+        Test that the SKU of a batch committed while the catalog loads is not lost when the loaded SKUs replace it.
+        """
+        catalog = SkuCatalog(lambda: fake_uow, bloom=bloom)
+        catalog.refresh()
+        find_distinct = fake_uow.batches.find_distinct
+
+        def add_while_loading(column):
+            skus = find_distinct(column)
+            catalog.add("BLUE-VASE")
+            return skus
+
+        fake_uow.batches.find_distinct = add_while_loading
+        catalog.refresh()
+
+        assert catalog.might_contain("BLUE-VASE") is True
+        assert catalog.size == 2
+
+    def test_outgrown_bloom_filter_is_rebuilt(self, fake_uow, bloom):
+        """
+        Test that a Bloom filter is rebuilt from the database once more SKUs are registered than it was sized for.
+        """
+        catalog = SkuCatalog(lambda: fake_uow, bloom=bloom)
+        catalog.refresh()
+
+        for sku in ["BLUE-VASE", "RED-CHAIR"]:
+            fake_uow.batches.add(f"batch-{sku}", sku, 10)
+            catalog.add(sku)
+
+        deadline = time.monotonic() + 1
+        while bloom and catalog.refreshes < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert catalog.refreshes == (2 if bloom else 1)
+        assert catalog.size == 3
+        assert all(catalog.might_contain(sku) for sku in ["SMALL-TABLE", "BLUE-VASE", "RED-CHAIR"])
+
+    def test_empty_catalog_means_no_batches(self, bloom):
+        """
+        Test that, when no SKU is known, NoBatchesAvailable is raised instead of InvalidSku.
+        """
+        uow = FakeUoW()
+        catalog = SkuCatalog(lambda: uow, bloom=bloom)
+        service = AllocationService(uow, catalog=catalog)
+
+        with pytest.raises(NoBatchesAvailable):
+            service.allocate("o1", "SMALL-TABLE", 10)
+
+    def test_expired_catalog_is_reloaded(self, fake_uow, bloom):
+        """
+        Test that batches added behind the catalog's back are seen once it expires.
+        """
+        catalog = SkuCatalog(lambda: fake_uow, bloom=bloom, ttl=0.01)
+        catalog.refresh()
+        fake_uow.batches.add("batch-002", "BLUE-VASE", 10)
+
+        assert catalog.might_contain("BLUE-VASE") is False
+
+        time.sleep(0.02)
+        catalog.might_contain("BLUE-VASE")
+
+        deadline = time.monotonic() + 1
+        while catalog.refreshes < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert catalog.might_contain("BLUE-VASE") is True